@@ -0,0 +1,199 @@
+"""
+Bulk payroll adjustments.
+
+Month-end commission and overtime files can hold thousands of lines.
+import_payroll_adjustments checks every line against the payroll's items
+in memory, inserts all the PayrollAdjustment rows in bulk and then adds
+to the running adjustment totals of every affected item, recalculating
+its net pay, in one executemany UPDATE, committing once. A file with any bad line (e.g. an
+employee who is not in the payroll) is rejected as a whole.
+"""
+import codecs
+import csv
+import json
+import math
+from datetime import datetime
+
+from sqlalchemy import bindparam, select, update
+
+from app import db
+from bulk_utils import bulk_insert
+from models import Employee, Payroll, PayrollAdjustment, PayrollItem, ADJUSTMENT_TOTAL_COLUMNS, adjustment_total_amount
+
+# Columns of an import file (CSV header or JSON keys); employee_id is the staff ID, e.g. EMP001
+ADJUSTMENT_IMPORT_COLUMNS = ('employee_id', 'adjustment_type', 'amount', 'description')
+
+# Longest description PayrollAdjustment stores
+MAX_DESCRIPTION_LENGTH = 256
+
+# Errors listed in the message of a rejected file
+MAX_REPORTED_ERRORS = 10
+
+
+def read_adjustment_file(stream, filename):
+    """
+    Read the lines of an adjustment import file.
+
+    CSV files need a header with ADJUSTMENT_IMPORT_COLUMNS. JSON files hold
+    a list of objects with those keys, or an object with the list under
+    'adjustments'.
+
+    Returns:
+        List of dictionaries, one per line
+    """
+    if filename.lower().endswith('.json'):
+        data = json.load(codecs.getreader('utf-8-sig')(stream))
+        if isinstance(data, dict):
+            data = data.get('adjustments')
+        if not isinstance(data, list) or not all(isinstance(line, dict) for line in data):
+            raise ValueError('JSON files must hold a list of adjustments')
+        return data
+
+    if filename.lower().endswith('.csv'):
+        reader = csv.DictReader(codecs.iterdecode(stream, 'utf-8-sig'))
+        missing = [name for name in ADJUSTMENT_IMPORT_COLUMNS if name not in (reader.fieldnames or [])]
+        if missing:
+            raise ValueError(f"Missing columns: {', '.join(missing)}")
+        return list(reader)
+
+    raise ValueError('Only CSV and JSON files can be imported')
+
+
+def check_adjustment_lines(lines, items):
+    """
+    Check import lines against a payroll's items.
+
+    Args:
+        lines: Dictionaries with ADJUSTMENT_IMPORT_COLUMNS
+        items: Dictionary of staff ID -> payroll item id
+
+    Returns:
+        Tuple of (adjustments, errors): adjustment values for each line, with
+        the amount signed as PayrollAdjustment stores it, and a message for
+        each bad line (numbered as in a CSV file, after the header)
+    """
+    adjustments = []
+    errors = []
+    for line_number, line in enumerate(lines, start=2):
+        staff_id = str(line.get('employee_id') or '').strip()
+        adjustment_type = str(line.get('adjustment_type') or '').strip().lower()
+        description = str(line.get('description') or '').strip()
+
+        problems = []
+        if staff_id not in items:
+            problems.append(f'employee {staff_id or "(blank)"} is not in this payroll')
+        if adjustment_type not in ADJUSTMENT_TOTAL_COLUMNS:
+            problems.append(f'unknown adjustment type "{adjustment_type}"')
+        try:
+            amount = float(line.get('amount'))
+            if not math.isfinite(amount):
+                problems.append('amount must be a number')
+            elif amount < 0.01:
+                problems.append('amount must be at least 0.01')
+        except (TypeError, ValueError):
+            problems.append('amount must be a number')
+        if not description:
+            problems.append('description is required')
+        elif len(description) > MAX_DESCRIPTION_LENGTH:
+            problems.append(f'description is longer than {MAX_DESCRIPTION_LENGTH} characters')
+
+        if problems:
+            errors.append(f"Line {line_number}: {'; '.join(problems)}")
+            continue
+
+        adjustments.append({
+            'payroll_item_id': items[staff_id],
+            'adjustment_type': adjustment_type,
+            'description': description,
+            'amount': -amount if adjustment_type == 'deduction' else amount,  # Make deductions negative
+        })
+    return adjustments, errors
+
+
+def import_payroll_adjustments(payroll_id, lines, user_id):
+    """
+    Add many adjustments to a payroll's items at once.
+
+    Every line is checked before anything is written; if any is bad the
+    import is rejected and nothing changes. Otherwise the adjustments are
+    bulk inserted, and each affected item's running totals are added to and
+    its net pay and adjusted flag updated in a single executemany UPDATE,
+    with net pay calculated as PayrollItem.recalculate_net_pay does. The
+    UPDATE adds to the totals in the database rather than writing totals
+    read beforehand, so adjustments made meanwhile are not lost.
+
+    Args:
+        payroll_id: ID of the Active or Processing payroll
+        lines: Dictionaries with ADJUSTMENT_IMPORT_COLUMNS (see read_adjustment_file)
+        user_id: ID of the user importing the adjustments
+
+    Returns:
+        Tuple of (success, message)
+    """
+    payroll = db.session.get(Payroll, payroll_id)
+    if not payroll:
+        return False, "Invalid payroll ID"
+
+    if payroll.status not in ['Active', 'Processing']:
+        return False, "Adjustments can only be made to active or processing payrolls"
+
+    if not lines:
+        return False, "The file has no adjustments"
+
+    items = dict(db.session.execute(
+        select(Employee.employee_id, PayrollItem.id).join(
+            Employee, Employee.id == PayrollItem.employee_id
+        ).where(PayrollItem.payroll_id == payroll.id)
+    ).all())
+
+    adjustments, errors = check_adjustment_lines(lines, items)
+    if errors:
+        message = f"No adjustments were imported: {len(errors)} of {len(lines)} lines have errors. "
+        message += ' '.join(errors[:MAX_REPORTED_ERRORS])
+        if len(errors) > MAX_REPORTED_ERRORS:
+            message += f" (and {len(errors) - MAX_REPORTED_ERRORS} more)"
+        return False, message
+
+    # What the file adds to each affected item's running totals
+    total_columns = list(ADJUSTMENT_TOTAL_COLUMNS.values())
+    added = {}
+    for adjustment in adjustments:
+        item_added = added.setdefault(
+            adjustment['payroll_item_id'], dict(dict.fromkeys(total_columns, 0.0), adjustment_count=0)
+        )
+        column = ADJUSTMENT_TOTAL_COLUMNS[adjustment['adjustment_type']]
+        item_added[column] += adjustment_total_amount(adjustment['adjustment_type'], adjustment['amount'])
+        item_added['adjustment_count'] += 1
+
+    # Bound as add_<column>: SQLAlchemy reserves the column names themselves
+    columns = PayrollItem.__table__.c
+    totals = {
+        column: columns[column] + bindparam(f'add_{column}')
+        for column in ['adjustment_count'] + total_columns
+    }
+    recalculate = update(PayrollItem.__table__).where(columns.id == bindparam('item_id')).values(
+        is_adjusted=True,
+        # Same arithmetic, in the same order, as PayrollItem.recalculate_net_pay, on the new totals
+        net_pay=columns.gross_pay + (totals['bonus_total'] + totals['reimbursement_total']) - (
+            columns.tax_amount + columns.pension_amount + columns.nhf_amount
+            + columns.other_deductions + totals['deduction_adjustment_total']
+        ),
+        **totals
+    )
+    parameters = [
+        {'item_id': item_id, **{f'add_{column}': value for column, value in item_added.items()}}
+        for item_id, item_added in added.items()
+    ]
+
+    try:
+        now = datetime.utcnow()
+        for adjustment in adjustments:
+            adjustment.update(payroll_id=payroll.id, created_by_id=user_id, date_created=now)
+        bulk_insert(PayrollAdjustment, adjustments)
+        db.session.execute(recalculate, parameters)
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        return False, f"Adjustment import failed: {str(e)}"
+
+    return True, f"Imported {len(adjustments)} adjustments for {len(added)} employees"
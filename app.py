@@ -63,6 +63,7 @@ def create_app(config_class=Config):
     from routes.test import test as test_bp
     from routes.payslips import payslips as payslips_bp
     from routes.settings import settings as settings_bp
+    from routes.jobs import jobs as jobs_bp
     
     app.register_blueprint(main_bp)
     app.register_blueprint(auth_bp, url_prefix='/auth')
@@ -73,6 +74,7 @@ def create_app(config_class=Config):
     app.register_blueprint(test_bp, url_prefix='/test')
     app.register_blueprint(payslips_bp, url_prefix='/payslips')
     app.register_blueprint(settings_bp, url_prefix='/settings')
+    app.register_blueprint(jobs_bp, url_prefix='/jobs')
     
     # Add custom Jinja filters
     import json
@@ -119,7 +121,7 @@ with app.app_context():
     from models import (
         User, Employee, Payroll, PayrollItem, TaxBracket, AllowanceType, 
         DeductionType, SalaryConfiguration, PayrollAdjustment, Payslip, EmailLog,
-        CompanySettings
+        CompanySettings, Job, BackPay, YearToDate
     )
     
     # Create all tables
@@ -130,7 +132,8 @@ with app.app_context():
     login_manager.user_loader(load_user)
     
     # Create default salary configuration if none exists
-    if not SalaryConfiguration.query.first():
+    # (only the id is read, so startup works before migrations add new columns)
+    if not db.session.query(SalaryConfiguration.id).first():
         # Find an admin user to be the creator
         admin_user = User.query.filter_by(is_admin=True).first()
         
@@ -0,0 +1,30 @@
+"""
+Apply compensation changes that have taken effect.
+
+Future-dated raises only reach Employee.basic_salary once this runs on or
+after their effective date. Schedule it daily, e.g. from cron:
+
+    5 0 * * * cd /path/to/app && python apply_compensation_changes.py
+"""
+import argparse
+from datetime import datetime
+
+from app import app
+from compensation import apply_due_compensation_changes
+
+
+def apply_changes(as_of=None):
+    """Apply the compensation changes effective by `as_of` (default today)."""
+    with app.app_context():
+        success, message = apply_due_compensation_changes(as_of)
+        print(message)
+        return success
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Apply compensation changes that have taken effect.")
+    parser.add_argument('--date', type=lambda value: datetime.strptime(value, '%Y-%m-%d').date(),
+                        help="apply changes effective on or before this date (YYYY-MM-DD, default today)")
+    args = parser.parse_args()
+
+    raise SystemExit(0 if apply_changes(args.date) else 1)
@@ -0,0 +1,355 @@
+"""
+Retroactive back pay.
+
+When a compensation change is recorded after the payrolls it applies to
+were paid (e.g. a raise backdated three months), those periods were paid
+at the old salary. calculate_back_pay recalculates every affected past
+payroll item in memory at the salaries it was paid and at the salaries now
+recorded, for all periods and employees in vectorized batches, and
+post_back_pay posts the differences in gross pay, PAYE, pension
+and NHF as adjustments on the current payroll. What was posted for each
+period is recorded as BackPay rows, so running it again only posts what
+is still owed.
+"""
+from collections import namedtuple
+from datetime import datetime
+from itertools import groupby
+
+import numpy as np
+from sqlalchemy import func, select
+
+from app import db
+from bulk_utils import bulk_insert, bulk_update
+from compensation import resolve_pay_segments, salary_changes
+from models import (
+    BackPay, CompensationHistory, Employee, Payroll, PayrollAdjustment, PayrollItem, SalaryConfiguration,
+    ADJUSTMENT_TOTAL_COLUMNS, adjustment_total_amount
+)
+from payroll_engine import combine_batch_segments, compute_payroll_batch, prorate_batch, salary_percentages
+from utils import get_tax_table
+
+# Payroll statuses whose items have been paid
+PAID_STATUSES = ('Completed', 'Closed')
+
+# PayrollItem amounts compared, with the batch component each is recalculated as
+BACK_PAY_COMPONENTS = (
+    ('basic_salary', 'monthly_basic'),
+    ('gross_pay', 'monthly_gross'),
+    ('tax_amount', 'monthly_tax'),
+    ('pension_amount', 'monthly_pension'),
+    ('nhf_amount', 'monthly_nhf'),
+)
+
+# Differences recorded for each period (net pay follows from the others)
+BACK_PAY_AMOUNTS = tuple(name for name, _ in BACK_PAY_COMPONENTS) + ('net_pay',)
+
+# Differences below half a kobo are rounding, not back pay
+MINIMUM_DIFFERENCE = 0.005
+
+# Statutory differences posted as their own adjustments
+STATUTORY_ADJUSTMENTS = (
+    ('tax_amount', 'PAYE'),
+    ('pension_amount', 'pension'),
+    ('nhf_amount', 'NHF'),
+)
+
+# Employee inputs for recalculating a past period
+PastEmployee = namedtuple('PastEmployee', 'id basic_salary date_hired date_terminated')
+
+
+def calculate_back_pay(payroll):
+    """
+    Work out the back pay owed for paid payrolls before a payroll's period.
+
+    An item is recalculated when a compensation change effective by the end
+    of its period was recorded after the item was calculated. It is
+    recalculated twice, with the same salary configuration and tax table:
+    at the salaries it was paid, from the compensation history as it stood
+    when the item was calculated, and at the salaries from the history as it
+    is now. The back pay is the difference, so changes to the configuration
+    or tax brackets since the period was paid are not taken for arrears.
+    PAYE is annualised on both sides, whichever PAYE method is configured.
+    Anything already posted as back pay for the period is taken off.
+
+    Args:
+        payroll: Payroll the back pay would be posted to
+
+    Returns:
+        List of dictionaries, one per employee owed back pay, with the total
+        differences (BACK_PAY_AMOUNTS) and a 'periods' list of the
+        differences for each past payroll
+    """
+    recorded_after_payment = select(CompensationHistory.id).where(
+        CompensationHistory.employee_id == PayrollItem.employee_id,
+        CompensationHistory.effective_date <= Payroll.period_end,
+        CompensationHistory.date_created > PayrollItem.date_updated
+    ).exists()
+
+    items = db.session.execute(
+        select(
+            PayrollItem.payroll_id, PayrollItem.employee_id, PayrollItem.date_updated,
+            PayrollItem.basic_salary, PayrollItem.proration_factor,
+            Payroll.name, Payroll.period_start, Payroll.period_end,
+            Employee.basic_salary.label('employee_basic_salary'), Employee.is_contract,
+            Employee.date_hired, Employee.date_terminated
+        ).join(
+            Payroll, Payroll.id == PayrollItem.payroll_id
+        ).join(
+            Employee, Employee.id == PayrollItem.employee_id
+        ).where(
+            Payroll.status.in_(PAID_STATUSES),
+            Payroll.period_end < payroll.period_start,
+            recorded_after_payment
+        ).order_by(Payroll.period_start, PayrollItem.payroll_id, PayrollItem.employee_id)
+    ).all()
+    if not items:
+        return []
+
+    # The whole history of the employees concerned, in one query
+    history = {}
+    for row in db.session.execute(
+        select(
+            CompensationHistory.employee_id, CompensationHistory.effective_date,
+            CompensationHistory.basic_salary, CompensationHistory.date_created
+        ).where(
+            CompensationHistory.employee_id.in_({item.employee_id for item in items}),
+            CompensationHistory.effective_date <= max(item.period_end for item in items)
+        ).order_by(CompensationHistory.employee_id, CompensationHistory.effective_date, CompensationHistory.id)
+    ):
+        history.setdefault(row.employee_id, []).append(row)
+
+    # Salary segments of every item as paid and as now recorded
+    paid_segments = []
+    current_segments = []
+    for _, period_items in groupby(items, key=lambda item: item.payroll_id):
+        period_items = list(period_items)
+        period = (period_items[0].period_start, period_items[0].period_end)
+        employees = [
+            PastEmployee(item.employee_id, paid_basic_salary(item), item.date_hired, item.date_terminated)
+            for item in period_items
+        ]
+        paid_changes = {}
+        current_changes = {}
+        for item in period_items:
+            rows = [row for row in history.get(item.employee_id, ()) if row.effective_date <= period[1]]
+            paid_changes[item.employee_id] = salary_changes(
+                (row.effective_date, row.basic_salary) for row in rows if row.date_created <= item.date_updated
+            )
+            current_changes[item.employee_id] = salary_changes((row.effective_date, row.basic_salary) for row in rows)
+        paid_segments.extend(resolve_pay_segments(employees, period, paid_changes)[0])
+        current_segments.extend(resolve_pay_segments(employees, period, current_changes)[0])
+
+    # Both recalculated with the current configuration and tax table
+    salary_config = SalaryConfiguration.query.filter_by(is_active=True).first()
+    percentages = salary_percentages(salary_config)
+    tax_table = get_tax_table(refresh=True)
+    paid = recalculate_items(items, paid_segments, percentages, tax_table)
+    current = recalculate_items(items, current_segments, percentages, tax_table)
+
+    differences = {name: current[component] - paid[component] for name, component in BACK_PAY_COMPONENTS}
+
+    # Less back pay already posted for the same periods
+    posted = {
+        (row.payroll_id, row.employee_id): row[2:]
+        for row in db.session.execute(
+            select(
+                BackPay.payroll_id, BackPay.employee_id,
+                *[func.sum(getattr(BackPay, name)) for name, _ in BACK_PAY_COMPONENTS]
+            ).where(
+                BackPay.payroll_id.in_({item.payroll_id for item in items})
+            ).group_by(BackPay.payroll_id, BackPay.employee_id)
+        )
+    }
+    if posted:
+        for index, item in enumerate(items):
+            amounts = posted.get((item.payroll_id, item.employee_id))
+            if amounts is not None:
+                for (name, _), amount in zip(BACK_PAY_COMPONENTS, amounts):
+                    differences[name][index] -= amount
+
+    differences['net_pay'] = (
+        differences['gross_pay'] - differences['tax_amount'] - differences['pension_amount'] - differences['nhf_amount']
+    )
+
+    owed = np.zeros(len(items), dtype=bool)
+    for values in differences.values():
+        owed |= np.abs(values) >= MINIMUM_DIFFERENCE
+
+    arrears = {}
+    for index in np.flatnonzero(owed).tolist():
+        item = items[index]
+        employee = arrears.setdefault(item.employee_id, dict(
+            dict.fromkeys(BACK_PAY_AMOUNTS, 0.0), employee_id=item.employee_id, periods=[]
+        ))
+        period = {
+            'payroll_id': item.payroll_id,
+            'name': item.name,
+            'period_start': item.period_start,
+            'period_end': item.period_end,
+        }
+        for name in BACK_PAY_AMOUNTS:
+            period[name] = float(differences[name][index])
+            employee[name] += period[name]
+        employee['periods'].append(period)
+
+    return [arrears[employee_id] for employee_id in sorted(arrears)]
+
+
+def recalculate_items(items, segments, percentages, tax_table):
+    """
+    Calculate past items from their salary segments in one batch.
+
+    Returns:
+        Batch of the monthly components with one entry per item
+    """
+    batch = compute_payroll_batch(
+        [salary for pieces in segments for salary, _ in pieces],
+        [item.is_contract for item, pieces in zip(items, segments) for _ in pieces],
+        percentages,
+        tax_table
+    )
+    offsets = np.cumsum([0] + [len(pieces) for pieces in segments[:-1]])
+    return combine_batch_segments(
+        prorate_batch(batch, [factor for pieces in segments for _, factor in pieces]), offsets
+    )
+
+
+def paid_basic_salary(item):
+    """
+    Get the salary a past item was paid at, for an employee with no history in force at the start of its period.
+
+    Exact for items paid at one salary. Employees have their starting
+    salary in the history (see compensation.initial_compensation), so it is
+    only needed for history recorded before that.
+    """
+    if item.proration_factor:
+        return item.basic_salary / item.proration_factor
+    return item.employee_basic_salary
+
+
+def back_pay_adjustments(arrears, label):
+    """
+    Build the PayrollAdjustment values for an employee's back pay.
+
+    The salary difference is a bonus (or a deduction when pay went down);
+    extra PAYE, pension and NHF are deductions, and overpaid ones are
+    refunded as reimbursements. Amounts are signed as PayrollAdjustment
+    expects: positive for additions, negative for deductions.
+    """
+    adjustments = []
+    if abs(arrears['gross_pay']) >= MINIMUM_DIFFERENCE:
+        adjustments.append({
+            'adjustment_type': 'bonus' if arrears['gross_pay'] > 0 else 'deduction',
+            'description': f'Back pay: salary arrears for {label}',
+            'amount': arrears['gross_pay'],
+        })
+    for name, description in STATUTORY_ADJUSTMENTS:
+        if abs(arrears[name]) >= MINIMUM_DIFFERENCE:
+            adjustments.append({
+                'adjustment_type': 'deduction' if arrears[name] > 0 else 'reimbursement',
+                'description': f'Back pay: {description} on arrears for {label}',
+                'amount': -arrears[name],
+            })
+    return adjustments
+
+
+def back_pay_period_label(periods):
+    """Describe the periods back pay covers, e.g. 'Jan 2025' or 'Jan 2025 - Mar 2025'."""
+    first = periods[0]['period_start'].strftime('%b %Y')
+    last = periods[-1]['period_start'].strftime('%b %Y')
+    return first if first == last else f'{first} - {last}'
+
+
+def post_back_pay(payroll_id, user_id):
+    """
+    Post the back pay owed for earlier periods as adjustments on a payroll.
+
+    Each employee owed back pay gets adjustments on their item in the payroll
+    (see back_pay_adjustments) and their net pay is updated; employees
+    without an item in the payroll are left for a later payroll. Everything
+    is written in one transaction.
+
+    Args:
+        payroll_id: ID of the Active or Processing payroll to post to
+        user_id: ID of the user posting the back pay
+
+    Returns:
+        Tuple of (success, message)
+    """
+    payroll = db.session.get(Payroll, payroll_id)
+    if not payroll:
+        return False, "Invalid payroll ID"
+
+    if payroll.status not in ['Active', 'Processing']:
+        return False, "Back pay can only be posted to active or processing payrolls"
+
+    try:
+        arrears = calculate_back_pay(payroll)
+        if not arrears:
+            return True, "No back pay is owed"
+
+        current_items = {
+            item.employee_id: item for item in db.session.execute(
+                select(
+                    PayrollItem.id, PayrollItem.employee_id, PayrollItem.net_pay, PayrollItem.adjustment_count,
+                    *[getattr(PayrollItem, column) for column in ADJUSTMENT_TOTAL_COLUMNS.values()]
+                ).where(
+                    PayrollItem.payroll_id == payroll.id
+                )
+            )
+        }
+
+        now = datetime.utcnow()
+        adjustments = []
+        item_updates = []
+        back_pay = []
+        periods = set()
+        skipped = 0
+        for employee in arrears:
+            item = current_items.get(employee['employee_id'])
+            if item is None:
+                skipped += 1
+                continue
+
+            rows = back_pay_adjustments(employee, back_pay_period_label(employee['periods']))
+            for row in rows:
+                row.update(payroll_id=payroll.id, payroll_item_id=item.id, created_by_id=user_id, date_created=now)
+            adjustments.extend(rows)
+            
+            # Keep the item's running adjustment totals in step
+            totals = {column: getattr(item, column) for column in ADJUSTMENT_TOTAL_COLUMNS.values()}
+            for row in rows:
+                totals[ADJUSTMENT_TOTAL_COLUMNS[row['adjustment_type']]] += adjustment_total_amount(
+                    row['adjustment_type'], row['amount']
+                )
+            item_updates.append({
+                'id': item.id,
+                'net_pay': item.net_pay + sum(row['amount'] for row in rows),
+                'is_adjusted': True,
+                'adjustment_count': item.adjustment_count + len(rows),
+                **totals,
+            })
+
+            for period in employee['periods']:
+                periods.add(period['payroll_id'])
+                back_pay.append({
+                    'employee_id': employee['employee_id'],
+                    'payroll_id': period['payroll_id'],
+                    'posted_payroll_id': payroll.id,
+                    **{name: period[name] for name in BACK_PAY_AMOUNTS},
+                    'created_by_id': user_id,
+                    'date_created': now,
+                })
+
+        bulk_insert(PayrollAdjustment, adjustments)
+        bulk_update(PayrollItem, item_updates)
+        bulk_insert(BackPay, back_pay)
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        return False, f"Back pay calculation failed: {str(e)}"
+
+    message = f"Posted back pay for {len(item_updates)} employees covering {len(periods)} earlier payrolls"
+    if skipped:
+        message += f"; {skipped} employees owed back pay are not in this payroll"
+    return True, message
@@ -0,0 +1,126 @@
+"""
+Bulk write helpers.
+
+Load many rows into a table with a handful of statements instead of one
+INSERT per ORM object: PostgreSQL gets COPY, other databases get batched
+executemany inserts. Rows are plain dictionaries keyed by column name and
+are written inside the current session transaction.
+"""
+import csv
+import io
+import json
+from datetime import date, datetime
+
+from sqlalchemy import insert, update, delete
+
+from app import db
+
+DEFAULT_BATCH_SIZE = 1000
+
+# NULL marker for COPY ... FORMAT csv
+COPY_NULL = '\\N'
+
+
+def bulk_insert(model, rows, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Insert rows for a model in bulk.
+
+    Args:
+        model: The model class to insert into
+        rows: List of dictionaries, all with the same keys
+        batch_size: Number of rows sent per statement
+
+    Returns:
+        Number of rows inserted
+    """
+    if not rows:
+        return 0
+
+    table = model.__table__
+    if db.session.get_bind().dialect.name == 'postgresql':
+        for start in range(0, len(rows), batch_size):
+            copy_rows(table, rows[start:start + batch_size])
+    else:
+        for start in range(0, len(rows), batch_size):
+            db.session.execute(insert(table), rows[start:start + batch_size])
+
+    return len(rows)
+
+
+def bulk_update(model, rows, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Update rows by primary key in batches.
+
+    Each row is a dictionary holding the primary key ('id') and the columns to set.
+    """
+    for start in range(0, len(rows), batch_size):
+        db.session.execute(update(model), rows[start:start + batch_size])
+    return len(rows)
+
+
+def bulk_delete(model, *criteria):
+    """Delete every row matching the criteria with a single DELETE statement."""
+    result = db.session.execute(
+        delete(model).where(*criteria).execution_options(synchronize_session=False)
+    )
+    return result.rowcount
+
+
+def copy_rows(table, rows):
+    """Stream rows into a PostgreSQL table with COPY FROM STDIN."""
+    rows = with_column_defaults(table, rows)
+    columns = list(rows[0].keys())
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        writer.writerow([copy_value(row[name]) for name in columns])
+    buffer.seek(0)
+
+    preparer = db.session.get_bind().dialect.identifier_preparer
+    statement = "COPY {} ({}) FROM STDIN WITH (FORMAT csv, NULL '{}')".format(
+        preparer.format_table(table),
+        ', '.join(preparer.quote(name) for name in columns),
+        COPY_NULL
+    )
+
+    # Use the session's own connection so COPY joins the current transaction
+    cursor = db.session.connection().connection.cursor()
+    try:
+        cursor.copy_expert(statement, buffer)
+    finally:
+        cursor.close()
+
+
+def with_column_defaults(table, rows):
+    """
+    Fill in Python-side column defaults that COPY would otherwise skip.
+
+    Scalar and callable defaults are evaluated once for the whole batch.
+    """
+    missing = {}
+    for column in table.columns:
+        if column.name in rows[0] or column.default is None or column.primary_key:
+            continue
+        default = column.default
+        if default.is_callable:
+            missing[column.name] = default.arg(None)
+        elif default.is_scalar:
+            missing[column.name] = default.arg
+
+    if not missing:
+        return rows
+    return [{**row, **missing} for row in rows]
+
+
+def copy_value(value):
+    """Render a Python value as a COPY csv field."""
+    if value is None:
+        return COPY_NULL
+    if isinstance(value, bool):
+        return 't' if value else 'f'
+    if isinstance(value, (dict, list)):
+        return json.dumps(value)
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return value
@@ -0,0 +1,249 @@
+"""
+Effective-dated compensation.
+
+A CompensationHistory row sets an employee's basic salary from its
+effective date onwards. Payroll resolves the salary in force during a pay
+period from the history rather than from Employee.basic_salary, so
+future-dated changes take effect in the right period. When a change lands
+mid-period the employee is paid each salary for the working days it was in
+force. The salary before a change is that of the history row before it,
+so every employee gets a row for their starting salary, effective from
+their hire date, when they are created or before their first change is
+recorded (initial_compensation, ensure_compensation_history). Employees
+without history for the period are paid their Employee.basic_salary.
+
+Employee.basic_salary itself follows the history through
+apply_due_compensation_changes, which is run daily (see
+apply_compensation_changes.py) to apply changes once they take effect.
+"""
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import func, or_, select, update
+
+from app import db
+from models import CompensationHistory, Employee
+from proration import proration_factors
+
+
+def initial_compensation(employee, user_id, before=None):
+    """
+    Build the history row for the salary an employee has had since they were hired.
+
+    Args:
+        employee: The employee, with an id and their starting basic_salary
+        user_id: ID of the user recording it
+        before: Date of a change about to be recorded; the row takes effect
+            no later than it, so the change still follows it
+
+    Returns:
+        A CompensationHistory, not yet added to the session
+    """
+    effective_date = employee.date_hired if before is None else min(employee.date_hired, before)
+    return CompensationHistory(
+        employee_id=employee.id,
+        effective_date=effective_date,
+        basic_salary=employee.basic_salary,
+        changed_by_id=user_id,
+        change_reason="Starting salary",
+        date_applied=datetime.utcnow()
+    )
+
+
+def ensure_compensation_history(employee, user_id, before=None):
+    """
+    Record an employee's current salary as their starting salary if they have no compensation history.
+
+    Call before recording a change and before Employee.basic_salary is
+    overwritten, so the salary paid up to the change is kept.
+    """
+    if db.session.query(CompensationHistory.id).filter_by(employee_id=employee.id).first() is None:
+        db.session.add(initial_compensation(employee, user_id, before))
+
+
+def load_salary_changes(first_id, last_id, period_start, period_end):
+    """
+    Load the history rows in force during a period for a range of employees.
+
+    One query for the whole range: a LEAD() window gives each row the date
+    the next change takes effect, so only the row in force on the first day
+    of the period and rows taking effect during it are returned. It is
+    served by the (employee_id, effective_date) index.
+
+    Returns:
+        Dictionary of employee id -> list of (effective date, basic salary),
+        oldest first; of several changes on one date only the latest is kept
+    """
+    history = CompensationHistory.__table__
+    next_effective_date = func.lead(history.c.effective_date).over(
+        partition_by=history.c.employee_id,
+        order_by=(history.c.effective_date, history.c.id)
+    )
+    windowed = select(
+        history.c.id, history.c.employee_id, history.c.effective_date, history.c.basic_salary,
+        next_effective_date.label('next_effective_date')
+    ).where(
+        history.c.employee_id.between(first_id, last_id),
+        history.c.effective_date <= period_end
+    ).subquery()
+
+    statement = select(
+        windowed.c.employee_id, windowed.c.effective_date, windowed.c.basic_salary
+    ).where(
+        or_(windowed.c.next_effective_date.is_(None), windowed.c.next_effective_date > period_start)
+    ).order_by(windowed.c.employee_id, windowed.c.effective_date, windowed.c.id)
+
+    changes = {}
+    for row in db.session.execute(statement):
+        by_date = changes.setdefault(row.employee_id, {})
+        by_date[row.effective_date] = row.basic_salary
+    return {employee_id: list(by_date.items()) for employee_id, by_date in changes.items()}
+
+
+def salary_spans(basic_salary, changes, period_start, period_end):
+    """
+    Split a period into spans of constant salary.
+
+    Args:
+        basic_salary: Salary to use before the first change, when no history
+            row is in force at the start of the period
+        changes: (effective date, basic salary) pairs, oldest first
+        period_start: First day of the period
+        period_end: Last day of the period
+
+    Returns:
+        List of (first day, last day, basic salary) covering the period
+    """
+    spans = [[period_start, period_end, basic_salary]]
+    for effective_date, salary in changes:
+        if effective_date <= period_start:
+            spans[0][2] = salary
+        elif salary != spans[-1][2]:
+            spans[-1][1] = effective_date - timedelta(days=1)
+            spans.append([effective_date, period_end, salary])
+    return [tuple(span) for span in spans]
+
+
+def resolve_pay_segments(employees, period, changes=None):
+    """
+    Work out the salary each employee is paid at during a period, and for how much of it.
+
+    Args:
+        employees: Id-ordered rows with id, basic_salary, date_hired and date_terminated
+        period: (first day, last day) of the pay period
+        changes: Dictionary of employee id -> (effective date, basic salary)
+            pairs, oldest first, to use instead of the stored history (see
+            load_salary_changes)
+
+    Returns:
+        Tuple of (segments, employment_factors). segments[i] lists the
+        (basic salary, factor) pairs employee i is paid at, the factor being
+        the share of the period's working days worked at that salary; it has
+        a single pair unless the salary changed during the period.
+        employment_factors[i] is the share of the period employee i was
+        employed for, as stored on PayrollItem.proration_factor.
+    """
+    period_start, period_end = period
+    if not employees:
+        return [], []
+
+    if changes is None:
+        changes = load_salary_changes(employees[0].id, employees[-1].id, period_start, period_end)
+
+    owners = []
+    salaries = []
+    starts = []
+    ends = []
+    for index, employee in enumerate(employees):
+        for first_day, last_day, salary in salary_spans(
+            employee.basic_salary, changes.get(employee.id, ()), period_start, period_end
+        ):
+            owners.append(index)
+            salaries.append(salary)
+            starts.append(max(first_day, employee.date_hired) if employee.date_hired else first_day)
+            ends.append(min(last_day, employee.date_terminated) if employee.date_terminated else last_day)
+
+    factors = proration_factors(starts, ends, period_start, period_end).tolist()
+    employment_factors = proration_factors(
+        [employee.date_hired for employee in employees],
+        [employee.date_terminated for employee in employees],
+        period_start,
+        period_end
+    ).tolist()
+
+    segments = [[] for _ in employees]
+    for index, salary, factor in zip(owners, salaries, factors):
+        segments[index].append((salary, factor))
+
+    # Drop spans the employee did not work, keeping at least one per employee
+    return [
+        [segment for segment in pieces if segment[1]] or pieces[-1:]
+        for pieces in segments
+    ], employment_factors
+
+
+def salary_changes(rows):
+    """
+    Turn history rows into the (effective date, basic salary) pairs salary_spans takes.
+
+    Args:
+        rows: (effective date, basic salary) of one employee's history rows,
+            ordered by effective date and id
+
+    Returns:
+        List of pairs, oldest first; of several changes on one date only the
+        latest is kept, as load_salary_changes does
+    """
+    return list(dict(rows).items())
+
+
+def apply_due_compensation_changes(as_of=None):
+    """
+    Copy compensation changes that have taken effect onto Employee.basic_salary.
+
+    Every employee with a change effective on or before `as_of` that has not
+    been applied yet gets the salary of their latest effective change, in one
+    UPDATE for all employees; the changes are then marked as applied in a
+    second one, in the same transaction.
+
+    Args:
+        as_of: Date the changes must have taken effect by (default today)
+
+    Returns:
+        Tuple of (success, message)
+    """
+    as_of = as_of or date.today()
+    history = CompensationHistory.__table__
+    employee = Employee.__table__
+
+    # Only apply the changes that exist now, so rows added meanwhile wait for the next run
+    last_id = db.session.execute(select(func.max(history.c.id))).scalar()
+    if last_id is None:
+        return True, "No compensation changes to apply"
+
+    due = (
+        history.c.id <= last_id,
+        history.c.effective_date <= as_of,
+        history.c.date_applied.is_(None)
+    )
+
+    in_force = select(history.c.basic_salary).where(
+        history.c.employee_id == employee.c.id,
+        history.c.id <= last_id,
+        history.c.effective_date <= as_of
+    ).order_by(history.c.effective_date.desc(), history.c.id.desc()).limit(1).scalar_subquery()
+
+    try:
+        employees_updated = db.session.execute(
+            update(employee)
+            .where(employee.c.id.in_(select(history.c.employee_id).where(*due)))
+            .values(basic_salary=in_force, date_updated=datetime.utcnow())
+        ).rowcount
+        changes_applied = db.session.execute(
+            update(history).where(*due).values(date_applied=datetime.utcnow())
+        ).rowcount
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        return False, f"Applying compensation changes failed: {str(e)}"
+
+    return True, f"Applied {changes_applied} compensation changes to {employees_updated} employees"
@@ -11,6 +11,22 @@ class Config:
     }
     DEBUG = True
     
+    # Payroll processing: number of worker processes and how employees are split
+    PAYROLL_SHARDS = int(os.environ.get('PAYROLL_SHARDS', 1))
+    PAYROLL_SHARD_BY = os.environ.get('PAYROLL_SHARD_BY', 'id')  # 'id' or 'department'
+    PAYROLL_CHUNK_SIZE = int(os.environ.get('PAYROLL_CHUNK_SIZE', 2000))  # Employees calculated per chunk
+    PAYSLIP_WORKERS = int(os.environ.get('PAYSLIP_WORKERS', 1))  # Processes rendering payslip PDFs
+    
+    # Where payslip PDFs are kept: a PAYSLIP_STORES backend and its location
+    # (default the instance folder's payslips directory)
+    PAYSLIP_STORAGE = os.environ.get('PAYSLIP_STORAGE', 'local')
+    PAYSLIP_STORAGE_PATH = os.environ.get('PAYSLIP_STORAGE_PATH')
+    
+    # Run payroll processing, payslip generation and emailing in worker.py
+    # (set to false to run them inside the request where no worker is deployed)
+    BACKGROUND_JOBS = os.environ.get('BACKGROUND_JOBS', 'true').lower() in ['true', 'on', '1']
+    JOB_STALE_MINUTES = int(os.environ.get('JOB_STALE_MINUTES', 30))  # Running jobs silent this long have died
+    
     # Flask-Mail configuration
     MAIL_SERVER = os.environ.get('MAIL_SERVER', 'smtp.gmail.com')
     MAIL_PORT = int(os.environ.get('MAIL_PORT', 587))
@@ -6,6 +6,7 @@ from threading import Thread
 
 from app import db, mail
 from models import Payslip, EmailLog, Employee, PayrollItem
+from payslip_storage import read_payslip_pdf
 
 def send_async_email(app, msg):
     """Send email asynchronously."""
@@ -244,7 +245,7 @@ def send_payslip_email(payslip_id, payroll_id=None):
     )
     
     # Create attachment
-    attachments = [(payslip.filename, 'application/pdf', payslip.pdf_data)]
+    attachments = [(payslip.filename, 'application/pdf', read_payslip_pdf(payslip))]
     
     # Send the email and get the server response
     success, server_response = send_email(
@@ -299,12 +300,13 @@ def send_payslip_email(payslip_id, payroll_id=None):
         
         return False, f"Failed to send email: {server_response}"
 
-def send_all_payslips(payroll_id):
+def send_all_payslips(payroll_id, progress=None):
     """
     Send payslips to all employees in a payroll run.
     
     Args:
         payroll_id: ID of the payroll to send payslips for
+        progress: Optional callable(completed, total) called after each payslip
         
     Returns:
         A tuple of (success, message, sent_count, failed_count)
@@ -319,12 +321,14 @@ def send_all_payslips(payroll_id):
     sent_count = 0
     failed_count = 0
     
-    for payslip in payslips:
+    for index, payslip in enumerate(payslips, 1):
         success, _ = send_payslip_email(payslip.id, payroll_id)
         if success:
             sent_count += 1
         else:
             failed_count += 1
+        if progress:
+            progress(index, len(payslips))
     
     # Update existing email logs for this payroll run to ensure they have the payroll_id
     from models import EmailLog
@@ -71,6 +71,7 @@ class EmployeeForm(FlaskForm):
     department = StringField('Department', validators=[DataRequired(), Length(max=64)])
     position = StringField('Position', validators=[DataRequired(), Length(max=64)])
     date_hired = DateField('Date Hired', validators=[DataRequired()])
+    date_terminated = DateField('Date Terminated', validators=[Optional()])
     employment_status = SelectField('Employment Status', choices=[
         ('Active', 'Active'),
         ('On Leave', 'On Leave'),
@@ -217,6 +218,10 @@ class SalaryConfigurationForm(FlaskForm):
     utility_allowance_percentage = FloatField('Utility Allowance (%)', validators=[DataRequired(), NumberRange(min=0, max=100)])
     meal_allowance_percentage = FloatField('Meal Allowance (%)', validators=[DataRequired(), NumberRange(min=0, max=100)])
     clothing_allowance_percentage = FloatField('Clothing Allowance (%)', validators=[DataRequired(), NumberRange(min=0, max=100)])
+    paye_method = SelectField('PAYE Method', choices=[
+        ('annualised', 'Annualised (each month on its own)'),
+        ('cumulative', 'Cumulative (year to date)')
+    ], default='annualised', validators=[DataRequired()])
     submit = SubmitField('Save Configuration')
     
     def validate(self, extra_validators=None):
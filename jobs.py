@@ -0,0 +1,292 @@
+"""
+Background jobs.
+
+Long-running work (processing a payroll, posting back pay, generating or
+emailing its payslips) is queued as a Job row and run by worker.py outside the web
+process, so requests return at once. Handlers report progress as they go
+and the payroll page polls /jobs/<id>/status to show it. A job whose worker
+dies stops reporting progress and is failed (fail_stale_jobs), so it does
+not block its payroll for good.
+"""
+import logging
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import func, select, update
+
+from app import db
+from models import Job
+
+logger = logging.getLogger(__name__)
+
+# Job type -> handler(job, progress) returning (success, message)
+JOB_HANDLERS = {}
+
+
+def job_handler(job_type):
+    """Register a function as the handler for a job type."""
+    def register(handler):
+        JOB_HANDLERS[job_type] = handler
+        return handler
+    return register
+
+
+def submit_job(job_type, user_id, payroll_id=None, **params):
+    """
+    Queue a job for the worker.
+
+    When BACKGROUND_JOBS is disabled the job is run straight away in the
+    current request instead, for deployments without a worker.
+
+    Args:
+        job_type: One of the registered job types
+        user_id: ID of the user starting the job
+        payroll_id: ID of the payroll the job works on
+        **params: Extra handler options, stored on the job as JSON
+
+    Returns:
+        The Job
+    """
+    if job_type not in JOB_HANDLERS:
+        raise ValueError(f"Unknown job type: {job_type}")
+
+    job = Job(
+        job_type=job_type,
+        status='Queued',
+        payroll_id=payroll_id,
+        params=params or None,
+        created_by_id=user_id
+    )
+    db.session.add(job)
+    db.session.commit()
+
+    if not current_app.config.get('BACKGROUND_JOBS', True):
+        claimed = claim_job(job.id)
+        if claimed:
+            run_job(claimed)
+
+    return job
+
+
+def get_active_job(payroll_id, job_type=None):
+    """Get the queued or running job for a payroll, if there is one."""
+    fail_stale_jobs()
+    query = Job.query.filter(
+        Job.payroll_id == payroll_id,
+        Job.status.in_(['Queued', 'Running'])
+    )
+    if job_type:
+        query = query.filter(Job.job_type == job_type)
+    return query.order_by(Job.id).first()
+
+
+def get_latest_job(payroll_id):
+    """Get the most recently submitted job for a payroll, if any."""
+    return Job.query.filter_by(payroll_id=payroll_id).order_by(Job.id.desc()).first()
+
+
+def claim_job(job_id):
+    """
+    Move a queued job to Running.
+
+    The conditional UPDATE lets several workers poll the same table: only
+    one of them sees its update match the row.
+
+    Returns:
+        The Job, or None if another worker claimed it first
+    """
+    result = db.session.execute(
+        update(Job)
+        .where(Job.id == job_id, Job.status == 'Queued')
+        .values(status='Running', date_started=datetime.utcnow(), date_heartbeat=datetime.utcnow())
+        .execution_options(synchronize_session=False)
+    )
+    db.session.commit()
+
+    if result.rowcount != 1:
+        return None
+    job = db.session.get(Job, job_id)
+    db.session.refresh(job)
+    return job
+
+
+def claim_next_job():
+    """Claim the oldest queued job, or return None when the queue is empty."""
+    fail_stale_jobs()
+    while True:
+        job_id = db.session.execute(
+            select(Job.id).where(Job.status == 'Queued').order_by(Job.id).limit(1)
+        ).scalar()
+        db.session.commit()
+
+        if job_id is None:
+            return None
+        job = claim_job(job_id)
+        if job:
+            return job
+
+
+def fail_stale_jobs():
+    """
+    Mark Running jobs that have stopped showing signs of life as Failed.
+
+    A worker or request killed part way through a job leaves it Running,
+    which would block its payroll for good. Running jobs record a heartbeat
+    when they are claimed and whenever they report progress; one that has
+    gone JOB_STALE_MINUTES without a heartbeat is taken to have died.
+
+    Returns:
+        The number of jobs marked Failed
+    """
+    cutoff = datetime.utcnow() - timedelta(minutes=current_app.config.get('JOB_STALE_MINUTES', 30))
+    # Jobs claimed before heartbeats were recorded have only date_started
+    stale = [Job.status == 'Running', func.coalesce(Job.date_heartbeat, Job.date_started) < cutoff]
+
+    # Look first, so the usual case takes no write lock
+    if db.session.execute(select(Job.id).where(*stale).limit(1)).scalar() is None:
+        return 0
+
+    result = db.session.execute(
+        update(Job)
+        .where(*stale)
+        .values(
+            status='Failed',
+            message='The job stopped reporting progress, so its worker was probably stopped. Start it again.',
+            date_finished=datetime.utcnow()
+        )
+        .execution_options(synchronize_session=False)
+    )
+    db.session.commit()
+    logger.warning("Marked %s stale jobs as failed", result.rowcount)
+    return result.rowcount
+
+
+def run_job(job):
+    """
+    Run a claimed job to completion, recording its outcome.
+
+    Errors are caught and stored on the job so one bad job cannot stop the worker.
+    """
+    job_id = job.id
+    handler = JOB_HANDLERS.get(job.job_type)
+
+    def progress(current, total):
+        report_progress(job_id, current, total)
+
+    try:
+        if handler is None:
+            raise ValueError(f"Unknown job type: {job.job_type}")
+        success, message = handler(job, progress)
+    except Exception as e:
+        db.session.rollback()
+        logger.exception("Job %s failed", job_id)
+        success, message = False, str(e)
+
+    finish_job(job_id, success, message)
+    return success, message
+
+
+def finish_job(job_id, success, message):
+    """Mark a job Completed or Failed."""
+    # Reload, as progress was written on other connections
+    job = db.session.get(Job, job_id, populate_existing=True)
+    job.status = 'Completed' if success else 'Failed'
+    job.message = message
+    job.date_finished = datetime.utcnow()
+    if success and job.progress_total:
+        job.progress_current = job.progress_total
+    db.session.commit()
+
+
+def report_progress(job_id, current, total):
+    """
+    Record how far a running job has got, and that it is still alive.
+
+    Progress is written on its own connection and committed at once, so it
+    is visible while the job's own transaction is still open. Progress is
+    informational: a failed write is logged and the job carries on.
+    """
+    engine = db.engine
+    if engine.dialect.name == 'sqlite' and sqlite_write_pending():
+        return
+
+    try:
+        with engine.begin() as connection:
+            connection.execute(
+                update(Job.__table__)
+                .where(Job.__table__.c.id == job_id)
+                .values(progress_current=current, progress_total=total, date_heartbeat=datetime.utcnow())
+            )
+    except Exception as e:
+        logger.warning("Could not record progress for job %s: %s", job_id, e)
+
+
+def sqlite_write_pending():
+    """
+    Check whether the session holds SQLite's write lock.
+
+    SQLite allows a single writer, so a progress update on another
+    connection would wait for the job's own transaction to finish.
+    """
+    session = db.session()
+    if not session.in_transaction():
+        return False
+    return session.connection().connection.dbapi_connection.in_transaction
+
+
+@job_handler('process_payroll')
+def process_payroll_job(job, progress):
+    """Calculate a payroll's items and totals."""
+    from utils import process_payroll
+
+    return process_payroll(
+        job.payroll_id,
+        shards=current_app.config.get('PAYROLL_SHARDS', 1),
+        shard_by=current_app.config.get('PAYROLL_SHARD_BY', 'id'),
+        chunk_size=current_app.config.get('PAYROLL_CHUNK_SIZE', 2000),
+        progress=progress
+    )
+
+
+@job_handler('post_back_pay')
+def post_back_pay_job(job, progress):
+    """Post back pay owed for earlier payrolls as adjustments on this one."""
+    from backpay import post_back_pay
+
+    return post_back_pay(job.payroll_id, job.created_by_id)
+
+
+@job_handler('generate_payslips')
+def generate_payslips_job(job, progress):
+    """Generate PDF payslips for every item of a payroll."""
+    from payslip_utils import generate_all_payslips
+
+    success, message, _ = generate_all_payslips(
+        job.payroll_id, job.created_by_id, progress=progress,
+        workers=current_app.config.get('PAYSLIP_WORKERS', 1)
+    )
+    return success, message
+
+
+@job_handler('send_payslips')
+def send_payslips_job(job, progress):
+    """Email a payroll's payslips; with resend=True, including ones already sent."""
+    from email_config import update_mail_config
+    from email_utils import send_all_payslips
+    from models import Payslip, PayrollItem
+
+    # The worker has no requests, so load the mail settings here
+    update_mail_config()
+
+    if (job.params or {}).get('resend'):
+        payslip_ids = select(Payslip.id).join(PayrollItem).where(PayrollItem.payroll_id == job.payroll_id)
+        db.session.execute(
+            update(Payslip)
+            .where(Payslip.id.in_(payslip_ids))
+            .values(email_status='pending')
+            .execution_options(synchronize_session=False)
+        )
+        db.session.commit()
+
+    success, message, _, _ = send_all_payslips(job.payroll_id, progress=progress)
+    return success, message
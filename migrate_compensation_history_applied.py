@@ -0,0 +1,24 @@
+from app import app, db
+from sqlalchemy import text, inspect
+
+def add_date_applied_column():
+    """Add the date_applied column to the CompensationHistory table."""
+    with app.app_context():
+        inspector = inspect(db.engine)
+        columns = [col['name'] for col in inspector.get_columns('compensation_history')]
+        
+        if 'date_applied' not in columns:
+            with db.engine.connect() as conn:
+                conn.execute(text('ALTER TABLE compensation_history ADD COLUMN date_applied TIMESTAMP'))
+                # Changes effective by today were copied onto the employee when they were entered
+                conn.execute(text(
+                    'UPDATE compensation_history SET date_applied = date_created '
+                    'WHERE effective_date <= CURRENT_DATE'
+                ))
+                conn.commit()
+            print("Added date_applied column to compensation_history table")
+        else:
+            print("date_applied column already exists")
+
+if __name__ == "__main__":
+    add_date_applied_column()
@@ -0,0 +1,19 @@
+from app import app, db
+from sqlalchemy import inspect
+from models import CompensationHistory
+
+def add_compensation_history_index():
+    """Add the (employee_id, effective_date) index used to resolve salaries for a payroll period."""
+    with app.app_context():
+        inspector = inspect(db.engine)
+        indexes = [index['name'] for index in inspector.get_indexes('compensation_history')]
+        
+        for index in CompensationHistory.__table__.indexes:
+            if index.name not in indexes:
+                index.create(db.engine)
+                print(f"Added {index.name} index to compensation_history table")
+            else:
+                print(f"{index.name} index already exists")
+
+if __name__ == "__main__":
+    add_compensation_history_index()
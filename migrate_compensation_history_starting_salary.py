@@ -0,0 +1,50 @@
+from app import app, db
+from sqlalchemy import select
+from compensation import initial_compensation
+from models import CompensationHistory, Employee, User
+
+def add_starting_salaries():
+    """Record each employee's starting salary in the compensation history, where it is still known."""
+    with app.app_context():
+        admin = User.query.filter_by(is_admin=True).first() or User.query.first()
+        if admin is None:
+            print("No users yet; nothing to do")
+            return
+
+        # Each employee's earliest change: payroll needs a row in force before it
+        earliest = {}
+        for employee_id, effective_date, date_applied in db.session.execute(
+            select(
+                CompensationHistory.employee_id, CompensationHistory.effective_date, CompensationHistory.date_applied
+            ).order_by(CompensationHistory.employee_id, CompensationHistory.effective_date, CompensationHistory.id)
+        ):
+            earliest.setdefault(employee_id, (effective_date, date_applied))
+
+        added = 0
+        unknown = []
+        for employee in Employee.query.order_by(Employee.id):
+            if employee.id not in earliest:
+                db.session.add(initial_compensation(employee, admin.id))
+                added += 1
+                continue
+
+            effective_date, date_applied = earliest[employee.id]
+            if effective_date <= employee.date_hired:
+                continue
+            if date_applied is None:
+                # Not applied yet, so basic_salary is still the salary paid before it
+                db.session.add(initial_compensation(employee, admin.id, effective_date))
+                added += 1
+            else:
+                unknown.append(employee.employee_id)
+
+        db.session.commit()
+        print(f"Recorded starting salaries for {added} employees")
+        if unknown:
+            print(
+                f"{len(unknown)} employees had a salary change applied before their starting salary was recorded; "
+                f"add a compensation history row for their earlier salary by hand: {', '.join(unknown)}"
+            )
+
+if __name__ == "__main__":
+    add_starting_salaries()
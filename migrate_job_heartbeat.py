@@ -0,0 +1,19 @@
+from app import app, db
+from sqlalchemy import text, inspect
+
+def add_date_heartbeat_column():
+    """Add the date_heartbeat column to the Job table."""
+    with app.app_context():
+        inspector = inspect(db.engine)
+        columns = [col['name'] for col in inspector.get_columns('job')]
+        
+        if 'date_heartbeat' not in columns:
+            with db.engine.connect() as conn:
+                conn.execute(text('ALTER TABLE job ADD COLUMN date_heartbeat TIMESTAMP'))
+                conn.commit()
+            print("Added date_heartbeat column to job table")
+        else:
+            print("date_heartbeat column already exists")
+
+if __name__ == "__main__":
+    add_date_heartbeat_column()
@@ -0,0 +1,48 @@
+from app import app, db
+from sqlalchemy import text, inspect, select, func
+from bulk_utils import bulk_update
+from models import PayrollAdjustment, PayrollItem, ADJUSTMENT_TOTAL_COLUMNS, adjustment_total_amount
+
+ADJUSTMENT_TOTAL_DEFINITIONS = (
+    ('adjustment_count', 'INTEGER NOT NULL DEFAULT 0'),
+    ('bonus_total', 'FLOAT NOT NULL DEFAULT 0.0'),
+    ('reimbursement_total', 'FLOAT NOT NULL DEFAULT 0.0'),
+    ('deduction_adjustment_total', 'FLOAT NOT NULL DEFAULT 0.0'),
+)
+
+def add_adjustment_totals():
+    """Add PayrollItem's running adjustment totals and fill them in from the existing adjustments."""
+    with app.app_context():
+        inspector = inspect(db.engine)
+        columns = [col['name'] for col in inspector.get_columns('payroll_item')]
+        
+        with db.engine.connect() as conn:
+            for name, definition in ADJUSTMENT_TOTAL_DEFINITIONS:
+                if name not in columns:
+                    conn.execute(text(f'ALTER TABLE payroll_item ADD COLUMN {name} {definition}'))
+                    print(f"Added {name} column to payroll_item table")
+                else:
+                    print(f"{name} column already exists")
+            conn.commit()
+        
+        # One grouped query over all adjustments, then the adjusted items in bulk
+        totals = {}
+        for item_id, adjustment_type, count, amount in db.session.execute(
+            select(
+                PayrollAdjustment.payroll_item_id, PayrollAdjustment.adjustment_type,
+                func.count(PayrollAdjustment.id), func.sum(PayrollAdjustment.amount)
+            ).group_by(PayrollAdjustment.payroll_item_id, PayrollAdjustment.adjustment_type)
+        ):
+            item = totals.setdefault(item_id, dict(
+                dict.fromkeys(ADJUSTMENT_TOTAL_COLUMNS.values(), 0.0), id=item_id, adjustment_count=0
+            ))
+            item['adjustment_count'] += count
+            if adjustment_type in ADJUSTMENT_TOTAL_COLUMNS:
+                item[ADJUSTMENT_TOTAL_COLUMNS[adjustment_type]] += adjustment_total_amount(adjustment_type, amount)
+        
+        bulk_update(PayrollItem, list(totals.values()))
+        db.session.commit()
+        print(f"Filled in adjustment totals for {len(totals)} payroll items")
+
+if __name__ == "__main__":
+    add_adjustment_totals()
@@ -0,0 +1,19 @@
+from app import app, db
+from sqlalchemy import text, inspect
+
+def add_input_fingerprint_column():
+    """Add the input_fingerprint column to the PayrollItem table."""
+    with app.app_context():
+        inspector = inspect(db.engine)
+        columns = [col['name'] for col in inspector.get_columns('payroll_item')]
+        
+        if 'input_fingerprint' not in columns:
+            with db.engine.connect() as conn:
+                conn.execute(text('ALTER TABLE payroll_item ADD COLUMN input_fingerprint VARCHAR(40)'))
+                conn.commit()
+            print("Added input_fingerprint column to payroll_item table")
+        else:
+            print("input_fingerprint column already exists")
+
+if __name__ == "__main__":
+    add_input_fingerprint_column()
@@ -0,0 +1,73 @@
+from app import app, db
+from models import PayrollItem
+from bulk_utils import bulk_update
+from utils import get_tax_table, format_tax_bracket_detail
+
+
+def parse_currency(value):
+    """Turn a formatted amount such as '₦1,234.50' back into a number."""
+    return float(str(value).replace('₦', '').replace(',', ''))
+
+
+def compact_tax_details(tax_details, tax_table, bracket_labels):
+    """
+    Convert display-ready tax details to the compact numeric format.
+
+    Returns None when a bracket does not match the current tax table.
+    """
+    brackets = []
+    for bracket in tax_details.get('Tax Brackets', []):
+        index = bracket_labels.get((bracket.get('bracket'), bracket.get('rate')))
+        if index is None:
+            return None
+        brackets.append([index, parse_currency(bracket['taxable_amount']), parse_currency(bracket['tax'])])
+
+    return {
+        'annual_basic': tax_details.get('Annual Basic Salary', 0),
+        'annual_gross': tax_details.get('Annual Gross Income', 0),
+        'consolidated_relief': tax_details.get('Consolidated Relief', 0),
+        'annual_taxable_income': tax_details.get('Annual Taxable Income', 0),
+        'annual_tax': tax_details.get('Annual Tax', 0),
+        'tax_table': tax_table.version,
+        'brackets': brackets
+    }
+
+
+def compact_payroll_item_tax_details(batch_size=1000):
+    """Rewrite PayrollItem.tax_details saved with formatted strings in the compact numeric format."""
+    with app.app_context():
+        tax_table = get_tax_table()
+        bracket_labels = {}
+        for index, (lower, upper, rate) in enumerate(tax_table.brackets):
+            detail = format_tax_bracket_detail(lower, upper, rate, 0, 0)
+            bracket_labels[(detail['bracket'], detail['rate'])] = index
+
+        items = db.session.execute(
+            db.select(PayrollItem.id, PayrollItem.tax_details).execution_options(yield_per=batch_size)
+        )
+
+        converted = 0
+        skipped = 0
+        rows = []
+        for item in items:
+            if not isinstance(item.tax_details, dict) or 'Tax Brackets' not in item.tax_details:
+                continue
+            tax_details = compact_tax_details(item.tax_details, tax_table, bracket_labels)
+            if tax_details is None:
+                skipped += 1
+                continue
+            rows.append({'id': item.id, 'tax_details': tax_details})
+
+        # Write after reading, so the streaming cursor is never interrupted
+        for start in range(0, len(rows), batch_size):
+            bulk_update(PayrollItem, rows[start:start + batch_size])
+            db.session.commit()
+            converted += len(rows[start:start + batch_size])
+
+        print(f"Compacted tax details of {converted} payroll items")
+        if skipped:
+            print(f"Left {skipped} payroll items whose tax brackets no longer match the current brackets")
+
+
+if __name__ == "__main__":
+    compact_payroll_item_tax_details()
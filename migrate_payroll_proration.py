@@ -0,0 +1,26 @@
+from app import app, db
+from sqlalchemy import text, inspect
+
+def add_proration_columns():
+    """Add Employee.date_terminated and PayrollItem.proration_factor."""
+    with app.app_context():
+        inspector = inspect(db.engine)
+        employee_columns = [col['name'] for col in inspector.get_columns('employee')]
+        payroll_item_columns = [col['name'] for col in inspector.get_columns('payroll_item')]
+        
+        with db.engine.connect() as conn:
+            if 'date_terminated' not in employee_columns:
+                conn.execute(text('ALTER TABLE employee ADD COLUMN date_terminated DATE'))
+                print("Added date_terminated column to employee table")
+            else:
+                print("date_terminated column already exists")
+            
+            if 'proration_factor' not in payroll_item_columns:
+                conn.execute(text('ALTER TABLE payroll_item ADD COLUMN proration_factor FLOAT NOT NULL DEFAULT 1.0'))
+                print("Added proration_factor column to payroll_item table")
+            else:
+                print("proration_factor column already exists")
+            conn.commit()
+
+if __name__ == "__main__":
+    add_proration_columns()
@@ -0,0 +1,84 @@
+from app import app, db
+from sqlalchemy import text, inspect, select
+from sqlalchemy.schema import CreateTable
+from bulk_utils import bulk_update
+from models import Payslip
+from payslip_storage import get_payslip_store
+
+# Payslips whose PDFs are moved out (and committed) together
+MIGRATION_BATCH_SIZE = 200
+
+def rebuild_sqlite_payslip_table(conn, columns):
+    """SQLite cannot drop NOT NULL from pdf_data, so copy the payslips into a table created from the model."""
+    new_table = Payslip.__table__.to_metadata(db.metadata, name='payslip_new')
+    try:
+        conn.execute(CreateTable(new_table))
+    finally:
+        db.metadata.remove(new_table)
+    names = ', '.join(column for column in columns if column in Payslip.__table__.columns)
+    conn.execute(text(f'INSERT INTO payslip_new ({names}) SELECT {names} FROM payslip'))
+    conn.execute(text('DROP TABLE payslip'))
+    conn.execute(text('ALTER TABLE payslip_new RENAME TO payslip'))
+
+def move_payslips_to_storage():
+    """Add Payslip.storage_key and move the PDFs stored in the database into the payslip store."""
+    with app.app_context():
+        inspector = inspect(db.engine)
+        columns = {col['name']: col for col in inspector.get_columns('payslip')}
+
+        with db.engine.connect() as conn:
+            if not columns['pdf_data']['nullable'] and db.engine.dialect.name == 'sqlite':
+                # Adds storage_key too
+                rebuild_sqlite_payslip_table(conn, columns)
+                print("Rebuilt payslip table with storage_key column and optional pdf_data")
+            elif not columns['pdf_data']['nullable']:
+                conn.execute(text('ALTER TABLE payslip ALTER COLUMN pdf_data DROP NOT NULL'))
+                print("Made pdf_data column of payslip table optional")
+
+            if 'storage_key' not in [col['name'] for col in inspect(conn).get_columns('payslip')]:
+                conn.execute(text('ALTER TABLE payslip ADD COLUMN storage_key VARCHAR(64)'))
+                print("Added storage_key column to payslip table")
+            else:
+                print("storage_key column already exists")
+            conn.commit()
+
+        indexes = [index['name'] for index in inspect(db.engine).get_indexes('payslip')]
+        for index in Payslip.__table__.indexes:
+            if index.name not in indexes:
+                index.create(db.engine)
+                print(f"Added {index.name} index to payslip table")
+
+        # A batch of PDFs at a time, committing each, so the move can be stopped and run again
+        store = get_payslip_store()
+        moved = 0
+        last_id = 0
+        while True:
+            payslips = db.session.execute(
+                select(Payslip.id, Payslip.pdf_data).where(
+                    Payslip.id > last_id,
+                    Payslip.storage_key.is_(None),
+                    Payslip.pdf_data.is_not(None)
+                ).order_by(Payslip.id).limit(MIGRATION_BATCH_SIZE)
+            ).all()
+            if not payslips:
+                break
+
+            updates = []
+            for payslip_id, pdf_data in payslips:
+                pdf_data = bytes(pdf_data)
+                updates.append({
+                    'id': payslip_id,
+                    'storage_key': store.put(pdf_data),
+                    'file_size': len(pdf_data),
+                    'pdf_data': None,
+                })
+            bulk_update(Payslip, updates)
+            db.session.commit()
+            moved += len(updates)
+            last_id = payslips[-1].id
+            print(f"Moved {moved} payslip PDFs to storage")
+
+        print(f"Moved {moved} payslip PDFs in total; VACUUM the database to return the space they used")
+
+if __name__ == "__main__":
+    move_payslips_to_storage()
@@ -0,0 +1,19 @@
+from app import app, db
+from sqlalchemy import text, inspect
+
+def add_paye_method_column():
+    """Add SalaryConfiguration.paye_method; existing configurations keep annualised PAYE."""
+    with app.app_context():
+        inspector = inspect(db.engine)
+        columns = [col['name'] for col in inspector.get_columns('salary_configuration')]
+        
+        with db.engine.connect() as conn:
+            if 'paye_method' not in columns:
+                conn.execute(text("ALTER TABLE salary_configuration ADD COLUMN paye_method VARCHAR(20) NOT NULL DEFAULT 'annualised'"))
+                print("Added paye_method column to salary_configuration table")
+            else:
+                print("paye_method column already exists")
+            conn.commit()
+
+if __name__ == "__main__":
+    add_paye_method_column()
@@ -0,0 +1,25 @@
+from app import app, db
+from sqlalchemy import text, inspect
+from ytd import rebuild_year_to_date
+
+def add_year_to_date_totals():
+    """Add Payroll.ytd_posted and build the YearToDate totals from the completed payrolls."""
+    with app.app_context():
+        inspector = inspect(db.engine)
+        columns = [col['name'] for col in inspector.get_columns('payroll')]
+
+        with db.engine.connect() as conn:
+            if 'ytd_posted' not in columns:
+                conn.execute(text('ALTER TABLE payroll ADD COLUMN ytd_posted BOOLEAN NOT NULL DEFAULT FALSE'))
+                print("Added ytd_posted column to payroll table")
+            else:
+                print("ytd_posted column already exists")
+            conn.commit()
+
+        # The YearToDate table itself is created with the other tables
+        count = rebuild_year_to_date()
+        db.session.commit()
+        print(f"Built year-to-date totals for {count} employee tax years")
+
+if __name__ == "__main__":
+    add_year_to_date_totals()
@@ -49,6 +49,7 @@ class Employee(db.Model):
     department = db.Column(db.String(64), nullable=False)
     position = db.Column(db.String(64), nullable=False)
     date_hired = db.Column(db.Date, nullable=False)
+    date_terminated = db.Column(db.Date, nullable=True)  # Last day worked, for leavers
     employment_status = db.Column(db.String(20), nullable=False, default='Active')
     is_contract = db.Column(db.Boolean, default=False, nullable=False)
     
@@ -168,6 +169,7 @@ class Payroll(db.Model):
     total_deductions = db.Column(db.Float, default=0.0)
     total_tax = db.Column(db.Float, default=0.0)
     total_net_pay = db.Column(db.Float, default=0.0)
+    ytd_posted = db.Column(db.Boolean, default=False, nullable=False)  # Added to the employees' YearToDate totals
     created_by_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     date_created = db.Column(db.DateTime, default=datetime.utcnow)
     date_updated = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
@@ -236,9 +238,17 @@ class CompensationHistory(db.Model):
     change_reason = db.Column(db.String(256), nullable=True)
     date_created = db.Column(db.DateTime, default=datetime.utcnow)
     
+    # When the salary was copied onto Employee.basic_salary (None until it takes effect)
+    date_applied = db.Column(db.DateTime, nullable=True)
+    
     # Relationships
     changed_by = db.relationship('User', backref='compensation_changes')
     
+    # Payroll looks up each employee's salary as of a date
+    __table_args__ = (
+        db.Index('ix_compensation_history_employee_effective', 'employee_id', 'effective_date'),
+    )
+    
     def __repr__(self):
         return f'<CompensationHistory {self.id} for Employee #{self.employee_id} @{self.effective_date}>'
 
@@ -253,6 +263,7 @@ class SalaryConfiguration(db.Model):
     utility_allowance_percentage = db.Column(db.Float, nullable=False, default=0.0)
     meal_allowance_percentage = db.Column(db.Float, nullable=False, default=0.0)
     clothing_allowance_percentage = db.Column(db.Float, nullable=False, default=0.0)
+    paye_method = db.Column(db.String(20), nullable=False, default='annualised')  # 'annualised' or 'cumulative'
     is_active = db.Column(db.Boolean, default=True)
     created_by_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     date_created = db.Column(db.DateTime, default=datetime.utcnow)
@@ -276,6 +287,19 @@ class SalaryConfiguration(db.Model):
             self.clothing_allowance_percentage
         )
 
+# PayrollItem running total kept for each adjustment type
+ADJUSTMENT_TOTAL_COLUMNS = {
+    'bonus': 'bonus_total',
+    'reimbursement': 'reimbursement_total',
+    'deduction': 'deduction_adjustment_total',
+}
+
+
+def adjustment_total_amount(adjustment_type, amount):
+    """Get what an adjustment adds to its type's running total (deductions are stored negative but totalled positive)."""
+    return -amount if adjustment_type == 'deduction' else amount
+
+
 class PayrollItem(db.Model):
     """Model for individual employee payroll records within a payroll run."""
     id = db.Column(db.Integer, primary_key=True)
@@ -295,6 +319,21 @@ class PayrollItem(db.Model):
     # Flag to indicate if this item has been adjusted
     is_adjusted = db.Column(db.Boolean, default=False)
     
+    # Running totals of the item's adjustments, updated as each one is added
+    # or removed, so net pay and payslips never need to load them
+    adjustment_count = db.Column(db.Integer, nullable=False, default=0)
+    bonus_total = db.Column(db.Float, nullable=False, default=0.0)
+    reimbursement_total = db.Column(db.Float, nullable=False, default=0.0)
+    deduction_adjustment_total = db.Column(db.Float, nullable=False, default=0.0)  # Amount deducted, positive
+    
+    # Hash of the inputs the item was calculated from, used to skip unchanged
+    # employees when the payroll is re-processed
+    input_fingerprint = db.Column(db.String(40), nullable=True)
+    
+    # Share of the period's working days the employee was employed for
+    # (1.0 for a full period); all monthly amounts are scaled by it
+    proration_factor = db.Column(db.Float, nullable=False, default=1.0)
+    
     # JSON fields for detailed breakdown
     allowances = db.Column(db.JSON, nullable=False, default=dict)
     deductions = db.Column(db.JSON, nullable=False, default=dict)
@@ -310,23 +349,36 @@ class PayrollItem(db.Model):
         return f'<PayrollItem {self.id} for Employee #{self.employee_id}>'
         
     def recalculate_net_pay(self):
-        """Recalculate net pay after adjustments."""
+        """Recalculate net pay after adjustments, from the running adjustment totals."""
         # Calculate total positive adjustments (bonuses and reimbursements)
-        positive_adjustments = sum(adj.amount for adj in self.adjustments 
-                                if adj.adjustment_type in ['bonus', 'reimbursement'])
-        
-        # Calculate total negative adjustments (deductions)
-        negative_adjustments = sum(adj.amount for adj in self.adjustments 
-                                if adj.adjustment_type == 'deduction')
+        positive_adjustments = (self.bonus_total or 0.0) + (self.reimbursement_total or 0.0)
         
         # Calculate total deductions
         total_deductions = (self.tax_amount + self.pension_amount + 
-                            self.nhf_amount + self.other_deductions - negative_adjustments)
+                            self.nhf_amount + self.other_deductions + (self.deduction_adjustment_total or 0.0))
         
         # Net Pay = Gross Pay + Positive Adjustments - Total Deductions
         self.net_pay = self.gross_pay + positive_adjustments - total_deductions
         
         return self.net_pay
+    
+    def add_adjustment(self, adjustment, sign=1):
+        """
+        Count a new adjustment in the running totals and recalculate net pay.
+        
+        With sign -1 the adjustment is taken off again, for one being deleted.
+        """
+        column = ADJUSTMENT_TOTAL_COLUMNS[adjustment.adjustment_type]
+        amount = adjustment_total_amount(adjustment.adjustment_type, adjustment.amount)
+        setattr(self, column, (getattr(self, column) or 0.0) + sign * amount)
+        self.adjustment_count = (self.adjustment_count or 0) + sign
+        self.is_adjusted = self.adjustment_count > 0
+        
+        return self.recalculate_net_pay()
+    
+    def remove_adjustment(self, adjustment):
+        """Take a deleted adjustment off the running totals and recalculate net pay."""
+        return self.add_adjustment(adjustment, sign=-1)
 
 
 class PayrollAdjustment(db.Model):
@@ -347,11 +399,62 @@ class PayrollAdjustment(db.Model):
         return f'<PayrollAdjustment {self.id}: {self.adjustment_type} ₦{self.amount:,.2f}>'
 
 
+class BackPay(db.Model):
+    """Model for retroactive pay differences for a past payroll, posted as adjustments on a later one."""
+    id = db.Column(db.Integer, primary_key=True)
+    employee_id = db.Column(db.Integer, db.ForeignKey('employee.id'), nullable=False)
+    payroll_id = db.Column(db.Integer, db.ForeignKey('payroll.id'), nullable=False)  # Period the difference is for
+    posted_payroll_id = db.Column(db.Integer, db.ForeignKey('payroll.id'), nullable=False)  # Payroll it was paid in
+    
+    # Differences between the recalculated and the paid amounts
+    basic_salary = db.Column(db.Float, nullable=False, default=0.0)
+    gross_pay = db.Column(db.Float, nullable=False, default=0.0)
+    tax_amount = db.Column(db.Float, nullable=False, default=0.0)
+    pension_amount = db.Column(db.Float, nullable=False, default=0.0)
+    nhf_amount = db.Column(db.Float, nullable=False, default=0.0)
+    net_pay = db.Column(db.Float, nullable=False, default=0.0)
+    
+    created_by_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    date_created = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        db.Index('ix_back_pay_employee_payroll', 'employee_id', 'payroll_id'),
+    )
+    
+    def __repr__(self):
+        return f'<BackPay {self.id} for Employee #{self.employee_id} in Payroll #{self.payroll_id}>'
+
+
+class YearToDate(db.Model):
+    """Model for an employee's running totals for a tax year, from the payrolls completed in it."""
+    id = db.Column(db.Integer, primary_key=True)
+    employee_id = db.Column(db.Integer, db.ForeignKey('employee.id'), nullable=False)
+    tax_year = db.Column(db.Integer, nullable=False)
+    
+    basic_salary = db.Column(db.Float, nullable=False, default=0.0)
+    gross_pay = db.Column(db.Float, nullable=False, default=0.0)
+    tax_amount = db.Column(db.Float, nullable=False, default=0.0)
+    pension_amount = db.Column(db.Float, nullable=False, default=0.0)
+    nhf_amount = db.Column(db.Float, nullable=False, default=0.0)
+    net_pay = db.Column(db.Float, nullable=False, default=0.0)
+    
+    date_updated = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    __table_args__ = (
+        db.UniqueConstraint('employee_id', 'tax_year', name='uq_year_to_date_employee_year'),
+    )
+    
+    def __repr__(self):
+        return f'<YearToDate {self.tax_year} for Employee #{self.employee_id}>'
+
+
 class Payslip(db.Model):
     """Model for storing generated payslips."""
     id = db.Column(db.Integer, primary_key=True)
     payroll_item_id = db.Column(db.Integer, db.ForeignKey('payroll_item.id'), nullable=False)
-    pdf_data = db.Column(db.LargeBinary, nullable=False)  # Store the PDF binary data
+    # PDFs are kept in the payslip store (see payslip_storage); pdf_data only holds ones not yet migrated
+    pdf_data = db.deferred(db.Column(db.LargeBinary, nullable=True))
+    storage_key = db.Column(db.String(64), nullable=True, index=True)  # SHA-256 of the PDF
     filename = db.Column(db.String(256), nullable=False)
     file_size = db.Column(db.Integer, nullable=False)
     is_emailed = db.Column(db.Boolean, default=False)
@@ -411,6 +514,61 @@ class EmailLog(db.Model):
             return "Email is pending delivery"
 
 
+class Job(db.Model):
+    """Model for background jobs (payroll processing, payslip generation, emailing) run by worker.py."""
+    id = db.Column(db.Integer, primary_key=True)
+    job_type = db.Column(db.String(32), nullable=False)  # 'process_payroll', 'generate_payslips', 'send_payslips'
+    status = db.Column(db.String(20), nullable=False, default='Queued')  # Queued, Running, Completed, Failed
+    payroll_id = db.Column(db.Integer, db.ForeignKey('payroll.id'), nullable=True)
+    params = db.Column(db.JSON, nullable=True)
+    progress_current = db.Column(db.Integer, default=0)
+    progress_total = db.Column(db.Integer, default=0)
+    message = db.Column(db.Text, nullable=True)
+    created_by_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    date_created = db.Column(db.DateTime, default=datetime.utcnow)
+    date_started = db.Column(db.DateTime, nullable=True)
+    date_finished = db.Column(db.DateTime, nullable=True)
+    date_heartbeat = db.Column(db.DateTime, nullable=True)  # Last sign of life while Running (see fail_stale_jobs)
+    
+    # Relationships
+    payroll = db.relationship('Payroll', backref='jobs')
+    created_by = db.relationship('User', backref='jobs')
+    
+    def __repr__(self):
+        return f'<Job {self.id}: {self.job_type} [{self.status}]>'
+    
+    @property
+    def is_finished(self):
+        """Check whether the job has stopped running."""
+        return self.status in ['Completed', 'Failed']
+    
+    @property
+    def progress_percent(self):
+        """Get the job's progress as a whole percentage."""
+        if self.status == 'Completed':
+            return 100
+        if not self.progress_total:
+            return 0
+        return min(100, int(100 * (self.progress_current or 0) / self.progress_total))
+    
+    def to_dict(self):
+        """Get the job's status and progress for the status endpoint."""
+        return {
+            'id': self.id,
+            'job_type': self.job_type,
+            'status': self.status,
+            'payroll_id': self.payroll_id,
+            'progress_current': self.progress_current or 0,
+            'progress_total': self.progress_total or 0,
+            'progress_percent': self.progress_percent,
+            'message': self.message,
+            'is_finished': self.is_finished,
+            'date_created': self.date_created.isoformat() if self.date_created else None,
+            'date_started': self.date_started.isoformat() if self.date_started else None,
+            'date_finished': self.date_finished.isoformat() if self.date_finished else None
+        }
+
+
 class CompanySettings(db.Model):
     """Model for storing company information that appears on payslips and reports."""
     id = db.Column(db.Integer, primary_key=True)
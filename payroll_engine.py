@@ -0,0 +1,423 @@
+"""
+Vectorized payroll engine.
+
+Computes salary components, statutory deductions, PAYE and net pay for a
+whole workforce at once using NumPy arrays. The arithmetic mirrors the
+scalar helpers in utils.py (calculate_pension, calculate_nhf,
+calculate_consolidated_relief and calculate_paye_tax), so both paths
+produce the same figures to the kobo.
+"""
+import hashlib
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+# Salary split used when no SalaryConfiguration is active
+DEFAULT_SALARY_PERCENTAGES = {
+    'basic': 60.0,
+    'transport': 10.0,
+    'housing': 15.0,
+    'utility': 5.0,
+    'meal': 5.0,
+    'clothing': 5.0,
+}
+
+# Number of distinct pay points kept by the shared calculation cache
+PAY_POINT_CACHE_SIZE = 4096
+
+# Batch components that are paid per month and so scale with proration
+PRORATED_COMPONENTS = (
+    'monthly_basic', 'transport', 'housing', 'utility', 'meal', 'clothing',
+    'monthly_gross', 'monthly_pension', 'monthly_employer_pension',
+    'monthly_nhf', 'monthly_tax', 'monthly_net_pay',
+)
+
+# Allowance names as stored on PayrollItem.allowances, keyed by component
+ALLOWANCE_COMPONENTS = [
+    ('Housing Allowance', 'housing'),
+    ('Transport Allowance', 'transport'),
+    ('Utility Allowance', 'utility'),
+    ('Meal Allowance', 'meal'),
+    ('Clothing Allowance', 'clothing'),
+]
+
+
+def salary_percentages(salary_config):
+    """Get the component percentages of a SalaryConfiguration (or the defaults)."""
+    if not salary_config:
+        return dict(DEFAULT_SALARY_PERCENTAGES)
+
+    return {
+        'basic': salary_config.basic_salary_percentage,
+        'transport': salary_config.transport_allowance_percentage,
+        'housing': salary_config.housing_allowance_percentage,
+        'utility': salary_config.utility_allowance_percentage,
+        'meal': salary_config.meal_allowance_percentage,
+        'clothing': salary_config.clothing_allowance_percentage,
+    }
+
+
+def fingerprint_context(salary_config, percentages, tax_table):
+    """
+    Describe the shared payroll inputs that feed every employee's calculation.
+
+    The active configuration is identified by its id and its percentages, and
+    the tax brackets by the compiled table's content version, so editing
+    either changes every fingerprint.
+    """
+    config_id = salary_config.id if salary_config else None
+    split = ','.join(f'{name}={percentages[name]!r}' for name in sorted(percentages))
+    return f'config={config_id};{split};tax={tax_table.version}'
+
+
+def input_fingerprints(basic_salaries, is_contract, context, proration_factors=None):
+    """
+    Fingerprint each employee's payroll inputs.
+
+    Two calculations with equal fingerprints produce identical payroll items,
+    so re-processing can skip employees whose fingerprint has not changed.
+    A proration factor is only included when it is not 1, so items for a
+    full period keep the fingerprints they were calculated with.
+    """
+    if proration_factors is None:
+        proration_factors = [1.0] * len(basic_salaries)
+
+    fingerprints = []
+    for salary, contract, factor in zip(basic_salaries, is_contract, proration_factors):
+        inputs = f'{float(salary)!r}|{int(bool(contract))}|{context}'
+        if factor != 1.0:
+            inputs += f'|prorate={float(factor)!r}'
+        fingerprints.append(hashlib.sha1(inputs.encode('utf-8')).hexdigest())
+    return fingerprints
+
+
+def segment_fingerprints(segments, is_contract, context):
+    """
+    Fingerprint employees paid at one or more (basic salary, factor) segments.
+
+    An employee paid at a single salary gets the fingerprint input_fingerprints
+    gives; a period split between salaries is fingerprinted over every segment.
+    """
+    pieces = [
+        (salary, contract, factor)
+        for employee_segments, contract in zip(segments, is_contract)
+        for salary, factor in employee_segments
+    ]
+    piece_fingerprints = iter(input_fingerprints(
+        [piece[0] for piece in pieces], [piece[1] for piece in pieces], context, [piece[2] for piece in pieces]
+    ))
+
+    fingerprints = []
+    for employee_segments in segments:
+        parts = [next(piece_fingerprints) for _ in employee_segments]
+        if len(parts) == 1:
+            fingerprints.append(parts[0])
+        else:
+            fingerprints.append(hashlib.sha1('+'.join(parts).encode('utf-8')).hexdigest())
+    return fingerprints
+
+
+def compute_paye_batch(annual_taxable_income, tax_table):
+    """
+    Calculate annual PAYE for an array of taxable incomes.
+
+    Args:
+        annual_taxable_income: Array of annual taxable incomes
+        tax_table: Compiled TaxTable (see tax_tables.py)
+
+    Returns:
+        Tuple of (annual_tax, taxable_by_bracket, tax_by_bracket, applied) where
+        the last three are (employees x brackets) arrays and ``applied`` marks
+        the brackets each income reaches
+    """
+    incomes = np.asarray(annual_taxable_income, dtype=float)
+    annual_tax = tax_table.tax_for_array(incomes)
+
+    # Per-bracket breakdown for the tax details
+    starts = np.array(tax_table.starts)
+    widths = np.array(tax_table.widths)
+    above_start = incomes[:, np.newaxis] - starts[np.newaxis, :]
+    applied = above_start > 0
+    taxable_by_bracket = np.where(applied, np.minimum(above_start, widths), 0.0)
+    tax_by_bracket = taxable_by_bracket * np.array(tax_table.rates)
+
+    return annual_tax, taxable_by_bracket, tax_by_bracket, applied
+
+
+def compute_payroll_batch(basic_salaries, is_contract, percentages, tax_table,
+                          pension_rate=8.0, employer_pension_rate=10.0, nhf_rate=2.5):
+    """
+    Calculate monthly pay for a whole workforce in array operations.
+
+    Args:
+        basic_salaries: Sequence of employee basic salaries
+        is_contract: Sequence of contract flags, aligned with basic_salaries
+        percentages: Component percentages as returned by salary_percentages()
+        tax_table: Compiled TaxTable used for PAYE
+
+    Returns:
+        Dictionary of NumPy arrays, one entry per employee in input order
+    """
+    basic_salaries = np.asarray(basic_salaries, dtype=float)
+    is_contract = np.asarray(is_contract, dtype=bool)
+
+    # Split total compensation into components
+    total_compensation = basic_salaries * (100.0 / percentages['basic'])
+    monthly_basic = total_compensation * (percentages['basic'] / 100.0)
+    transport = total_compensation * (percentages['transport'] / 100.0)
+    housing = total_compensation * (percentages['housing'] / 100.0)
+    utility = total_compensation * (percentages['utility'] / 100.0)
+    meal = total_compensation * (percentages['meal'] / 100.0)
+    clothing = total_compensation * (percentages['clothing'] / 100.0)
+
+    monthly_gross = monthly_basic + transport + housing + utility + meal + clothing
+
+    # Pension applies to basic + transport + housing; contract staff and
+    # those earning below ₦30,000 are exempt
+    pensionable = monthly_basic + transport + housing
+    pension_exempt = is_contract | (pensionable < 30000)
+    monthly_pension = np.where(pension_exempt, 0.0, pensionable * (pension_rate / 100))
+    monthly_employer_pension = np.where(pension_exempt, 0.0, pensionable * (employer_pension_rate / 100))
+    monthly_nhf = monthly_basic * (nhf_rate / 100)
+
+    # Annualise and apply the consolidated relief allowance
+    annual_basic = monthly_basic * 12
+    annual_gross = monthly_gross * 12
+    annual_pension = monthly_pension * 12
+    annual_nhf = monthly_nhf * 12
+    consolidated_relief = np.maximum(200000, annual_gross * 0.01) + annual_pension + annual_nhf
+    annual_taxable_income = np.maximum(0, annual_gross - consolidated_relief)
+
+    annual_tax, taxable_by_bracket, tax_by_bracket, applied = compute_paye_batch(
+        annual_taxable_income, tax_table
+    )
+    monthly_tax = annual_tax / 12
+
+    total_monthly_deductions = monthly_pension + monthly_nhf + monthly_tax
+    monthly_net_pay = monthly_gross - total_monthly_deductions
+
+    return {
+        'monthly_basic': monthly_basic,
+        'transport': transport,
+        'housing': housing,
+        'utility': utility,
+        'meal': meal,
+        'clothing': clothing,
+        'monthly_gross': monthly_gross,
+        'monthly_pension': monthly_pension,
+        'monthly_employer_pension': monthly_employer_pension,
+        'monthly_nhf': monthly_nhf,
+        'monthly_tax': monthly_tax,
+        'monthly_net_pay': monthly_net_pay,
+        'annual_basic': annual_basic,
+        'annual_gross': annual_gross,
+        'consolidated_relief': consolidated_relief,
+        'annual_taxable_income': annual_taxable_income,
+        'annual_tax': annual_tax,
+        'taxable_by_bracket': taxable_by_bracket,
+        'tax_by_bracket': tax_by_bracket,
+        'bracket_applied': applied,
+    }
+
+
+def prorate_batch(batch, factors):
+    """
+    Scale the monthly amounts of a computed batch by each employee's proration factor.
+
+    Annual figures (the basis of the tax calculation) are left as they are.
+    Returns a new batch; the one passed in is not changed.
+    """
+    factors = np.asarray(factors, dtype=float)
+    prorated = dict(batch)
+    for name in PRORATED_COMPONENTS:
+        prorated[name] = batch[name] * factors
+    return prorated
+
+
+def combine_batch_segments(batch, offsets):
+    """
+    Add up the prorated segments of each employee in a batch.
+
+    Args:
+        batch: Prorated batch with one entry per (employee, salary) segment
+        offsets: Index of each employee's first segment, in order
+
+    Returns:
+        Batch of the monthly components with one entry per employee. Segments
+        are added in order, the way a split period's payroll item is built.
+    """
+    return {name: np.add.reduceat(batch[name], offsets) for name in PRORATED_COMPONENTS}
+
+
+def apply_cumulative_paye(batch, year_to_date, months, tax_table):
+    """
+    Recalculate the PAYE of a batch on a cumulative (year-to-date) basis.
+
+    Each employee's tax for the period is the tax due on their taxable
+    income for the tax year so far, with the consolidated relief and the
+    tax bands pro rata for the months elapsed, less the tax already
+    withheld. For pay that does not change during the year this is the
+    annualised tax; raises and bonuses are instead taxed over the rest of
+    the year rather than over- or under-withheld until December. Tax is
+    never negative: anything overpaid stays in the year-to-date figures and
+    is offset against later periods.
+
+    Args:
+        batch: Batch with monthly_basic, monthly_gross, monthly_pension and
+            monthly_nhf for the period (e.g. from combine_batch_segments)
+        year_to_date: Arrays of the same components and monthly_tax, paid and
+            withheld earlier in the tax year
+        months: Months of the tax year up to and including the period
+        tax_table: Compiled TaxTable
+
+    Returns:
+        A new batch with monthly_tax and monthly_net_pay recalculated, the
+        annual figures of the tax details replaced by the annualised
+        equivalents of the cumulative ones, and cumulative_taxable_income and
+        cumulative_tax added
+    """
+    share = months / 12
+    cumulative_basic = year_to_date['monthly_basic'] + batch['monthly_basic']
+    cumulative_gross = year_to_date['monthly_gross'] + batch['monthly_gross']
+    cumulative_pension = year_to_date['monthly_pension'] + batch['monthly_pension']
+    cumulative_nhf = year_to_date['monthly_nhf'] + batch['monthly_nhf']
+
+    cumulative_relief = np.maximum(200000 * share, cumulative_gross * 0.01) + cumulative_pension + cumulative_nhf
+    cumulative_taxable_income = np.maximum(0, cumulative_gross - cumulative_relief)
+
+    # Bands spread evenly over the year: tax the annualised equivalent and scale back
+    annual_tax, taxable_by_bracket, tax_by_bracket, applied = compute_paye_batch(
+        cumulative_taxable_income / share, tax_table
+    )
+    cumulative_tax = annual_tax * share
+    monthly_tax = np.maximum(0, cumulative_tax - year_to_date['monthly_tax'])
+
+    total_monthly_deductions = batch['monthly_pension'] + batch['monthly_nhf'] + monthly_tax
+
+    cumulative = dict(batch)
+    cumulative.update({
+        'monthly_tax': monthly_tax,
+        'monthly_net_pay': batch['monthly_gross'] - total_monthly_deductions,
+        'annual_basic': cumulative_basic / share,
+        'annual_gross': cumulative_gross / share,
+        'consolidated_relief': cumulative_relief / share,
+        'annual_taxable_income': cumulative_taxable_income / share,
+        'annual_tax': annual_tax,
+        'taxable_by_bracket': taxable_by_bracket,
+        'tax_by_bracket': tax_by_bracket,
+        'bracket_applied': applied,
+        'cumulative_taxable_income': cumulative_taxable_income,
+        'cumulative_tax': cumulative_tax,
+    })
+    return cumulative
+
+
+def cumulative_fingerprints(fingerprints, months, year_to_date):
+    """
+    Extend fingerprints with the inputs cumulative PAYE adds.
+
+    Args:
+        fingerprints: Fingerprints of the employees' pay (segment_fingerprints)
+        months: Months of the tax year up to and including the period
+        year_to_date: Tuple of each employee's year-to-date amounts (floats), aligned with fingerprints
+    """
+    return [
+        hashlib.sha1(f'{fingerprint}|months={months}|ytd={amounts!r}'.encode('utf-8')).hexdigest()
+        for fingerprint, amounts in zip(fingerprints, year_to_date)
+    ]
+
+
+class PayPointCache:
+    """
+    Thread-safe LRU cache of calculations for one pay point.
+
+    A pay point is a set of calculation inputs shared by many employees
+    (e.g. everyone on one grade): the salary, the contract flag and the
+    versions of the configuration and tax table in use. Keys include those
+    versions, so entries for an old configuration are never reused and
+    simply age out. Cached values are shared, so callers must not change them.
+    """
+
+    def __init__(self, maxsize=PAY_POINT_CACHE_SIZE):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        """Get a cached value (marking it recently used), or None."""
+        with self._lock:
+            if key not in self._entries:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return self._entries[key]
+
+    def put(self, key, value):
+        """Store a value, evicting the least recently used entries past maxsize."""
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def get_or_compute(self, key, compute):
+        """Get a cached value, calling compute() and caching its result on a miss."""
+        value = self.get(key)
+        if value is None:
+            value = compute()
+            self.put(key, value)
+        return value
+
+    def clear(self):
+        """Drop every entry and reset the statistics."""
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+
+# Shared by process_payroll, simulations and the statutory calculator
+pay_point_cache = PayPointCache()
+
+
+def payroll_total_amounts(batch):
+    """
+    Get each employee's contribution to the payroll totals from a computed batch.
+
+    Allowances are added up component by component in ALLOWANCE_COMPONENTS
+    order, the way process_payroll sums a row's allowances, so totals built
+    from these arrays match the processed payroll exactly.
+    """
+    allowances = np.zeros_like(batch['monthly_basic'])
+    for _, component in ALLOWANCE_COMPONENTS:
+        allowances = allowances + batch[component]
+
+    return {
+        'basic': batch['monthly_basic'],
+        'allowances': allowances,
+        'deductions': batch['monthly_pension'] + batch['monthly_nhf'],
+        'tax': batch['monthly_tax'],
+        'net': batch['monthly_net_pay'],
+        'gross': batch['monthly_gross'],
+        'employer_pension': batch['monthly_employer_pension'],
+    }
+
+
+def accumulate(total, values):
+    """
+    Add an array to a running total one value at a time, in order.
+
+    np.cumsum adds sequentially (np.sum does not), so the result is exactly
+    what a Python loop over the values would give.
+    """
+    values = np.asarray(values, dtype=float)
+    if not values.size:
+        return total
+    return float(np.cumsum(np.concatenate(([total], values)))[-1])
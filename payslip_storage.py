@@ -0,0 +1,127 @@
+"""
+Payslip PDF storage.
+
+Payslip PDFs are kept out of the database, in a blob store, under the
+SHA-256 hash of their contents; Payslip rows hold only the key
+(storage_key) and size. Identical PDFs are stored once, and a blob is
+never rewritten once it exists.
+
+The store is chosen with the PAYSLIP_STORAGE setting from PAYSLIP_STORES;
+the default keeps blobs on the local filesystem under PAYSLIP_STORAGE_PATH
+(the instance folder's payslips directory if not set). Payslips created
+before the store existed keep their PDF in Payslip.pdf_data until
+migrate_payslip_storage.py moves it out.
+"""
+import hashlib
+import io
+import os
+import tempfile
+
+from flask import current_app
+
+# Stores by (backend, path), so each process sets one up once
+_stores = {}
+
+
+class LocalPayslipStore:
+    """Blobs as files under a directory, fanned out by the first characters of their key."""
+
+    def __init__(self, root):
+        self.root = root
+
+    def path(self, key):
+        """Get the file a blob is kept in."""
+        return os.path.join(self.root, key[:2], key[2:4], key)
+
+    def put(self, data):
+        """
+        Store PDF bytes under the hash of their contents.
+
+        The file is written under a temporary name, synced and then renamed
+        into place, so a blob that exists is always complete.
+
+        Returns:
+            The blob's key
+        """
+        key = payslip_key(data)
+        path = self.path(key)
+        if os.path.exists(path):
+            return key
+
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as temp_file:
+                temp_file.write(data)
+                temp_file.flush()
+                os.fsync(temp_file.fileno())
+            os.replace(temp_path, path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.unlink(temp_path)
+            raise
+        return key
+
+    def open(self, key):
+        """Open a blob for reading, as a binary file."""
+        return open(self.path(key), 'rb')
+
+    def delete(self, key):
+        """Remove a blob, if it exists."""
+        try:
+            os.unlink(self.path(key))
+        except FileNotFoundError:
+            pass
+
+
+# Payslip stores by PAYSLIP_STORAGE name; each is created with the storage path
+PAYSLIP_STORES = {
+    'local': LocalPayslipStore,
+}
+
+
+def payslip_key(data):
+    """Get the key PDF bytes are stored under: the hex SHA-256 of their contents."""
+    return hashlib.sha256(data).hexdigest()
+
+
+def get_payslip_store():
+    """Get the configured payslip store."""
+    backend = current_app.config.get('PAYSLIP_STORAGE', 'local')
+    path = current_app.config.get('PAYSLIP_STORAGE_PATH') or os.path.join(current_app.instance_path, 'payslips')
+    if backend not in PAYSLIP_STORES:
+        raise ValueError(f"Unknown payslip storage: {backend}")
+
+    store = _stores.get((backend, path))
+    if store is None:
+        store = _stores[(backend, path)] = PAYSLIP_STORES[backend](path)
+    return store
+
+
+def open_payslip_pdf(payslip):
+    """Open a payslip's PDF for reading, from the store or, before it is migrated, the database."""
+    if payslip.storage_key is None:
+        return io.BytesIO(payslip.pdf_data)
+    return get_payslip_store().open(payslip.storage_key)
+
+
+def read_payslip_pdf(payslip):
+    """Get a payslip's PDF as bytes."""
+    with open_payslip_pdf(payslip) as pdf_file:
+        return pdf_file.read()
+
+
+def remove_payslip_pdf(storage_key):
+    """
+    Remove a deleted payslip's PDF from the store, unless another payslip has the same contents.
+
+    Call after the payslip's deletion is committed.
+    """
+    from app import db
+    from models import Payslip
+
+    if storage_key is None:
+        return
+    if db.session.query(Payslip.id).filter_by(storage_key=storage_key).first() is None:
+        get_payslip_store().delete(storage_key)
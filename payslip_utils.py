@@ -4,6 +4,10 @@ from datetime import datetime
 from reportlab.lib.pagesizes import A4
 from reportlab.lib import colors
 from reportlab.lib.units import cm
+from reportlab.lib.enums import TA_CENTER, TA_RIGHT
+from reportlab.lib.rl_accel import fp_str
+from reportlab.lib.utils import ImageReader
+from reportlab.pdfbase.pdfmetrics import stringWidth
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.platypus import (
     SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle, Image, 
@@ -14,11 +18,27 @@ from reportlab.graphics.shapes import Drawing, Line
 from flask import current_app
 import cairosvg
 from PIL import Image as PILImage
-import tempfile
 
 from app import db
+from bulk_utils import bulk_insert
 from models import Payslip, Employee, Payroll, PayrollItem, EmailLog, User, CompanySettings
-from utils import format_currency, generate_payslip_data
+from payslip_storage import get_payslip_store, open_payslip_pdf
+from utils import format_currency, generate_payslip_data, build_payslip_data
+
+# Payslips inserted (and committed) together when generating a whole payroll
+PAYSLIP_BATCH_SIZE = 200
+
+# PayrollItem amounts shown on a payslip
+PAYSLIP_ITEM_AMOUNTS = ('basic_salary', 'gross_pay', 'tax_amount', 'pension_amount', 'nhf_amount', 'other_deductions', 'net_pay')
+
+# Employee details shown on a payslip
+PAYSLIP_EMPLOYEE_FIELDS = ('first_name', 'last_name', 'employee_id', 'department', 'position', 'bank_name', 'account_number')
+
+# Company details shown on a payslip
+PAYSLIP_COMPANY_FIELDS = ('company_name', 'company_address', 'company_city', 'company_country', 'company_email', 'company_phone')
+
+# Company logo image data by (path, modification time), so it is read once rather than for every payslip
+_logo_cache = {}
 
 def convert_svg_to_png(svg_path):
     """
@@ -28,21 +48,84 @@ def convert_svg_to_png(svg_path):
         svg_path: Path to SVG file
         
     Returns:
-        Path to temporary PNG file
+        The PNG as bytes
     """
     try:
-        # Create a temporary file for the PNG output
-        fd, temp_path = tempfile.mkstemp(suffix='.png')
-        os.close(fd)
-        
-        # Convert SVG to PNG
-        cairosvg.svg2png(url=svg_path, write_to=temp_path)
-        
-        return temp_path
+        return cairosvg.svg2png(url=svg_path)
     except Exception as e:
         print(f"Error converting SVG to PNG: {e}")
         return None
 
+def load_company_logo(logo_path):
+    """
+    Get the image data of the company logo, rasterizing SVG logos to PNG.
+    
+    The result is cached on the path and modification time, so a logo is
+    converted once per process and a changed file is picked up again.
+    
+    Returns:
+        Image data as bytes, or None if the logo cannot be read
+    """
+    try:
+        key = (logo_path, os.path.getmtime(logo_path))
+    except OSError:
+        return None
+    
+    if key not in _logo_cache:
+        if logo_path.lower().endswith('.svg'):
+            image_data = convert_svg_to_png(logo_path)
+        else:
+            with open(logo_path, 'rb') as logo_file:
+                image_data = logo_file.read()
+        # Only the current logo is kept
+        _logo_cache.clear()
+        _logo_cache[key] = image_data
+    return _logo_cache[key]
+
+def clear_logo_cache():
+    """Forget the cached company logo, e.g. after a new one is uploaded."""
+    _logo_cache.clear()
+
+def payslip_company(company_settings):
+    """Copy the company details shown on payslips into plain data, with the full path of the logo (or None)."""
+    company = {name: getattr(company_settings, name) for name in PAYSLIP_COMPANY_FIELDS}
+    
+    logo_path = company_settings.company_logo
+    full_logo_path = os.path.join(current_app.root_path, logo_path) if logo_path else None
+    company['logo_path'] = full_logo_path if full_logo_path and os.path.exists(full_logo_path) else None
+    return company
+
+def payslip_snapshot(payslip_data):
+    """
+    Copy payslip data (see build_payslip_data) into plain values.
+    
+    The snapshot holds no ORM objects, so it can be rendered without the
+    database, in this process or another one.
+    """
+    payroll_item = payslip_data['payroll_item']
+    employee = payslip_data['employee']
+    payroll = payslip_data['payroll']
+    
+    return {
+        'payroll_item_id': payroll_item.id,
+        'payroll_item': {name: getattr(payroll_item, name) for name in PAYSLIP_ITEM_AMOUNTS},
+        'employee': dict({name: getattr(employee, name) for name in PAYSLIP_EMPLOYEE_FIELDS}, full_name=employee.full_name()),
+        'payroll': {
+            'name': payroll.name,
+            'period_start': payroll.period_start,
+            'period_end': payroll.period_end,
+            'payment_date': payroll.payment_date,
+        },
+        'allowances': dict(payslip_data['allowances']),
+        'deductions': dict(payslip_data['deductions']),
+        'has_adjustments': payslip_data['has_adjustments'],
+        'adjustment_totals': dict(payslip_data['adjustment_totals']),
+        'ytd': dict(payslip_data['ytd']),
+        'generated_on': payslip_data['generated_on'],
+        'payment_method': payslip_data['payment_method'],
+        'filename': f"payslip_{employee.employee_id}_{payroll.name.replace(' ', '_')}_{datetime.now().strftime('%Y%m%d')}.pdf",
+    }
+
 def create_payslip_pdf(payroll_item_id, user_id):
     """
     Generate a PDF payslip for a specific payroll item.
@@ -64,26 +147,26 @@ def create_payslip_pdf(payroll_item_id, user_id):
     if existing_payslip:
         return True, "Payslip already exists", existing_payslip.id
     
-    # Create a buffer for the PDF
-    buffer = io.BytesIO()
+    snapshot = payslip_snapshot(payslip_data)
+    pdf_data = render_payslip_pdf(snapshot, payslip_company(CompanySettings.get_settings()))
     
-    # Get payslip data
-    employee = payslip_data['employee']
-    payroll = payslip_data['payroll']
-    payroll_item = payslip_data['payroll_item']
-    
-    # Set up the document
-    doc = SimpleDocTemplate(
-        buffer, 
-        pagesize=A4,
-        rightMargin=2*cm, 
-        leftMargin=2*cm,
-        topMargin=2*cm, 
-        bottomMargin=2*cm,
-        title=f"Payslip - {employee.full_name()} - {payroll.name}"
+    # Create Payslip record, with the PDF in the payslip store
+    payslip = Payslip(
+        payroll_item_id=payroll_item_id,
+        storage_key=get_payslip_store().put(pdf_data),
+        filename=snapshot['filename'],
+        file_size=len(pdf_data),
+        is_emailed=False,
+        created_by_id=user_id
     )
     
-    # Define styles
+    db.session.add(payslip)
+    db.session.commit()
+    
+    return True, "Payslip generated successfully", payslip.id
+
+def payslip_stylesheet():
+    """Build the paragraph styles of a payslip, added to ReportLab's sample stylesheet."""
     styles = getSampleStyleSheet()
     styles.add(ParagraphStyle(
         name='CompanyName', 
@@ -134,104 +217,102 @@ def create_payslip_pdf(payroll_item_id, user_id):
         # Use italic parameter instead of Helvetica-Italic font name
         italic=True
     ))
+    return styles
+
+# Payslip styles, built once per process and shared by every payslip
+PAYSLIP_STYLES = payslip_stylesheet()
+
+PAYSLIP_MARGIN = 2*cm
+PAYSLIP_LOGO_SIZE = 2.5*cm
+
+EMPLOYEE_TABLE_STYLE = TableStyle([
+    ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
+    ('FONTNAME', (2, 0), (2, -1), 'Helvetica-Bold'),
+    ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+    ('GRID', (0, 0), (-1, -1), 0.5, colors.white),
+    ('BACKGROUND', (0, 0), (0, -1), colors.lightgrey),
+    ('BACKGROUND', (2, 0), (2, -1), colors.lightgrey),
+])
+
+# Earnings, deductions, net pay and year-to-date tables: a header row, amounts and a total row
+AMOUNTS_TABLE_STYLE = TableStyle([
+    ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+    ('FONTNAME', (0, -1), (-1, -1), 'Helvetica-Bold'),
+    ('BACKGROUND', (0, 0), (-1, 0), colors.lightgrey),
+    ('BACKGROUND', (0, -1), (-1, -1), colors.lightgrey),
+    ('GRID', (0, 0), (-1, -1), 0.5, colors.black),
+    ('ALIGN', (1, 0), (1, -1), 'RIGHT'),
+    ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+])
+
+def payslip_content(payslip_data, company):
+    """
+    List what a payslip shows, from top to bottom, for either renderer.
     
-    # Build the PDF content
-    elements = []
+    Each block is one of:
+        ('logo', image data)
+        ('paragraph', text, name of a PAYSLIP_STYLES style)
+        ('spacer', height)
+        ('table', rows, column widths, table style, columns holding the employee's values)
+    """
+    employee = payslip_data['employee']
+    payroll = payslip_data['payroll']
+    payroll_item = payslip_data['payroll_item']
     
-    # Get company settings from database
-    company_settings = CompanySettings.get_settings()
+    content = []
     
     # Company header
-    company_name = company_settings.company_name
-    company_address = company_settings.company_address
-    company_city = company_settings.company_city
-    company_country = company_settings.company_country
-    company_email = company_settings.company_email
-    company_phone = company_settings.company_phone
-    
-    # Try to add company logo if it exists
-    logo_path = company_settings.company_logo
-    full_logo_path = os.path.join(current_app.root_path, logo_path)
-    if logo_path and os.path.exists(full_logo_path):
-        # Check if it's an SVG file
-        if logo_path.lower().endswith('.svg'):
-            # Convert SVG to PNG
-            temp_png_path = convert_svg_to_png(full_logo_path)
-            if temp_png_path:
-                try:
-                    logo = Image(temp_png_path)
-                    logo.drawWidth = 2.5*cm
-                    logo.drawHeight = 2.5*cm
-                    elements.append(logo)
-                    
-                    # Schedule the temporary file for deletion
-                    # We don't remove it immediately because ReportLab needs it during PDF generation
-                    @current_app.teardown_appcontext
-                    def remove_temp_file(exception=None):
-                        try:
-                            if os.path.exists(temp_png_path):
-                                os.remove(temp_png_path)
-                        except Exception as e:
-                            print(f"Error removing temporary file: {e}")
-                except Exception as e:
-                    print(f"Error adding logo to PDF: {e}")
-        else:
-            # Use the image directly
-            try:
-                logo = Image(full_logo_path)
-                logo.drawWidth = 2.5*cm
-                logo.drawHeight = 2.5*cm
-                elements.append(logo)
-            except Exception as e:
-                print(f"Error adding logo to PDF: {e}")
+    company_name = company['company_name']
+    company_address = company['company_address']
+    company_city = company['company_city']
+    company_country = company['company_country']
+    company_email = company['company_email']
+    company_phone = company['company_phone']
+    
+    # Add company logo if it exists
+    logo_data = load_company_logo(company['logo_path']) if company['logo_path'] else None
+    if logo_data:
+        content.append(('logo', logo_data))
     
     # Company header
-    elements.append(Paragraph(company_name, styles['CompanyName']))
-    elements.append(Paragraph(f"{company_address}, {company_city}, {company_country}", styles['EmployeeInfo']))
-    elements.append(Paragraph(f"Email: {company_email} | Phone: {company_phone}", styles['EmployeeInfo']))
+    content.append(('paragraph', company_name, 'CompanyName'))
+    content.append(('paragraph', f"{company_address}, {company_city}, {company_country}", 'EmployeeInfo'))
+    content.append(('paragraph', f"Email: {company_email} | Phone: {company_phone}", 'EmployeeInfo'))
     
     # Divider line
-    elements.append(Spacer(1, 0.5*cm))
+    content.append(('spacer', 0.5*cm))
     
     # Payslip title with period
-    elements.append(Paragraph("PAYSLIP", styles['PayslipTitle']))
-    elements.append(Paragraph(
-        f"Period: {payroll.period_start.strftime('%d %B, %Y')} to {payroll.period_end.strftime('%d %B, %Y')}",
-        styles['EmployeeInfo']
+    content.append(('paragraph', "PAYSLIP", 'PayslipTitle'))
+    content.append((
+        'paragraph',
+        f"Period: {payroll['period_start'].strftime('%d %B, %Y')} to {payroll['period_end'].strftime('%d %B, %Y')}",
+        'EmployeeInfo'
     ))
-    elements.append(Paragraph(f"Payment Date: {payroll.payment_date.strftime('%d %B, %Y')}", styles['EmployeeInfo']))
-    elements.append(Paragraph(f"Generated On: {payslip_data['generated_on']}", styles['EmployeeInfo']))
+    content.append(('paragraph', f"Payment Date: {payroll['payment_date'].strftime('%d %B, %Y')}", 'EmployeeInfo'))
+    content.append(('paragraph', f"Generated On: {payslip_data['generated_on']}", 'EmployeeInfo'))
     
-    elements.append(Spacer(1, 0.5*cm))
+    content.append(('spacer', 0.5*cm))
     
     # Employee information
-    elements.append(Paragraph("EMPLOYEE INFORMATION", styles['SectionTitle']))
+    content.append(('paragraph', "EMPLOYEE INFORMATION", 'SectionTitle'))
     
     employee_data = [
-        ["Employee Name:", f"{employee.first_name} {employee.last_name}", "Employee ID:", employee.employee_id],
-        ["Department:", employee.department, "Position:", employee.position],
-        ["Bank Name:", employee.bank_name, "Account Number:", employee.account_number],
+        ["Employee Name:", f"{employee['first_name']} {employee['last_name']}", "Employee ID:", employee['employee_id']],
+        ["Department:", employee['department'], "Position:", employee['position']],
+        ["Bank Name:", employee['bank_name'], "Account Number:", employee['account_number']],
         ["Payment Method:", payslip_data['payment_method'], "", ""]
     ]
     
-    employee_table = Table(employee_data, colWidths=[4*cm, 5*cm, 3*cm, 4*cm])
-    employee_table.setStyle(TableStyle([
-        ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
-        ('FONTNAME', (2, 0), (2, -1), 'Helvetica-Bold'),
-        ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-        ('GRID', (0, 0), (-1, -1), 0.5, colors.white),
-        ('BACKGROUND', (0, 0), (0, -1), colors.lightgrey),
-        ('BACKGROUND', (2, 0), (2, -1), colors.lightgrey),
-    ]))
-    elements.append(employee_table)
+    content.append(('table', employee_data, [4*cm, 5*cm, 3*cm, 4*cm], EMPLOYEE_TABLE_STYLE, (1, 3)))
     
-    elements.append(Spacer(1, 0.5*cm))
+    content.append(('spacer', 0.5*cm))
     
     # Earnings section
-    elements.append(Paragraph("EARNINGS", styles['SectionTitle']))
+    content.append(('paragraph', "EARNINGS", 'SectionTitle'))
     
     earnings_data = [["Description", "Amount"]]
-    earnings_data.append(["Basic Salary", format_currency(payroll_item.basic_salary)])
+    earnings_data.append(["Basic Salary", format_currency(payroll_item['basic_salary'])])
     
     # Add allowances
     for allowance_name, amount in payslip_data['allowances'].items():
@@ -245,28 +326,18 @@ def create_payslip_pdf(payroll_item_id, user_id):
             earnings_data.append(["Reimbursements", format_currency(payslip_data['adjustment_totals']['reimbursements'])])
     
     # Calculate total earnings
-    total_earnings = payroll_item.gross_pay
+    total_earnings = payroll_item['gross_pay']
     if payslip_data['has_adjustments']:
         total_earnings += payslip_data['adjustment_totals']['bonuses'] + payslip_data['adjustment_totals']['reimbursements']
     
     earnings_data.append(["Total Earnings", format_currency(total_earnings)])
     
-    earnings_table = Table(earnings_data, colWidths=[8*cm, 8*cm])
-    earnings_table.setStyle(TableStyle([
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('FONTNAME', (0, -1), (-1, -1), 'Helvetica-Bold'),
-        ('BACKGROUND', (0, 0), (-1, 0), colors.lightgrey),
-        ('BACKGROUND', (0, -1), (-1, -1), colors.lightgrey),
-        ('GRID', (0, 0), (-1, -1), 0.5, colors.black),
-        ('ALIGN', (1, 0), (1, -1), 'RIGHT'),
-        ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-    ]))
-    elements.append(earnings_table)
+    content.append(('table', earnings_data, [8*cm, 8*cm], AMOUNTS_TABLE_STYLE, (1,)))
     
-    elements.append(Spacer(1, 0.5*cm))
+    content.append(('spacer', 0.5*cm))
     
     # Deductions section
-    elements.append(Paragraph("DEDUCTIONS", styles['SectionTitle']))
+    content.append(('paragraph', "DEDUCTIONS", 'SectionTitle'))
     
     deductions_data = [["Description", "Amount"]]
     
@@ -280,60 +351,118 @@ def create_payslip_pdf(payroll_item_id, user_id):
     
     # Calculate total deductions
     total_deductions = (
-        payroll_item.tax_amount + 
-        payroll_item.pension_amount + 
-        payroll_item.nhf_amount + 
-        payroll_item.other_deductions
+        payroll_item['tax_amount'] + 
+        payroll_item['pension_amount'] + 
+        payroll_item['nhf_amount'] + 
+        payroll_item['other_deductions']
     )
     if payslip_data['has_adjustments']:
         total_deductions += payslip_data['adjustment_totals']['additional_deductions']
     
     deductions_data.append(["Total Deductions", format_currency(total_deductions)])
     
-    deductions_table = Table(deductions_data, colWidths=[8*cm, 8*cm])
-    deductions_table.setStyle(TableStyle([
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('FONTNAME', (0, -1), (-1, -1), 'Helvetica-Bold'),
-        ('BACKGROUND', (0, 0), (-1, 0), colors.lightgrey),
-        ('BACKGROUND', (0, -1), (-1, -1), colors.lightgrey),
-        ('GRID', (0, 0), (-1, -1), 0.5, colors.black),
-        ('ALIGN', (1, 0), (1, -1), 'RIGHT'),
-        ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-    ]))
-    elements.append(deductions_table)
+    content.append(('table', deductions_data, [8*cm, 8*cm], AMOUNTS_TABLE_STYLE, (1,)))
     
-    elements.append(Spacer(1, 0.5*cm))
+    content.append(('spacer', 0.5*cm))
     
     # Net pay section
-    elements.append(Paragraph("NET PAY", styles['SectionTitle']))
+    content.append(('paragraph', "NET PAY", 'SectionTitle'))
     
     net_pay_data = [["Description", "Amount"]]
-    net_pay_data.append(["Gross Pay", format_currency(payroll_item.gross_pay)])
+    net_pay_data.append(["Gross Pay", format_currency(payroll_item['gross_pay'])])
     net_pay_data.append(["Total Deductions", format_currency(total_deductions)])
     
     # Display positive adjustments (bonuses and reimbursements) if any
     if payslip_data['has_adjustments'] and payslip_data['adjustment_totals']['positive_adjustments'] > 0:
         net_pay_data.append(["Positive Adjustments", format_currency(payslip_data['adjustment_totals']['positive_adjustments'])])
     
-    net_pay_data.append(["Net Pay", format_currency(payroll_item.net_pay)])
+    net_pay_data.append(["Net Pay", format_currency(payroll_item['net_pay'])])
+    
+    content.append(('table', net_pay_data, [8*cm, 8*cm], AMOUNTS_TABLE_STYLE, (1,)))
     
-    net_pay_table = Table(net_pay_data, colWidths=[8*cm, 8*cm])
-    net_pay_table.setStyle(TableStyle([
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('FONTNAME', (0, -1), (-1, -1), 'Helvetica-Bold'),
-        ('BACKGROUND', (0, 0), (-1, 0), colors.lightgrey),
-        ('BACKGROUND', (0, -1), (-1, -1), colors.lightgrey),
-        ('GRID', (0, 0), (-1, -1), 0.5, colors.black),
-        ('ALIGN', (1, 0), (1, -1), 'RIGHT'),
-        ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-    ]))
-    elements.append(net_pay_table)
+    content.append(('spacer', 0.5*cm))
     
-    elements.append(Spacer(1, 1*cm))
+    # Year-to-date section
+    ytd = payslip_data['ytd']
+    content.append(('paragraph', f"YEAR TO DATE ({payroll['period_end'].year})", 'SectionTitle'))
+    
+    ytd_data = [["Description", "Amount"]]
+    ytd_data.append(["Gross Pay", format_currency(ytd['gross_pay'])])
+    ytd_data.append(["PAYE Tax", format_currency(ytd['tax_amount'])])
+    ytd_data.append(["Pension", format_currency(ytd['pension_amount'])])
+    ytd_data.append(["NHF", format_currency(ytd['nhf_amount'])])
+    ytd_data.append(["Net Pay", format_currency(ytd['net_pay'])])
+    
+    content.append(('table', ytd_data, [8*cm, 8*cm], AMOUNTS_TABLE_STYLE, (1,)))
+    
+    content.append(('spacer', 1*cm))
     
     # Footer text
-    elements.append(Paragraph("This is a computer-generated document and does not require a signature.", styles['FooterText']))
-    elements.append(Paragraph(f"{company_name} | {datetime.now().year} © All Rights Reserved", styles['FooterText']))
+    content.append(('paragraph', "This is a computer-generated document and does not require a signature.", 'FooterText'))
+    content.append(('paragraph', f"{company_name} | {datetime.now().year} © All Rights Reserved", 'FooterText'))
+    
+    return content
+
+def render_payslip_pdf(payslip_data, company):
+    """
+    Render a payslip PDF from a payslip snapshot and the company details.
+    
+    Uses neither the database nor the Flask app, so it can run in a worker process.
+    Payslips are stamped onto a cached layout (render_stamped_payslip) when
+    it can reproduce the platypus layout, and laid out by platypus
+    (render_flowable_payslip) otherwise.
+    
+    Args:
+        payslip_data: Snapshot from payslip_snapshot
+        company: Company details from payslip_company
+        
+    Returns:
+        The PDF as bytes
+    """
+    content = payslip_content(payslip_data, company)
+    title = f"Payslip - {payslip_data['employee']['full_name']} - {payslip_data['payroll']['name']}"
+    
+    pdf_data = render_stamped_payslip(content, title)
+    if pdf_data is None:
+        pdf_data = render_flowable_payslip(content, title)
+    return pdf_data
+
+def render_flowable_payslip(content, title):
+    """Lay out and render payslip content with platypus."""
+    # Create a buffer for the PDF
+    buffer = io.BytesIO()
+    
+    # Set up the document
+    doc = SimpleDocTemplate(
+        buffer, 
+        pagesize=A4,
+        rightMargin=PAYSLIP_MARGIN, 
+        leftMargin=PAYSLIP_MARGIN,
+        topMargin=PAYSLIP_MARGIN, 
+        bottomMargin=PAYSLIP_MARGIN,
+        title=title
+    )
+    
+    elements = []
+    for kind, *block in content:
+        if kind == 'logo':
+            try:
+                logo = Image(io.BytesIO(block[0]))
+                logo.drawWidth = PAYSLIP_LOGO_SIZE
+                logo.drawHeight = PAYSLIP_LOGO_SIZE
+                elements.append(logo)
+            except Exception as e:
+                print(f"Error adding logo to PDF: {e}")
+        elif kind == 'paragraph':
+            text, style_name = block
+            elements.append(Paragraph(text, PAYSLIP_STYLES[style_name]))
+        elif kind == 'spacer':
+            elements.append(Spacer(1, block[0]))
+        else:
+            rows, col_widths, table_style, _ = block
+            table = Table(rows, colWidths=col_widths)
+            table.setStyle(table_style)
+            elements.append(table)
     
     # Build the PDF
     doc.build(elements)
@@ -342,63 +471,506 @@ def create_payslip_pdf(payroll_item_id, user_id):
     pdf_data = buffer.getvalue()
     buffer.close()
     
-    # Generate filename
-    filename = f"payslip_{employee.employee_id}_{payroll.name.replace(' ', '_')}_{datetime.now().strftime('%Y%m%d')}.pdf"
+    return pdf_data
+
+# Stamped layouts by the content they were laid out for, less the employee's values
+_stamped_layouts = {}
+
+# Layouts kept; a payroll run has a few, e.g. with and without adjustment rows
+STAMPED_LAYOUT_CACHE_SIZE = 64
+
+# Padding platypus frames leave inside the page margins
+FRAME_PADDING = 6
+
+# Table cells as platypus draws them by default: (font, size, leading) and padding
+CELL_FONT = ('Helvetica', 10, 12)
+CELL_PADDING = {'left': 6, 'right': 6, 'top': 3, 'bottom': 3}
+
+def render_stamped_payslip(content, title):
+    """
+    Render payslip content by stamping it onto a cached layout with the canvas API.
     
-    # Create Payslip record
-    payslip = Payslip(
-        payroll_item_id=payroll_item_id,
-        pdf_data=pdf_data,
-        filename=filename,
-        file_size=len(pdf_data),
-        is_emailed=False,
-        created_by_id=user_id
+    Laying a payslip out with platypus costs far more than drawing it, and
+    the payslips of a payroll run share their frame: company header, logo,
+    headings, row labels, table grids and footer. The layout of each
+    distinct frame is worked out once (stamped_layout), with each page's
+    frame already turned into PDF drawing operators; a payslip adds those
+    to its pages and draws only its own values, at the recorded positions.
+    
+    Returns:
+        The PDF as bytes, or None if platypus has to lay the payslip out
+    """
+    key = tuple(stamped_layout_key(block) for block in content)
+    if key in _stamped_layouts:
+        layout = _stamped_layouts[key]
+    else:
+        if len(_stamped_layouts) >= STAMPED_LAYOUT_CACHE_SIZE:
+            _stamped_layouts.clear()
+        layout = _stamped_layouts[key] = stamped_layout(content)
+    if layout is None:
+        return None
+    fonts, pages = layout
+    
+    buffer = io.BytesIO()
+    pdf = canvas.Canvas(buffer, pagesize=A4)
+    pdf.setTitle(title)
+    # Register the frame's fonts in the order the frame operators were made with (see stamped_layout)
+    for font in fonts:
+        pdf.setFont(*font)
+    
+    for images, frame, stamps in pages:
+        for image, x, y, width, height in images:
+            pdf.drawImage(image, x, y, width, height, mask='auto')
+        pdf.addLiteral(frame)
+        
+        values = pdf.beginText()
+        values.setFillColor(colors.black)
+        current_font = None
+        for font, align, x, y, block, row, col in stamps:
+            value = cell_text(content[block][1][row][col])
+            if '\n' in value:
+                # Would need a taller row than the layout has
+                return None
+            if font != current_font:
+                values.setFont(*font)
+                current_font = font
+            if align != 'LEFT':
+                x -= stringWidth(value, font[0], font[1]) * (1 if align == 'RIGHT' else 0.5)
+            values.setTextOrigin(x, y)
+            values.textOut(value)
+        pdf.drawText(values)
+        pdf.showPage()
+    pdf.save()
+    
+    pdf_data = buffer.getvalue()
+    buffer.close()
+    
+    return pdf_data
+
+def stamped_layout_key(block):
+    """Describe a content block without the employee's values, to look up its layout."""
+    if block[0] != 'table':
+        return block
+    kind, rows, col_widths, table_style, value_columns = block
+    return (
+        kind,
+        tuple(tuple(None if col in value_columns else cell for col, cell in enumerate(row)) for row in rows),
+        tuple(col_widths), id(table_style), value_columns
     )
+
+def stamped_layout(content):
+    """
+    Work out the layout of payslip content as platypus would lay it out.
     
-    db.session.add(payslip)
-    db.session.commit()
+    Blocks flow down the frame of render_flowable_payslip by platypus's
+    rules: the space before a block overlaps the space after the one above
+    it and is dropped at the top of a page, a block that does not fit moves
+    to a new page, and a table keeps the rows that fit and continues on the
+    next page. Only single-line paragraphs without markup and tables of
+    one-line cells are stamped, with text the standard fonts can encode;
+    anything else is left to platypus.
     
-    return True, "Payslip generated successfully", payslip.id
+    Returns:
+        Tuple of (fonts, pages), or None if the content cannot be stamped.
+        fonts are the (font, size) the frame operators use, to register in
+        the same order. Each page is a tuple of (logo images to draw, frame
+        PDF operators, value stamps as ((font, size, leading), alignment,
+        x, y, block index, row, column)).
+    """
+    page_width, page_height = A4
+    left = PAYSLIP_MARGIN + FRAME_PADDING
+    top = page_height - PAYSLIP_MARGIN - FRAME_PADDING
+    bottom = PAYSLIP_MARGIN + FRAME_PADDING
+    available_width = page_width - 2 * (PAYSLIP_MARGIN + FRAME_PADDING)
+    row_height = CELL_FONT[2] + CELL_PADDING['top'] + CELL_PADDING['bottom']
+    
+    # Each page as (images, frame drawing, stamps), frame drawing as ('rect', ...), ('lines', ...) and ('text', ...)
+    pages = [([], [], [])]
+    y = top
+    at_top = True
+    previous_space_after = 0
+    for index, (kind, *block) in enumerate(content):
+        space_before = space_after = 0
+        if kind == 'logo':
+            try:
+                logo = ImageReader(io.BytesIO(block[0]))
+            except Exception:
+                return None
+            width = height = PAYSLIP_LOGO_SIZE
+        elif kind == 'paragraph':
+            text, style_name = block
+            style = PAYSLIP_STYLES[style_name]
+            if not stampable_text(text) or '<' in text or '&' in text or ' '.join(text.split()) != text:
+                return None
+            width = stringWidth(text, style.fontName, style.fontSize)
+            if width > available_width - style.leftIndent - style.rightIndent or style.firstLineIndent:
+                return None
+            height = style.leading
+            space_before, space_after = style.spaceBefore, style.spaceAfter
+        elif kind == 'spacer':
+            width, height = 1, block[0]
+        else:
+            rows, col_widths, table_style, value_columns = block
+            cells = stamped_table_cells(rows, table_style, value_columns)
+            if cells is None:
+                return None
+            width = sum(col_widths)
+            height = row_height * len(rows)
+        
+        space = 0 if at_top else max(space_before - previous_space_after, 0)
+        if kind == 'table':
+            # Rows that fit stay on the page and the rest move on, as platypus splits tables
+            x = left + (available_width - width) / 2
+            first_row = 0
+            while first_row < len(rows):
+                if y - space - row_height * (len(rows) - first_row) >= bottom - 1e-6:
+                    last_row = len(rows)
+                else:
+                    last_row = first_row
+                    while last_row < len(rows) and row_height * (last_row - first_row + 1) <= y - bottom - space:
+                        last_row += 1
+                if last_row == first_row:
+                    if at_top:
+                        return None
+                    pages.append(([], [], []))
+                    y = top
+                    at_top = True
+                    space = 0
+                    continue
+                y -= space + row_height * (last_row - first_row)
+                _, frame, stamps = pages[-1]
+                stamp_table(frame, stamps, index, x, y, rows[first_row:last_row], col_widths, row_height,
+                            cells, value_columns, first_row)
+                first_row = last_row
+                at_top = False
+        else:
+            if y - space - height < bottom - 1e-6:
+                if at_top:
+                    return None
+                pages.append(([], [], []))
+                y = top
+                space = 0
+            y -= space + height
+            images, frame, _ = pages[-1]
+            
+            if kind == 'logo':
+                images.append((logo, left + (available_width - width) / 2, y, width, height))
+            elif kind == 'paragraph':
+                x = left + style.leftIndent
+                if style.alignment == TA_CENTER:
+                    x += (available_width - style.leftIndent - style.rightIndent - width) / 2
+                elif style.alignment == TA_RIGHT:
+                    x += available_width - style.leftIndent - style.rightIndent - width
+                font = (style.fontName, style.fontSize, style.leading)
+                frame.append(('text', font, style.textColor, x, y + height - style.fontSize, text))
+        
+        y -= space_after
+        previous_space_after = space_after
+        at_top = False
+    
+    # The frame operators name fonts as the document registers them, so they
+    # are made on a scratch canvas that registers the same fonts in the same
+    # order as every payslip's canvas
+    fonts = list(dict.fromkeys(item[1][:2] for _, frame, _ in pages for item in frame if item[0] == 'text'))
+    scratch = canvas.Canvas(io.BytesIO(), pagesize=A4)
+    for font in fonts:
+        scratch.setFont(*font)
+    return fonts, [(images, frame_operators(scratch, frame), stamps) for images, frame, stamps in pages]
+
+def frame_operators(scratch, frame):
+    """Turn a page's frame drawing into PDF operators, made with a scratch canvas's text and path objects."""
+    operators = ['q']
+    for kind, *item in frame:
+        if kind == 'rect':
+            color, x, y, width, height = item
+            operators.append(f"{fp_str(*color.rgb())} rg {fp_str(x, y, width, height)} re f")
+        elif kind == 'lines':
+            color, line_width, lines = item
+            path = scratch.beginPath()
+            for x1, y1, x2, y2 in lines:
+                path.moveTo(x1, y1)
+                path.lineTo(x2, y2)
+            operators.append(f"{fp_str(*color.rgb())} RG {fp_str(line_width)} w 1 J 1 j {path.getCode()} S")
+        else:
+            font, color, x, y, text = item
+            text_object = scratch.beginText(x, y)
+            text_object.setFillColor(color)
+            text_object.setFont(*font)
+            text_object.textOut(text)
+            operators.append(text_object.getCode())
+    operators.append('Q')
+    return '\n'.join(operators)
+
+def stampable_text(text):
+    """Check that text is in the standard fonts' encoding, so drawing it needs no substitute fonts."""
+    try:
+        text.encode('cp1252')
+    except UnicodeEncodeError:
+        return False
+    return True
+
+def stamped_table_cells(rows, table_style, value_columns):
+    """
+    Resolve a table's style to the font and alignment of each cell, its backgrounds and its grids.
+    
+    Returns:
+        Tuple of (cells, backgrounds, grids), or None if the table has
+        cells of more than one line, labels the standard fonts cannot
+        encode, or a style with commands stamping does not handle
+    """
+    for row in rows:
+        for col, cell in enumerate(row):
+            text = cell_text(cell)
+            if '\n' in text or (col not in value_columns and not stampable_text(text)):
+                return None
+    
+    row_count, col_count = len(rows), len(rows[0])
+    cells = [[dict(font=CELL_FONT[0], align='LEFT', valign='BOTTOM') for _ in range(col_count)] for _ in range(row_count)]
+    backgrounds = []
+    grids = []
+    attributes = {'FONTNAME': 'font', 'ALIGN': 'align', 'VALIGN': 'valign'}
+    for name, (first_col, first_row), (last_col, last_row), *args in table_style.getCommands():
+        cols = range(first_col % col_count, last_col % col_count + 1)
+        cell_rows = range(first_row % row_count, last_row % row_count + 1)
+        if name in attributes:
+            for row in cell_rows:
+                for col in cols:
+                    cells[row][col][attributes[name]] = args[0]
+        elif name == 'BACKGROUND':
+            backgrounds.append((cols, cell_rows, args[0]))
+        elif name == 'GRID':
+            grids.append((cols, cell_rows, args[0], args[1]))
+        else:
+            return None
+    
+    for row in cells:
+        for cell in row:
+            if cell['align'] not in ('LEFT', 'RIGHT', 'CENTER', 'CENTRE') or cell['valign'] not in ('TOP', 'MIDDLE', 'BOTTOM'):
+                return None
+    return cells, backgrounds, grids
+
+def cell_text(value):
+    """Get the text platypus draws for a table cell (nothing for None)."""
+    return '' if value is None else str(value)
+
+def stamp_table(frame, stamps, index, x, y, rows, col_widths, row_height, cells, value_columns, first_row=0):
+    """
+    Add a table's backgrounds, labels and grid to a page's frame drawing, and stamps for its values.
+    
+    rows may be the part of a split table starting at first_row; the cells,
+    backgrounds and grids of the whole table (see stamped_table_cells)
+    apply to it as platypus applies them to the parts of a split table.
+    """
+    cells, backgrounds, grids = cells
+    last_row = first_row + len(rows)
+    col_positions = [x]
+    for width in col_widths:
+        col_positions.append(col_positions[-1] + width)
+    # Top of each row (and the bottom of the last), numbered as in the whole table
+    row_positions = {row: y + row_height * (last_row - row) for row in range(first_row, last_row + 1)}
+    
+    for cols, cell_rows, color in backgrounds:
+        upper_row, lower_row = max(cell_rows[0], first_row), min(cell_rows[-1] + 1, last_row)
+        if upper_row < lower_row:
+            left, right = col_positions[cols[0]], col_positions[cols[-1] + 1]
+            upper, lower = row_positions[upper_row], row_positions[lower_row]
+            frame.append(('rect', color, left, lower, right - left, upper - lower))
+    
+    # Text placed as Table._drawCell places one line of text
+    font_size, leading = CELL_FONT[1:]
+    for row in range(first_row, last_row):
+        lower = row_positions[row + 1]
+        for col, cell in enumerate(cells[row]):
+            align = 'CENTER' if cell['align'] == 'CENTRE' else cell['align']
+            if align == 'LEFT':
+                text_x = col_positions[col] + CELL_PADDING['left']
+            elif align == 'RIGHT':
+                text_x = col_positions[col + 1] - CELL_PADDING['right']
+            else:
+                text_x = col_positions[col] + (col_widths[col] + CELL_PADDING['left'] - CELL_PADDING['right']) / 2
+            if cell['valign'] == 'BOTTOM':
+                text_y = lower + CELL_PADDING['bottom'] + leading - font_size
+            elif cell['valign'] == 'TOP':
+                text_y = lower + row_height - CELL_PADDING['top'] - font_size
+            else:
+                text_y = lower + (CELL_PADDING['bottom'] + row_height - CELL_PADDING['top'] + leading) / 2 - font_size
+            
+            font = (cell['font'], font_size, leading)
+            text = cell_text(rows[row - first_row][col])
+            if col in value_columns:
+                stamps.append((font, align, text_x, text_y, index, row, col))
+            elif text:
+                if align != 'LEFT':
+                    text_x -= stringWidth(text, cell['font'], font_size) * (1 if align == 'RIGHT' else 0.5)
+                frame.append(('text', font, colors.black, text_x, text_y, text))
+    
+    for cols, cell_rows, line_width, color in grids:
+        upper_row, lower_row = max(cell_rows[0], first_row), min(cell_rows[-1] + 1, last_row)
+        if upper_row < lower_row:
+            left, right = col_positions[cols[0]], col_positions[cols[-1] + 1]
+            upper, lower = row_positions[upper_row], row_positions[lower_row]
+            lines = [(left, row_positions[row], right, row_positions[row]) for row in range(upper_row, lower_row + 1)]
+            lines += [(col_positions[col], lower, col_positions[col], upper) for col in range(cols[0], cols[-1] + 2)]
+            frame.append(('lines', color, line_width, lines))
 
-def generate_all_payslips(payroll_id, user_id):
+def generate_all_payslips(payroll_id, user_id, progress=None, workers=1, batch_size=PAYSLIP_BATCH_SIZE):
     """
     Generate payslips for all employees in a payroll run.
     
+    Items that already have a payslip are skipped. The rest are loaded a
+    batch at a time and turned into plain snapshots (payslip_snapshot),
+    which are rendered in a pool of worker processes, or in this process
+    with one worker. At most a batch of snapshots is waiting to be rendered
+    at any time, so memory use does not grow with headcount. Payslips are
+    bulk inserted and committed a batch at a time, so a run that stops part
+    way can be resumed.
+    
     Args:
         payroll_id: ID of the payroll to generate payslips for
         user_id: ID of the user generating the payslips
+        progress: Optional callable(completed, total) called after each batch
+        workers: Number of processes rendering PDFs
+        batch_size: Number of items loaded, payslips rendered at once and
+            payslips inserted and committed together
         
     Returns:
         A tuple of (success, message, generated_count)
     """
-    # Get all payroll items for this payroll
-    payroll_items = PayrollItem.query.filter_by(payroll_id=payroll_id).all()
+    payroll = db.session.get(Payroll, payroll_id)
+    total = PayrollItem.query.filter_by(payroll_id=payroll_id).count() if payroll else 0
     
-    if not payroll_items:
+    if not total:
         return False, "No payroll items found for this payroll", 0
     
-    # Generate payslips for each item
-    generated_count = 0
-    for payroll_item in payroll_items:
-        success, _, _ = create_payslip_pdf(payroll_item.id, user_id)
-        if success:
-            generated_count += 1
+    existing = total - PayrollItem.query.filter(PayrollItem.payroll_id == payroll_id, without_payslip()).count()
+    snapshots = payroll_payslip_snapshots(payroll, batch_size)
+    company = payslip_company(CompanySettings.get_settings())
+    store = get_payslip_store()
+    
+    generated = 0
+    rows = []
+    for payroll_item_id, filename, pdf_data in render_payslips(snapshots, company, workers, batch_size):
+        rows.append({
+            'payroll_item_id': payroll_item_id,
+            'storage_key': store.put(pdf_data),
+            'filename': filename,
+            'file_size': len(pdf_data),
+            'is_emailed': False,
+            'created_by_id': user_id,
+        })
+        if len(rows) >= batch_size:
+            generated += save_payslips(rows)
+            rows = []
+            if progress:
+                progress(existing + generated, total)
+    generated += save_payslips(rows)
+    if progress:
+        progress(total, total)
+    
+    return True, f"Generated {existing + generated} payslips out of {total} payroll items", existing + generated
+
+def without_payslip():
+    """SQL criterion for payroll items that have no payslip yet."""
+    return ~db.select(Payslip.id).where(Payslip.payroll_item_id == PayrollItem.id).exists()
+
+def payroll_payslip_snapshots(payroll, batch_size=PAYSLIP_BATCH_SIZE):
+    """
+    Yield the payslip snapshots of a payroll's items that have no payslip yet, in item id order.
     
-    return True, f"Generated {generated_count} payslips out of {len(payroll_items)} payroll items", generated_count
+    Items are read a batch at a time by item id range: each batch loads its
+    items and employees in one query and their year-to-date totals in one
+    range query (see payroll_ytd), rather than several queries per item.
+    """
+    from ytd import payroll_ytd, YTD_AMOUNTS
+    
+    zeros = dict.fromkeys(YTD_AMOUNTS, 0.0)
+    last_id = 0
+    while True:
+        items = db.session.execute(
+            db.select(PayrollItem, Employee).join(
+                Employee, Employee.id == PayrollItem.employee_id
+            ).where(
+                PayrollItem.payroll_id == payroll.id, PayrollItem.id > last_id, without_payslip()
+            ).order_by(PayrollItem.id).limit(batch_size)
+        ).all()
+        if not items:
+            return
+        
+        employee_ids = [employee.id for _, employee in items]
+        ytd = payroll_ytd(payroll, min(employee_ids), max(employee_ids))
+        for payroll_item, employee in items:
+            yield payslip_snapshot(build_payslip_data(payroll_item, employee, payroll, ytd.get(employee.id, zeros)))
+        
+        if len(items) < batch_size:
+            return
+        last_id = items[-1][0].id
+
+def render_payslips(snapshots, company, workers=1, batch_size=PAYSLIP_BATCH_SIZE):
+    """
+    Render payslip snapshots, in a pool of worker processes when workers > 1.
+    
+    Snapshots are taken from the iterable as they are needed: no more than
+    batch_size are submitted to the pool and not yet returned at a time.
+    
+    Yields:
+        (payroll item id, filename, PDF bytes) in snapshot order
+    """
+    if workers <= 1:
+        for snapshot in snapshots:
+            yield snapshot['payroll_item_id'], snapshot['filename'], render_payslip_pdf(snapshot, company)
+        return
+    
+    from collections import deque
+    from concurrent.futures import ProcessPoolExecutor
+    
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_payslip_worker, initargs=(company,)) as executor:
+        pending = deque()
+        for snapshot in snapshots:
+            pending.append(executor.submit(render_payslip_in_worker, snapshot))
+            if len(pending) >= batch_size:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+# Company details of a payslip worker process, set by init_payslip_worker
+_worker_company = None
+
+def init_payslip_worker(company):
+    """Drop inherited database connections and keep the company details for rendering."""
+    global _worker_company
+    from utils import init_payroll_worker
+    
+    init_payroll_worker()
+    _worker_company = company
+
+def render_payslip_in_worker(snapshot):
+    """Worker entry point: render one snapshot with the worker's company details."""
+    return snapshot['payroll_item_id'], snapshot['filename'], render_payslip_pdf(snapshot, _worker_company)
+
+def save_payslips(rows):
+    """Bulk insert Payslip rows and commit them."""
+    if not rows:
+        return 0
+    bulk_insert(Payslip, rows)
+    db.session.commit()
+    return len(rows)
 
 def download_payslip(payslip_id):
     """
     Get a payslip PDF by ID.
     
+    The PDF is opened rather than read, so it can be streamed to the client.
+    
     Args:
         payslip_id: ID of the payslip to download
         
     Returns:
-        A tuple of (success, file_data, filename) or (False, error_message, None)
+        A tuple of (success, pdf_file, filename) or (False, error_message, None);
+        the caller closes pdf_file (send_file does)
     """
     payslip = Payslip.query.get(payslip_id)
     
     if not payslip:
         return False, "Payslip not found", None
     
-    return True, payslip.pdf_data, payslip.filename
\ No newline at end of file
+    return True, open_payslip_pdf(payslip), payslip.filename
\ No newline at end of file
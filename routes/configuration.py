@@ -1,9 +1,11 @@
-from flask import Blueprint, render_template, redirect, url_for, flash, request
+from flask import Blueprint, render_template, redirect, url_for, flash, request, jsonify, current_app
 from flask_login import login_required, current_user
 
 from app import db
 from models import SalaryConfiguration
 from forms import SalaryConfigurationForm
+from payroll_engine import salary_percentages
+from utils import simulate_salary_configuration
 
 configuration = Blueprint('configuration', __name__)
 
@@ -45,6 +47,7 @@ def create():
             utility_allowance_percentage=form.utility_allowance_percentage.data,
             meal_allowance_percentage=form.meal_allowance_percentage.data,
             clothing_allowance_percentage=form.clothing_allowance_percentage.data,
+            paye_method=form.paye_method.data,
             created_by_id=current_user.id,
             is_active=False
         )
@@ -81,6 +84,7 @@ def edit(id):
         config.utility_allowance_percentage = form.utility_allowance_percentage.data
         config.meal_allowance_percentage = form.meal_allowance_percentage.data
         config.clothing_allowance_percentage = form.clothing_allowance_percentage.data
+        config.paye_method = form.paye_method.data
         
         db.session.commit()
         
@@ -135,4 +139,54 @@ def delete(id):
     db.session.commit()
     
     flash(f'Salary configuration "{config_name}" deleted successfully.', 'success')
-    return redirect(url_for('configuration.index'))
\ No newline at end of file
+    return redirect(url_for('configuration.index'))
+
+@configuration.route('/simulate')
+@login_required
+def simulate():
+    """
+    Preview, as JSON, the effect of a salary split on every payable employee.
+    
+    Percentages are given as query arguments (basic, transport, housing,
+    utility, meal, clothing); any left out keep the active configuration's
+    value. paye_method and payroll (whose period is used) are optional.
+    """
+    percentages = salary_percentages(SalaryConfiguration.query.filter_by(is_active=True).first())
+    for name in percentages:
+        percentages[name] = request.args.get(name, percentages[name], type=float)
+    
+    return simulation_response(percentages, request.args.get('paye_method'))
+
+@configuration.route('/simulate/<int:id>')
+@login_required
+def simulate_saved(id):
+    """Preview, as JSON, the effect of activating a saved salary configuration."""
+    config = SalaryConfiguration.query.get_or_404(id)
+    
+    return simulation_response(salary_percentages(config), config.paye_method)
+
+def simulation_response(percentages, paye_method):
+    """Check a candidate split and return its comparison with the active configuration."""
+    if paye_method not in (None, 'annualised', 'cumulative'):
+        return jsonify({'error': f'Unknown PAYE method: {paye_method}'}), 400
+    
+    if percentages['basic'] <= 0 or any(value < 0 for value in percentages.values()):
+        return jsonify({'error': 'Basic salary must be above 0% and no component below 0%'}), 400
+    
+    total = sum(percentages.values())
+    if abs(total - 100.0) > 0.01:  # Same tolerance as the configuration form
+        return jsonify({'error': f'Total percentage must be exactly 100%. Current total: {total:.2f}%'}), 400
+    
+    try:
+        result = simulate_salary_configuration(
+            percentages,
+            paye_method=paye_method,
+            payroll_id=request.args.get('payroll', type=int),
+            max_changes=request.args.get('changes', 20, type=int),
+            chunk_size=current_app.config.get('PAYROLL_CHUNK_SIZE', 2000)
+        )
+    except ValueError as e:
+        # Cumulative PAYE on a payroll that is not monthly
+        return jsonify({'error': str(e)}), 400
+    
+    return jsonify(result)
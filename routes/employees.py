@@ -9,6 +9,7 @@ from app import db
 from models import Employee, CompensationHistory, Bank
 from forms import EmployeeForm, SearchForm, CompensationChangeForm
 from utils import format_currency
+from compensation import ensure_compensation_history, initial_compensation
 
 employees = Blueprint('employees', __name__)
 
@@ -90,6 +91,7 @@ def create():
             department=form.department.data,
             position=form.position.data,
             date_hired=form.date_hired.data,
+            date_terminated=form.date_terminated.data,
             employment_status=form.employment_status.data,
             is_contract=form.is_contract.data,
             bank_id=form.bank_id.data,
@@ -102,6 +104,10 @@ def create():
         )
         
         db.session.add(employee)
+        db.session.flush()
+        
+        # Record the starting salary, so payroll has it to pay up to any later change
+        db.session.add(initial_compensation(employee, current_user.id))
         db.session.commit()
         
         flash(f'Employee {employee.full_name()} added successfully.', 'success')
@@ -139,13 +145,15 @@ def edit(id):
         
         # Check if salary changed, if so, record in compensation history
         if employee.basic_salary != form.basic_salary.data:
-            # Create compensation history record
+            # Keep the salary paid so far in the history, then record the change
+            ensure_compensation_history(employee, current_user.id, date.today())
             compensation_history = CompensationHistory(
                 employee_id=employee.id,
                 effective_date=date.today(),  # Default to today, can be changed via compensation form
                 basic_salary=form.basic_salary.data,
                 changed_by_id=current_user.id,
-                change_reason="Updated during employee edit"
+                change_reason="Updated during employee edit",
+                date_applied=datetime.utcnow()
             )
             db.session.add(compensation_history)
         
@@ -168,6 +176,7 @@ def edit(id):
         employee.department = form.department.data
         employee.position = form.position.data
         employee.date_hired = form.date_hired.data
+        employee.date_terminated = form.date_terminated.data
         employee.employment_status = form.employment_status.data
         employee.is_contract = form.is_contract.data
         employee.bank_id = form.bank_id.data
@@ -200,7 +209,8 @@ def compensation(id):
     form = CompensationChangeForm()
     
     if form.validate_on_submit():
-        # Create new compensation history record
+        # Keep the salary paid so far in the history, then record the change
+        ensure_compensation_history(employee, current_user.id, form.effective_date.data)
         compensation_history = CompensationHistory(
             employee_id=employee.id,
             effective_date=form.effective_date.data,
@@ -209,9 +219,11 @@ def compensation(id):
             change_reason=form.change_reason.data
         )
         
-        # Update employee's current salary if effective date is today
+        # Update employee's current salary if effective date is today; later
+        # changes are applied on their effective date by apply_compensation_changes.py
         if form.effective_date.data <= date.today():
             employee.basic_salary = form.basic_salary.data
+            compensation_history.date_applied = datetime.utcnow()
         
         db.session.add(compensation_history)
         db.session.commit()
@@ -329,6 +341,7 @@ def bulk_upload():
             
             # Track success, errors and duplicates
             success_count = 0
+            new_employees = []
             error_count = 0
             duplicate_count = 0
             errors = []
@@ -460,6 +473,7 @@ def bulk_upload():
                     )
                     
                     db.session.add(employee)
+                    new_employees.append(employee)
                     success_count += 1
                     
                 except Exception as e:
@@ -468,6 +482,9 @@ def bulk_upload():
                     
             # Commit to database if there were successful entries
             if success_count > 0:
+                # Record their starting salaries, now that they have ids
+                db.session.flush()
+                db.session.add_all([initial_compensation(employee, current_user.id) for employee in new_employees])
                 db.session.commit()
                 
             # Display results
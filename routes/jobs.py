@@ -0,0 +1,13 @@
+from flask import Blueprint, jsonify
+from flask_login import login_required
+
+from models import Job
+
+jobs = Blueprint('jobs', __name__)
+
+@jobs.route('/<int:id>/status')
+@login_required
+def status(id):
+    """Get a background job's status and progress as JSON."""
+    job = Job.query.get_or_404(id)
+    return jsonify(job.to_dict())
@@ -1,4 +1,4 @@
-from flask import Blueprint, render_template, redirect, url_for, flash, request, jsonify, Response
+from flask import Blueprint, render_template, redirect, url_for, flash, request, jsonify, Response, current_app
 from flask_login import login_required, current_user
 from datetime import datetime
 import csv, io
@@ -9,7 +9,9 @@ from forms import (
     PayrollForm, PayrollProcessForm, PayrollStatusForm, 
     PayrollAdjustmentForm
 )
-from utils import format_currency, process_payroll, generate_payslip_data, generate_payment_schedule
+from utils import format_currency, format_tax_details, generate_payslip_data, generate_payment_schedule, simulate_payroll
+from jobs import submit_job, get_active_job, get_latest_job
+from ytd import post_payroll_ytd, reverse_payroll_ytd, POSTED_STATUSES
 
 payroll = Blueprint('payroll', __name__)
 
@@ -79,12 +81,16 @@ def view(id):
     status_form.payroll_id.data = payroll.id
     status_form.status.data = payroll.status
     
+    # Latest background job for this payroll, for the progress panel
+    job = get_latest_job(payroll.id)
+    
     return render_template(
         'payroll/view.html', 
         payroll=payroll,
         payroll_items=payroll_items,
         process_form=process_form,
         status_form=status_form,
+        job=job,
         format_currency=format_currency
     )
 
@@ -97,19 +103,112 @@ def process():
     if form.validate_on_submit():
         payroll_id = int(form.payroll_id.data)
         
-        # Process the payroll
-        success, message = process_payroll(payroll_id)
+        if get_active_job(payroll_id):
+            flash('This payroll already has a job in progress.', 'warning')
+            return redirect(url_for('payroll.view', id=payroll_id))
+        
+        # Queue the payroll for the background worker
+        job = submit_job('process_payroll', current_user.id, payroll_id)
         
-        if success:
-            flash(message, 'success')
+        if job.status == 'Completed':
+            flash(job.message, 'success')
+        elif job.status == 'Failed':
+            flash(f'Error processing payroll: {job.message}', 'danger')
         else:
-            flash(f'Error processing payroll: {message}', 'danger')
+            flash('Payroll processing has started. Progress is shown below.', 'info')
             
         return redirect(url_for('payroll.view', id=payroll_id))
     
     flash('Invalid form submission.', 'danger')
     return redirect(url_for('payroll.index'))
 
+@payroll.route('/simulate/<int:id>')
+@login_required
+def simulate(id):
+    """Preview a payroll's totals, department breakdown and outliers as JSON without processing it."""
+    payroll = Payroll.query.get_or_404(id)
+    
+    try:
+        result = simulate_payroll(
+            payroll.id,
+            sample_size=request.args.get('sample', 20, type=int),
+            outlier_threshold=request.args.get('threshold', 3.0, type=float),
+            max_outliers=request.args.get('outliers', 20, type=int),
+            chunk_size=current_app.config.get('PAYROLL_CHUNK_SIZE', 2000)
+        )
+    except ValueError as e:
+        # Cumulative PAYE on a payroll that is not monthly
+        return jsonify({'error': str(e)}), 400
+    
+    return jsonify(result)
+
+@payroll.route('/back-pay/<int:id>')
+@login_required
+def back_pay(id):
+    """Preview the back pay owed for earlier payrolls as JSON without posting it."""
+    from backpay import calculate_back_pay, BACK_PAY_AMOUNTS
+    
+    payroll = Payroll.query.get_or_404(id)
+    arrears = calculate_back_pay(payroll)
+    
+    return jsonify({
+        'employee_count': len(arrears),
+        'totals': {name: sum(employee[name] for employee in arrears) for name in BACK_PAY_AMOUNTS},
+        'arrears': arrears
+    })
+
+@payroll.route('/back-pay/<int:id>/post', methods=['POST'])
+@login_required
+def post_back_pay(id):
+    """Post the back pay owed for earlier payrolls as adjustments on a payroll."""
+    payroll = Payroll.query.get_or_404(id)
+    
+    if payroll.status not in ['Active', 'Processing']:
+        flash('Back pay can only be posted to active or processing payrolls.', 'danger')
+        return redirect(url_for('payroll.view', id=payroll.id))
+    
+    if get_active_job(payroll.id):
+        flash('This payroll already has a job in progress.', 'warning')
+        return redirect(url_for('payroll.view', id=payroll.id))
+    
+    job = submit_job('post_back_pay', current_user.id, payroll.id)
+    
+    if job.status == 'Completed':
+        flash(job.message, 'success')
+    elif job.status == 'Failed':
+        flash(f'Error posting back pay: {job.message}', 'danger')
+    else:
+        flash('Back pay is being calculated. Progress is shown below.', 'info')
+    
+    return redirect(url_for('payroll.view', id=payroll.id))
+
+@payroll.route('/import-adjustments/<int:id>', methods=['POST'])
+@login_required
+def import_adjustments(id):
+    """Add adjustments to a payroll's items in bulk from a CSV or JSON file."""
+    from adjustment_import import read_adjustment_file, import_payroll_adjustments
+    
+    payroll = Payroll.query.get_or_404(id)
+    
+    if get_active_job(payroll.id):
+        flash('This payroll already has a job in progress.', 'warning')
+        return redirect(url_for('payroll.view', id=payroll.id))
+    
+    file = request.files.get('file')
+    if not file or file.filename == '':
+        flash('No file selected.', 'danger')
+        return redirect(url_for('payroll.view', id=payroll.id))
+    
+    try:
+        lines = read_adjustment_file(file.stream, file.filename)
+    except (ValueError, UnicodeDecodeError, csv.Error) as e:
+        flash(f'Error reading adjustment file: {str(e)}', 'danger')
+        return redirect(url_for('payroll.view', id=payroll.id))
+    
+    success, message = import_payroll_adjustments(payroll.id, lines, current_user.id)
+    flash(message, 'success' if success else 'danger')
+    return redirect(url_for('payroll.view', id=payroll.id))
+
 @payroll.route('/delete/<int:id>', methods=['POST'])
 @login_required
 def delete(id):
@@ -162,9 +261,9 @@ def update_status():
         elif old_status == 'Processing' and new_status not in ['Processing', 'Completed']:
             valid_transition = False
             error_message = "A processing payroll can only be moved to Completed status"
-        elif old_status == 'Completed' and new_status not in ['Completed', 'Closed']:
+        elif old_status == 'Completed' and new_status not in ['Completed', 'Closed', 'Cancelled']:
             valid_transition = False
-            error_message = "A completed payroll can only be moved to Closed status"
+            error_message = "A completed payroll can only be moved to Closed or Cancelled status"
         elif old_status in ['Closed', 'Cancelled'] and new_status != old_status:
             valid_transition = False
             error_message = f"A {old_status.lower()} payroll cannot change status"
@@ -181,6 +280,15 @@ def update_status():
         elif old_status == 'Active' and new_status != 'Active':
             payroll.is_active = False
             
+        # Keep the year-to-date totals in step, in the same transaction; a payroll
+        # may be closed straight from Active, and is posted once whichever way it gets
+        # there; a completed payroll that is cancelled (e.g. a run reversed with the
+        # bank) is taken off again
+        if new_status in POSTED_STATUSES:
+            post_payroll_ytd(payroll)
+        elif new_status == 'Cancelled':
+            reverse_payroll_ytd(payroll)
+            
         # Update the payroll status
         payroll.status = new_status
         payroll.date_updated = datetime.utcnow()
@@ -215,7 +323,7 @@ def view_payroll_item(id):
     # JSON fields are stored as dictionaries
     allowances_dict = payroll_item.allowances or {}
     deductions_dict = payroll_item.deductions or {}
-    tax_details_dict = payroll_item.tax_details or {}
+    tax_details_dict = format_tax_details(payroll_item.tax_details, payroll_item.tax_amount)
     
     # Create a new adjustment form if the payroll is in an editable state
     adjustment_form = None
@@ -273,11 +381,8 @@ def add_adjustment():
         
         db.session.add(adjustment)
         
-        # Mark the payroll item as adjusted
-        payroll_item.is_adjusted = True
-        
-        # Recalculate net pay
-        payroll_item.recalculate_net_pay()
+        # Add it to the item's adjustment totals and recalculate net pay
+        payroll_item.add_adjustment(adjustment)
         
         db.session.commit()
         
@@ -287,6 +392,28 @@ def add_adjustment():
     flash('Invalid form submission.', 'danger')
     return redirect(url_for('payroll.index'))
 
+@payroll.route('/delete-adjustment/<int:id>', methods=['POST'])
+@login_required
+def delete_adjustment(id):
+    """Delete an adjustment from a payroll item."""
+    adjustment = PayrollAdjustment.query.get_or_404(id)
+    payroll_item = PayrollItem.query.get_or_404(adjustment.payroll_item_id)
+    payroll = Payroll.query.get_or_404(payroll_item.payroll_id)
+    
+    # Verify the payroll is in a state that allows adjustments
+    if payroll.status not in ['Active', 'Processing']:
+        flash('Adjustments can only be removed from active or processing payrolls.', 'danger')
+        return redirect(url_for('payroll.view_payroll_item', id=payroll_item.id))
+    
+    # Take it off the item's adjustment totals and recalculate net pay
+    payroll_item.remove_adjustment(adjustment)
+    db.session.delete(adjustment)
+    
+    db.session.commit()
+    
+    flash(f'Adjustment removed. Net pay updated to {format_currency(payroll_item.net_pay)}.', 'success')
+    return redirect(url_for('payroll.view_payroll_item', id=payroll_item.id))
+
 @payroll.route('/payslip/<int:id>')
 @login_required
 def payslip(id):
@@ -2,13 +2,14 @@ from datetime import datetime
 from flask import Blueprint, render_template, redirect, url_for, flash, request, jsonify, send_file, current_app, Response
 from flask_login import login_required, current_user
 from werkzeug.exceptions import NotFound
-import io
 
 from app import db
 from models import Payslip, PayrollItem, Payroll, Employee, EmailLog
 from utils import format_currency
-from payslip_utils import create_payslip_pdf, generate_all_payslips, download_payslip
-from email_utils import send_payslip_email, send_all_payslips, retry_failed_emails
+from payslip_utils import create_payslip_pdf, download_payslip
+from payslip_storage import remove_payslip_pdf
+from email_utils import send_payslip_email, retry_failed_emails
+from jobs import submit_job, get_active_job
 
 payslips = Blueprint('payslips', __name__)
 
@@ -121,8 +122,9 @@ def download(id):
         flash(data, 'danger')
         return redirect(url_for('payslips.index'))
     
+    # Streamed from the payslip store in chunks
     return send_file(
-        io.BytesIO(data),
+        data,
         download_name=filename,
         as_attachment=True,
         mimetype='application/pdf'
@@ -152,13 +154,19 @@ def generate_all(payroll_id):
     """Generate payslips for all employees in a payroll run."""
     payroll = Payroll.query.get_or_404(payroll_id)
     
-    # Generate payslips
-    success, message, count = generate_all_payslips(payroll_id, current_user.id)
+    if get_active_job(payroll_id):
+        flash("This payroll already has a job in progress.", 'warning')
+        return redirect(url_for('payroll.view', id=payroll_id))
     
-    if success:
-        flash(f"{message}", 'success')
+    # Generate payslips in the background
+    job = submit_job('generate_payslips', current_user.id, payroll_id)
+    
+    if job.status == 'Completed':
+        flash(f"{job.message}", 'success')
+    elif job.status == 'Failed':
+        flash(f"Error: {job.message}", 'danger')
     else:
-        flash(f"Error: {message}", 'danger')
+        flash("Payslip generation has started. Progress is shown below.", 'info')
     
     return redirect(url_for('payroll.view', id=payroll_id))
 
@@ -213,13 +221,19 @@ def send_all(payroll_id):
     """Send payslips to all employees in a payroll run."""
     payroll = Payroll.query.get_or_404(payroll_id)
     
-    # Send payslips
-    success, message, sent, failed = send_all_payslips(payroll_id)
+    if get_active_job(payroll_id):
+        flash("This payroll already has a job in progress.", 'warning')
+        return redirect(url_for('payroll.view', id=payroll_id))
     
-    if success:
-        flash(message, 'success')
+    # Send payslips in the background
+    job = submit_job('send_payslips', current_user.id, payroll_id)
+    
+    if job.status == 'Completed':
+        flash(job.message, 'success')
+    elif job.status == 'Failed':
+        flash(f"Error: {job.message}", 'danger')
     else:
-        flash(f"Error: {message}", 'danger')
+        flash("Sending payslips has started. Progress is shown below.", 'info')
     
     return redirect(url_for('payroll.view', id=payroll_id))
 
@@ -229,25 +243,26 @@ def resend_all(payroll_id):
     """Resend all payslips for a payroll run, including already sent ones."""
     payroll = Payroll.query.get_or_404(payroll_id)
     
-    # Get all payslips for this payroll
-    payslips = Payslip.query.join(PayrollItem).filter(PayrollItem.payroll_id == payroll_id).all()
+    # Check there are payslips for this payroll
+    payslip_count = Payslip.query.join(PayrollItem).filter(PayrollItem.payroll_id == payroll_id).count()
     
-    if not payslips:
+    if not payslip_count:
         flash("No payslips found for this payroll", 'warning')
         return redirect(url_for('payroll.view', id=payroll_id))
     
-    # Temporarily mark all payslips as not sent
-    for payslip in payslips:
-        payslip.email_status = 'pending'
-    db.session.commit()
+    if get_active_job(payroll_id):
+        flash("This payroll already has a job in progress.", 'warning')
+        return redirect(url_for('payroll.view', id=payroll_id))
     
-    # Send payslips
-    success, message, sent, failed = send_all_payslips(payroll_id)
+    # Resend payslips in the background; the job marks them all as not sent first
+    job = submit_job('send_payslips', current_user.id, payroll_id, resend=True)
     
-    if success:
-        flash(f"Resent {sent} payslips, {failed} failed", 'success')
+    if job.status == 'Completed':
+        flash(job.message, 'success')
+    elif job.status == 'Failed':
+        flash(f"Error: {job.message}", 'danger')
     else:
-        flash(f"Error: {message}", 'danger')
+        flash("Resending payslips has started. Progress is shown below.", 'info')
     
     return redirect(url_for('payroll.view', id=payroll_id))
 
@@ -288,9 +303,11 @@ def delete(id):
     # Delete email logs first (maintain referential integrity)
     EmailLog.query.filter_by(payslip_id=id).delete()
     
-    # Delete the payslip
+    # Delete the payslip, then its PDF
+    storage_key = payslip.storage_key
     db.session.delete(payslip)
     db.session.commit()
+    remove_payslip_pdf(storage_key)
     
     flash("Payslip deleted successfully.", 'success')
     
@@ -12,6 +12,7 @@ from app import db
 from models import CompanySettings, EmailLog, Payslip, Payroll
 from forms import CompanySettingsForm
 from email_utils import send_payslip_email, retry_failed_emails
+from payslip_utils import clear_logo_cache
 
 # Create blueprint
 settings = Blueprint('settings', __name__)
@@ -137,6 +138,7 @@ def upload_logo():
     company_settings.company_logo = relative_path
     company_settings.last_updated_by_id = current_user.id
     db.session.commit()
+    clear_logo_cache()
     
     flash('Company logo updated successfully.', 'success')
     return redirect(url_for('settings.company'))
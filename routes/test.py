@@ -157,11 +157,8 @@ def add_test_adjustment(payroll_id):
         created_by_id=User.query.first().id
     )
     
-    # Mark the payroll item as adjusted
-    payroll_item.is_adjusted = True
-    
-    # Recalculate net pay
-    payroll_item.recalculate_net_pay()
+    # Add it to the item's adjustment totals and recalculate net pay
+    payroll_item.add_adjustment(adjustment)
     
     db.session.add(adjustment)
     db.session.commit()
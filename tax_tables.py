@@ -0,0 +1,149 @@
+"""
+Compiled PAYE tax tables.
+
+A TaxTable turns the ordered tax brackets into cumulative band boundaries
+with the tax already due at each boundary, so the tax on any income is a
+bisect lookup plus one multiply-add. The compiled table is cached for the
+whole process with a version stamp of the brackets it was compiled from.
+Lookups use it without touching the database; at most every
+TAX_TABLE_CHECK_SECONDS the stamp is read again, and only when it has
+changed (another worker, a script or plain SQL edited the brackets) are
+the brackets read and compiled again.
+"""
+import bisect
+import hashlib
+import time
+
+import numpy as np
+
+# Default Nigerian tax brackets, used when none are defined in the database
+DEFAULT_TAX_BRACKETS = [
+    {'lower_limit': 0, 'upper_limit': 300000, 'rate': 7},
+    {'lower_limit': 300000, 'upper_limit': 600000, 'rate': 11},
+    {'lower_limit': 600000, 'upper_limit': 1100000, 'rate': 15},
+    {'lower_limit': 1100000, 'upper_limit': 1600000, 'rate': 19},
+    {'lower_limit': 1600000, 'upper_limit': 3200000, 'rate': 21},
+    {'lower_limit': 3200000, 'upper_limit': None, 'rate': 24}
+]
+
+
+class TaxTable:
+    """
+    PAYE brackets compiled for O(log n) lookup.
+
+    Bands are laid end to end by width, exactly as calculate_paye_tax has
+    always walked them, so the result does not depend on the brackets'
+    lower limits being contiguous. Income above a capped final bracket is
+    untaxed, matching the original loop.
+    """
+
+    def __init__(self, brackets):
+        self.brackets = []
+        self.starts = []
+        self.widths = []
+        self.rates = []
+        self.cumulative_tax = []
+
+        start = 0.0
+        tax = 0.0
+        for lower, upper, rate in brackets:
+            width = float('inf') if upper is None else upper - lower
+            self.brackets.append((lower, upper, rate))
+            self.starts.append(start)
+            self.widths.append(width)
+            self.rates.append(rate / 100)
+            self.cumulative_tax.append(tax)
+            if upper is None:
+                break
+            tax += width * (rate / 100)
+            start += width
+
+        # Lookup arrays include a 0% band past a capped final bracket
+        self._lookup_starts = list(self.starts)
+        self._lookup_rates = list(self.rates)
+        self._lookup_tax = list(self.cumulative_tax)
+        if not self.brackets or self.brackets[-1][1] is not None:
+            self._lookup_starts.append(start)
+            self._lookup_rates.append(0.0)
+            self._lookup_tax.append(tax)
+
+        self._starts_array = np.array(self._lookup_starts)
+        self._rates_array = np.array(self._lookup_rates)
+        self._tax_array = np.array(self._lookup_tax)
+
+        # Content-based version stamp, stable across processes and restarts
+        self.version = hashlib.sha1(repr(self.brackets).encode('utf-8')).hexdigest()[:12]
+
+    def __repr__(self):
+        return f'<TaxTable {self.version}: {len(self.brackets)} brackets>'
+
+    def tax_for(self, annual_taxable_income):
+        """Get the annual tax due on an income."""
+        if annual_taxable_income <= 0:
+            return 0.0
+        index = bisect.bisect_right(self._lookup_starts, annual_taxable_income) - 1
+        return self._lookup_tax[index] + (annual_taxable_income - self._lookup_starts[index]) * self._lookup_rates[index]
+
+    def tax_for_array(self, annual_taxable_income):
+        """Get the annual tax due on each income in an array."""
+        incomes = np.asarray(annual_taxable_income, dtype=float)
+        index = np.maximum(np.searchsorted(self._starts_array, incomes, side='right') - 1, 0)
+        tax = self._tax_array[index] + (incomes - self._starts_array[index]) * self._rates_array[index]
+        return np.where(incomes > 0, tax, 0.0)
+
+    def breakdown(self, annual_taxable_income):
+        """
+        Split an income across the brackets it reaches.
+
+        Returns a list of (bracket index, taxable amount, tax) tuples.
+        """
+        details = []
+        for index, start in enumerate(self.starts):
+            if annual_taxable_income <= start:
+                break
+            taxable = min(annual_taxable_income - start, self.widths[index])
+            details.append((index, taxable, taxable * self.rates[index]))
+        return details
+
+
+def compile_tax_table(brackets=None):
+    """Compile (lower_limit, upper_limit, rate) tuples, or the defaults, into a TaxTable."""
+    if not brackets:
+        brackets = [(bracket['lower_limit'], bracket['upper_limit'], bracket['rate'])
+                    for bracket in DEFAULT_TAX_BRACKETS]
+    return TaxTable(brackets)
+
+
+# Seconds the cached table is used before checking whether the brackets have changed
+TAX_TABLE_CHECK_SECONDS = 10
+
+# Process-wide cache of the compiled table, the stamp of the brackets it was
+# compiled from and when (time.monotonic) that stamp was last checked
+_cached_table = {'stamp': None, 'table': None, 'checked': None}
+
+
+def get_cached_tax_table(read_stamp, read_brackets, refresh=False, max_age=TAX_TABLE_CHECK_SECONDS):
+    """
+    Get the compiled tax table, checking at most every max_age seconds whether the brackets have changed.
+
+    Args:
+        read_stamp: Function returning a version stamp of the stored brackets,
+            cheap to read and different whenever they are
+        read_brackets: Function returning the ordered (lower_limit,
+            upper_limit, rate) tuples as stored now, empty for the defaults;
+            only called when the stamp has changed
+        refresh: Check the stamp now, however recently it was checked
+        max_age: Seconds a checked table is used without checking again
+    """
+    now = time.monotonic()
+    checked = _cached_table['checked']
+    if not refresh and checked is not None and now - checked < max_age:
+        return _cached_table['table']
+
+    # The stamp is read first, so brackets changed in between are read again at the next check
+    stamp = read_stamp()
+    if _cached_table['table'] is None or stamp != _cached_table['stamp']:
+        _cached_table['table'] = compile_tax_table(list(read_brackets()))
+        _cached_table['stamp'] = stamp
+    _cached_table['checked'] = now
+    return _cached_table['table']
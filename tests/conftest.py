@@ -0,0 +1,134 @@
+import os
+import sys
+import types
+from datetime import date
+
+import pytest
+
+# Ensure project root is on sys.path so the payroll modules can be imported
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+class DummyQuery:
+    def order_by(self, *args, **kwargs):
+        return self
+    def with_entities(self, *args, **kwargs):
+        return self
+    def all(self):
+        return []
+    def one(self):
+        return (0, None, None, None, None, None)
+
+class DummyTaxBracket:
+    id = lower_limit = upper_limit = rate = 0
+    query = DummyQuery()
+
+# Provide a dummy 'models' module so utils imports without database dependencies
+sys.modules['models'] = types.SimpleNamespace(
+    TaxBracket=DummyTaxBracket,
+    Employee=None,
+    Payroll=None,
+    PayrollItem=None,
+    SalaryConfiguration=None,
+)
+
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+
+def project_modules():
+    """Names of the imported app modules (and the dummy models), not counting the tests."""
+    names = []
+    for name, module in list(sys.modules.items()):
+        path = os.path.abspath(getattr(module, '__file__', None) or '')
+        if name == 'models' or (path.startswith(PROJECT_ROOT + os.sep) and not path.startswith(TESTS_DIR + os.sep)):
+            names.append(name)
+    return names
+
+@pytest.fixture(scope='module')
+def payroll_app(tmp_path_factory):
+    """
+    The real app on its own SQLite database and payslip store, for tests that need a database.
+
+    The app's modules are imported afresh with the real models, and the
+    ones the unit tests use (with the dummy models) are put back afterwards.
+    """
+    directory = tmp_path_factory.mktemp('payroll_app')
+    stubbed = {name: sys.modules.pop(name) for name in project_modules()}
+    environ = dict(os.environ)
+    os.environ.update(
+        DATABASE_URL=f"sqlite:///{directory / 'payroll.db'}",
+        PAYSLIP_STORAGE_PATH=str(directory / 'payslips'),
+        BACKGROUND_JOBS='false',
+    )
+    try:
+        from app import app
+        yield app
+    finally:
+        for name in project_modules():
+            del sys.modules[name]
+        sys.modules.update(stubbed)
+        os.environ.clear()
+        os.environ.update(environ)
+
+@pytest.fixture
+def payroll_db(payroll_app):
+    """Empty tables in an app context, apart from an admin user (id 1) and an active salary configuration."""
+    from app import db
+    from models import SalaryConfiguration, User
+
+    with payroll_app.app_context():
+        db.drop_all()
+        db.create_all()
+        admin = User(username='admin', email='admin@example.com', first_name='Ada', last_name='Admin', is_admin=True)
+        admin.set_password('password')
+        db.session.add(admin)
+        db.session.flush()
+        db.session.add(SalaryConfiguration(
+            name='Default', basic_salary_percentage=60, transport_allowance_percentage=10,
+            housing_allowance_percentage=15, utility_allowance_percentage=5, meal_allowance_percentage=5,
+            clothing_allowance_percentage=5, is_active=True, created_by_id=admin.id
+        ))
+        db.session.commit()
+        yield db
+        db.session.remove()
+
+@pytest.fixture
+def make_employee(payroll_db):
+    """Add employees, with their starting salary recorded in the compensation history as the routes do."""
+    from compensation import initial_compensation
+    from models import Employee
+
+    count = 0
+    def make_employee(basic_salary=100_000.0, date_hired=date(2024, 1, 1), **fields):
+        nonlocal count
+        count += 1
+        employee = Employee(**{
+            'employee_id': f'EMP{count:03d}', 'first_name': 'Test', 'last_name': f'Employee {count}',
+            'email': f'employee{count}@example.com', 'phone_number': '08000000000',
+            'date_of_birth': date(1990, 1, 1), 'gender': 'Female', 'marital_status': 'Single',
+            'address': '1 Marina', 'city': 'Lagos', 'state': 'Lagos', 'department': 'Finance',
+            'position': 'Analyst', 'employment_status': 'Active', 'is_contract': False,
+            'bank_name': 'Test Bank', 'account_number': '0123456789',
+            'basic_salary': basic_salary, 'date_hired': date_hired, **fields
+        })
+        payroll_db.session.add(employee)
+        payroll_db.session.flush()
+        payroll_db.session.add(initial_compensation(employee, 1))
+        payroll_db.session.commit()
+        return employee
+    return make_employee
+
+@pytest.fixture
+def make_payroll(payroll_db):
+    """Add payrolls for a period, in the given status."""
+    from models import Payroll
+
+    def make_payroll(name, period_start, period_end, status='Draft'):
+        payroll = Payroll(
+            name=name, period_start=period_start, period_end=period_end, payment_date=period_end,
+            status=status, created_by_id=1
+        )
+        payroll_db.session.add(payroll)
+        payroll_db.session.commit()
+        return payroll
+    return make_payroll
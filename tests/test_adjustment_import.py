@@ -0,0 +1,162 @@
+import io
+import json
+from datetime import date
+
+import pytest
+
+CSV_FILE = (
+    '\ufeffemployee_id,adjustment_type,amount,description\n'
+    'EMP001,bonus,25000,September commission\n'
+    'EMP002,Deduction,1500.50,Canteen\n'
+)
+
+def test_csv_file_is_read_with_its_header(payroll_app):
+    from adjustment_import import read_adjustment_file
+
+    lines = read_adjustment_file(io.BytesIO(CSV_FILE.encode('utf-8')), 'september.CSV')
+    assert lines == [
+        {'employee_id': 'EMP001', 'adjustment_type': 'bonus', 'amount': '25000', 'description': 'September commission'},
+        {'employee_id': 'EMP002', 'adjustment_type': 'Deduction', 'amount': '1500.50', 'description': 'Canteen'},
+    ]
+
+@pytest.mark.parametrize('data', [
+    [{'employee_id': 'EMP001', 'adjustment_type': 'bonus', 'amount': 25000, 'description': 'Commission'}],
+    {'adjustments': [{'employee_id': 'EMP001', 'adjustment_type': 'bonus', 'amount': 25000, 'description': 'Commission'}]},
+])
+def test_json_file_holds_a_list_of_adjustments(payroll_app, data):
+    from adjustment_import import read_adjustment_file
+
+    lines = read_adjustment_file(io.BytesIO(json.dumps(data).encode('utf-8')), 'september.json')
+    assert lines == [{'employee_id': 'EMP001', 'adjustment_type': 'bonus', 'amount': 25000, 'description': 'Commission'}]
+
+@pytest.mark.parametrize('content, filename, error', [
+    ('employee_id,amount\nEMP001,100\n', 'bad.csv', 'Missing columns: adjustment_type, description'),
+    ('{"employee_id": "EMP001"}', 'bad.json', 'JSON files must hold a list of adjustments'),
+    ('[1, 2]', 'bad.json', 'JSON files must hold a list of adjustments'),
+    ('employee_id', 'bad.xlsx', 'Only CSV and JSON files can be imported'),
+])
+def test_unreadable_files_are_refused(payroll_app, content, filename, error):
+    from adjustment_import import read_adjustment_file
+
+    with pytest.raises(ValueError, match=error):
+        read_adjustment_file(io.BytesIO(content.encode('utf-8')), filename)
+
+def test_each_bad_line_is_reported(payroll_app):
+    from adjustment_import import check_adjustment_lines
+
+    lines = [
+        {'employee_id': 'EMP001', 'adjustment_type': 'bonus', 'amount': '100', 'description': 'Overtime'},
+        {'employee_id': 'EMP009', 'adjustment_type': 'bonus', 'amount': '100', 'description': 'Overtime'},
+        {'employee_id': 'EMP001', 'adjustment_type': 'gift', 'amount': 'inf', 'description': 'Overtime'},
+        {'employee_id': 'EMP001', 'adjustment_type': 'bonus', 'amount': 'nan', 'description': ''},
+        {'employee_id': 'EMP001', 'adjustment_type': 'deduction', 'amount': '0.001', 'description': 'x' * 257},
+    ]
+    adjustments, errors = check_adjustment_lines(lines, {'EMP001': 7})
+    assert adjustments == [
+        {'payroll_item_id': 7, 'adjustment_type': 'bonus', 'description': 'Overtime', 'amount': 100.0},
+    ]
+    assert errors == [
+        'Line 3: employee EMP009 is not in this payroll',
+        'Line 4: unknown adjustment type "gift"; amount must be a number',
+        'Line 5: amount must be a number; description is required',
+        'Line 6: amount must be at least 0.01; description is longer than 256 characters',
+    ]
+
+def processed_payroll(make_employee, make_payroll):
+    from utils import process_payroll
+
+    make_employee(basic_salary=150_000.0)
+    make_employee(basic_salary=250_000.0)
+    payroll = make_payroll('September 2025', date(2025, 9, 1), date(2025, 9, 30))
+    success, message = process_payroll(payroll.id)
+    assert success, message
+    return payroll
+
+def item_amounts(payroll):
+    from models import PayrollItem
+
+    return [
+        (item.adjustment_count, item.bonus_total, item.reimbursement_total, item.deduction_adjustment_total, item.net_pay)
+        for item in PayrollItem.query.filter_by(payroll_id=payroll.id).order_by(PayrollItem.employee_id)
+    ]
+
+def test_file_with_a_bad_line_imports_nothing(payroll_db, make_employee, make_payroll):
+    from adjustment_import import import_payroll_adjustments
+    from models import PayrollAdjustment
+
+    payroll = processed_payroll(make_employee, make_payroll)
+    before = item_amounts(payroll)
+    success, message = import_payroll_adjustments(payroll.id, [
+        {'employee_id': 'EMP001', 'adjustment_type': 'bonus', 'amount': '25000', 'description': 'Commission'},
+        {'employee_id': 'EMP404', 'adjustment_type': 'bonus', 'amount': '25000', 'description': 'Commission'},
+    ], 1)
+
+    assert not success
+    assert message.startswith('No adjustments were imported: 1 of 2 lines have errors. Line 3: employee EMP404')
+    assert PayrollAdjustment.query.count() == 0
+    assert item_amounts(payroll) == before
+
+def test_imported_adjustments_add_to_the_running_totals(payroll_db, make_employee, make_payroll):
+    from adjustment_import import import_payroll_adjustments
+    from models import PayrollAdjustment, PayrollItem
+
+    payroll = processed_payroll(make_employee, make_payroll)
+    first, second = PayrollItem.query.filter_by(payroll_id=payroll.id).order_by(PayrollItem.employee_id).all()
+    paid = (first.net_pay, second.net_pay)
+
+    # An adjustment added on its own before the import is kept
+    adjustment = PayrollAdjustment(
+        payroll_id=payroll.id, payroll_item_id=first.id, adjustment_type='reimbursement', description='Taxi',
+        amount=4_000.0, created_by_id=1
+    )
+    payroll_db.session.add(adjustment)
+    first.add_adjustment(adjustment)
+    payroll_db.session.commit()
+
+    success, message = import_payroll_adjustments(payroll.id, [
+        {'employee_id': 'EMP001', 'adjustment_type': 'bonus', 'amount': '25000', 'description': 'Commission'},
+        {'employee_id': 'EMP001', 'adjustment_type': 'deduction', 'amount': '1500.50', 'description': 'Canteen'},
+        {'employee_id': 'EMP002', 'adjustment_type': 'Bonus', 'amount': 10000, 'description': 'Overtime'},
+    ], 1)
+    assert (success, message) == (True, 'Imported 3 adjustments for 2 employees')
+    success, message = import_payroll_adjustments(payroll.id, [
+        {'employee_id': 'EMP002', 'adjustment_type': 'bonus', 'amount': '2000', 'description': 'Overtime'},
+    ], 1)
+    assert success, message
+
+    payroll_db.session.expire_all()
+    assert item_amounts(payroll) == [
+        (3, 25_000.0, 4_000.0, 1_500.5, pytest.approx(paid[0] + 25_000.0 + 4_000.0 - 1_500.5)),
+        (2, 12_000.0, 0.0, 0.0, pytest.approx(paid[1] + 12_000.0)),
+    ]
+    for item in (first, second):
+        assert item.is_adjusted
+        stored = item.net_pay
+        assert item.recalculate_net_pay() == stored
+    assert PayrollAdjustment.query.filter_by(adjustment_type='deduction').one().amount == -1_500.5
+
+def test_adjustments_are_only_imported_into_open_payrolls(payroll_db, make_payroll):
+    from adjustment_import import import_payroll_adjustments
+
+    payroll = make_payroll('September 2025', date(2025, 9, 1), date(2025, 9, 30), status='Completed')
+    assert import_payroll_adjustments(payroll.id, [], 1) == (
+        False, 'Adjustments can only be made to active or processing payrolls'
+    )
+
+def test_import_waits_for_the_payroll_job_in_progress(payroll_app, payroll_db, make_employee, make_payroll):
+    from models import Job, PayrollAdjustment
+
+    payroll = processed_payroll(make_employee, make_payroll)
+    payroll_db.session.add(Job(
+        job_type='process_payroll', status='Queued', payroll_id=payroll.id, created_by_id=1
+    ))
+    payroll_db.session.commit()
+
+    client = payroll_app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = '1'
+    response = client.post(f'/payroll/import-adjustments/{payroll.id}', data={
+        'file': (io.BytesIO(CSV_FILE.encode('utf-8')), 'september.csv'),
+    })
+    assert response.status_code == 302
+    assert PayrollAdjustment.query.count() == 0
@@ -0,0 +1,94 @@
+from datetime import date, datetime
+
+import pytest
+
+def stored_and_summed_totals(payroll):
+    """Each item's running adjustment totals and net pay, beside the same worked out afresh from its adjustments."""
+    from models import PayrollAdjustment, PayrollItem
+    from utils import payroll_item_base_net_pay
+
+    stored = []
+    summed = []
+    for item in PayrollItem.query.filter_by(payroll_id=payroll.id).order_by(PayrollItem.employee_id):
+        adjustments = PayrollAdjustment.query.filter_by(payroll_item_id=item.id).all()
+        amounts = {
+            adjustment_type: sum(adjustment.amount for adjustment in adjustments if adjustment.adjustment_type == adjustment_type)
+            for adjustment_type in ('bonus', 'reimbursement', 'deduction')
+        }
+        stored.append((
+            item.adjustment_count, item.is_adjusted, item.bonus_total, item.reimbursement_total,
+            item.deduction_adjustment_total, item.net_pay
+        ))
+        summed.append((
+            len(adjustments), bool(adjustments), pytest.approx(amounts['bonus']), pytest.approx(amounts['reimbursement']),
+            pytest.approx(-amounts['deduction']),
+            pytest.approx(payroll_item_base_net_pay(vars(item)) + sum(amounts.values()))
+        ))
+    return stored, summed
+
+def test_running_totals_match_the_adjustments_after_every_change(
+        payroll_app, payroll_db, make_employee, make_payroll, monkeypatch):
+    from adjustment_import import import_payroll_adjustments
+    from backpay import post_back_pay
+    from models import CompensationHistory, PayrollAdjustment, PayrollItem
+    from utils import process_payroll
+
+    monkeypatch.setitem(payroll_app.config, 'WTF_CSRF_ENABLED', False)
+    first = make_employee(basic_salary=150_000.0)
+    make_employee(basic_salary=250_000.0)
+
+    september = make_payroll('September 2025', date(2025, 9, 1), date(2025, 9, 30))
+    october = make_payroll('October 2025', date(2025, 10, 1), date(2025, 10, 31))
+    for payroll in (september, october):
+        success, message = process_payroll(payroll.id)
+        assert success, message
+    september.status = 'Completed'
+    # A raise backdated to September leaves back pay owed for it
+    payroll_db.session.add(CompensationHistory(
+        employee_id=first.id, effective_date=date(2025, 9, 1), basic_salary=180_000.0, changed_by_id=1,
+        date_applied=datetime.utcnow()
+    ))
+    payroll_db.session.commit()
+    items = [item.id for item in PayrollItem.query.filter_by(payroll_id=october.id).order_by(PayrollItem.employee_id)]
+
+    client = payroll_app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = '1'
+    for item_id, adjustment_type, amount in [
+        (items[0], 'bonus', 10_000.0), (items[0], 'reimbursement', 3_000.0), (items[1], 'deduction', 2_500.0),
+        (items[1], 'bonus', 7_500.0),
+    ]:
+        response = client.post('/payroll/add-adjustment', data={
+            'payroll_id': october.id, 'payroll_item_id': item_id, 'adjustment_type': adjustment_type,
+            'description': 'Manual adjustment', 'amount': amount,
+        })
+        assert response.status_code == 302
+    payroll_db.session.expire_all()
+    stored, summed = stored_and_summed_totals(october)
+    assert stored == summed
+    assert stored[0][:5] == (2, True, 10_000.0, 3_000.0, 0.0)
+
+    reimbursement = PayrollAdjustment.query.filter_by(adjustment_type='reimbursement').one()
+    assert client.post(f'/payroll/delete-adjustment/{reimbursement.id}').status_code == 302
+    payroll_db.session.expire_all()
+    stored, summed = stored_and_summed_totals(october)
+    assert stored == summed
+    assert stored[0][:5] == (1, True, 10_000.0, 0.0, 0.0)
+
+    success, message = post_back_pay(october.id, 1)
+    assert success, message
+    payroll_db.session.expire_all()
+    stored, summed = stored_and_summed_totals(october)
+    assert stored == summed
+    assert stored[0][2] > 10_000.0
+
+    success, message = import_payroll_adjustments(october.id, [
+        {'employee_id': 'EMP001', 'adjustment_type': 'deduction', 'amount': '1200', 'description': 'Canteen'},
+        {'employee_id': 'EMP002', 'adjustment_type': 'reimbursement', 'amount': '800', 'description': 'Taxi'},
+    ], 1)
+    assert success, message
+    payroll_db.session.expire_all()
+    stored, summed = stored_and_summed_totals(october)
+    assert stored == summed
+    assert [totals[0] for totals in stored] == [PayrollAdjustment.query.filter_by(payroll_item_id=item_id).count()
+                                               for item_id in items]
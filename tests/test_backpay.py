@@ -0,0 +1,74 @@
+from datetime import date, datetime
+
+import pytest
+
+from proration import count_working_days
+
+def record_change(db, employee, effective_date, basic_salary):
+    """Record a compensation change now, as the compensation route does."""
+    from models import CompensationHistory
+
+    db.session.add(CompensationHistory(
+        employee_id=employee.id, effective_date=effective_date, basic_salary=basic_salary,
+        changed_by_id=1, date_applied=datetime.utcnow()
+    ))
+    db.session.commit()
+
+def paid_payroll(db, make_payroll, name, period_start, period_end):
+    """Process a payroll and complete it."""
+    from utils import process_payroll
+
+    payroll = make_payroll(name, period_start, period_end)
+    success, message = process_payroll(payroll.id)
+    assert success, message
+    payroll.status = 'Completed'
+    db.session.commit()
+    return payroll
+
+def test_rule_changes_since_payment_are_not_arrears(payroll_db, make_employee, make_payroll):
+    from backpay import calculate_back_pay
+    from models import SalaryConfiguration, TaxBracket
+
+    employee = make_employee(basic_salary=300_000.0)
+    paid_payroll(payroll_db, make_payroll, 'September 2025', date(2025, 9, 1), date(2025, 9, 30))
+
+    # New tax brackets and a new salary split, then a correction that leaves the salary as it was
+    payroll_db.session.add_all([
+        TaxBracket(lower_limit=0, upper_limit=800_000, rate=0),
+        TaxBracket(lower_limit=800_000, upper_limit=None, rate=15),
+    ])
+    SalaryConfiguration.query.one().basic_salary_percentage = 50
+    SalaryConfiguration.query.one().housing_allowance_percentage = 25
+    record_change(payroll_db, employee, date(2025, 9, 1), 300_000.0)
+
+    october = make_payroll('October 2025', date(2025, 10, 1), date(2025, 10, 31), status='Active')
+    assert calculate_back_pay(october) == []
+
+def test_backdated_raise_over_a_split_period_is_owed_for_the_old_salary_days(payroll_db, make_employee, make_payroll):
+    from backpay import calculate_back_pay
+    from models import PayrollItem, SalaryConfiguration
+    from payroll_engine import compute_payroll_batch, salary_percentages
+    from utils import get_tax_table
+
+    employee = make_employee(basic_salary=100_000.0)
+    record_change(payroll_db, employee, date(2025, 9, 15), 150_000.0)
+    september = paid_payroll(payroll_db, make_payroll, 'September 2025', date(2025, 9, 1), date(2025, 9, 30))
+    paid = PayrollItem.query.filter_by(payroll_id=september.id).one()
+
+    # Later backdated to the start of the month, and raised again
+    record_change(payroll_db, employee, date(2025, 9, 1), 200_000.0)
+    record_change(payroll_db, employee, date(2025, 9, 15), 200_000.0)
+
+    october = make_payroll('October 2025', date(2025, 10, 1), date(2025, 10, 31), status='Active')
+    [arrears] = calculate_back_pay(october)
+
+    full_month = compute_payroll_batch(
+        [200_000.0], [False], salary_percentages(SalaryConfiguration.query.one()), get_tax_table()
+    )
+    before_change = count_working_days(date(2025, 9, 1), date(2025, 9, 14)) / count_working_days(
+        date(2025, 9, 1), date(2025, 9, 30)
+    )
+    assert arrears['basic_salary'] == pytest.approx(100_000.0 * before_change + 50_000.0 * (1 - before_change))
+    assert arrears['basic_salary'] == pytest.approx(200_000.0 - paid.basic_salary)
+    assert arrears['tax_amount'] == pytest.approx(float(full_month['monthly_tax'][0]) - paid.tax_amount)
+    assert [period['payroll_id'] for period in arrears['periods']] == [september.id]
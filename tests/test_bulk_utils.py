@@ -0,0 +1,62 @@
+from datetime import date, datetime
+
+def item_rows(payroll, employees):
+    """PayrollItem rows with only the columns the engine always writes."""
+    return [
+        dict(
+            payroll_id=payroll.id, employee_id=employee.id, basic_salary=employee.basic_salary,
+            gross_pay=employee.basic_salary * 1.5, taxable_income=employee.basic_salary, tax_amount=1_000.0 * index,
+            pension_amount=800.0, nhf_amount=250.0, net_pay=employee.basic_salary * 1.5 - 1_050.0 - 1_000.0 * index
+        )
+        for index, employee in enumerate(employees)
+    ]
+
+def test_rows_are_inserted_in_batches_with_column_defaults(payroll_db, make_employee, make_payroll):
+    from bulk_utils import bulk_insert
+    from models import PayrollItem
+
+    employees = [make_employee(basic_salary=100_000.0 + 10_000.0 * index) for index in range(5)]
+    payroll = make_payroll('September 2025', date(2025, 9, 1), date(2025, 9, 30))
+    rows = item_rows(payroll, employees)
+
+    assert bulk_insert(PayrollItem, rows, batch_size=2) == 5
+    assert bulk_insert(PayrollItem, []) == 0
+    payroll_db.session.commit()
+
+    items = PayrollItem.query.order_by(PayrollItem.employee_id).all()
+    assert [(item.employee_id, item.net_pay) for item in items] == [(row['employee_id'], row['net_pay']) for row in rows]
+    for item in items:
+        assert (item.other_deductions, item.proration_factor, item.is_adjusted, item.adjustment_count) == (0.0, 1.0, False, 0)
+        assert (item.allowances, item.deductions, item.tax_details) == ({}, {}, {})
+        assert item.date_created is not None
+
+def test_rows_are_updated_by_id_and_deleted_with_one_statement(payroll_db, make_employee, make_payroll):
+    from bulk_utils import bulk_delete, bulk_insert, bulk_update
+    from models import PayrollItem
+
+    employees = [make_employee(basic_salary=100_000.0 + 10_000.0 * index) for index in range(3)]
+    payroll = make_payroll('September 2025', date(2025, 9, 1), date(2025, 9, 30))
+    bulk_insert(PayrollItem, item_rows(payroll, employees))
+    first, second, third = PayrollItem.query.order_by(PayrollItem.employee_id).all()
+
+    assert bulk_update(PayrollItem, [{'id': first.id, 'tax_amount': 5.0}, {'id': third.id, 'tax_amount': 7.0}]) == 2
+    assert bulk_delete(PayrollItem, PayrollItem.id == second.id) == 1
+    payroll_db.session.commit()
+
+    assert [(item.id, item.tax_amount) for item in PayrollItem.query.order_by(PayrollItem.id)] == [
+        (first.id, 5.0), (third.id, 7.0)
+    ]
+
+def test_copy_rows_get_the_defaults_and_values_copy_expects(payroll_app):
+    from bulk_utils import COPY_NULL, copy_value, with_column_defaults
+    from models import PayrollItem
+
+    rows = with_column_defaults(PayrollItem.__table__, [{'payroll_id': 1, 'employee_id': 2, 'other_deductions': 9.0}])
+    assert rows[0]['other_deductions'] == 9.0
+    assert (rows[0]['allowances'], rows[0]['proration_factor'], rows[0]['is_adjusted']) == ({}, 1.0, False)
+    assert isinstance(rows[0]['date_created'], datetime)
+    assert 'id' not in rows[0]
+
+    assert [copy_value(value) for value in (None, True, False, {'Housing': 1.5}, date(2025, 9, 1), 12.5)] == [
+        COPY_NULL, 't', 'f', '{"Housing": 1.5}', '2025-09-01', 12.5
+    ]
@@ -0,0 +1,44 @@
+from datetime import date, datetime
+
+import pytest
+
+from proration import count_working_days
+
+def test_applied_mid_period_raise_pays_the_old_salary_until_it_takes_effect(payroll_db, make_employee, make_payroll):
+    from compensation import ensure_compensation_history
+    from models import CompensationHistory, PayrollItem
+    from utils import process_payroll
+
+    employee = make_employee(basic_salary=100_000.0)
+    # As the compensation route records a change effective by today: applied to the employee at once
+    ensure_compensation_history(employee, 1, date(2025, 10, 15))
+    payroll_db.session.add(CompensationHistory(
+        employee_id=employee.id, effective_date=date(2025, 10, 15), basic_salary=200_000.0,
+        changed_by_id=1, date_applied=datetime.utcnow()
+    ))
+    employee.basic_salary = 200_000.0
+    payroll_db.session.commit()
+
+    payroll = make_payroll('October 2025', date(2025, 10, 1), date(2025, 10, 31))
+    success, message = process_payroll(payroll.id)
+    assert success, message
+
+    item = PayrollItem.query.filter_by(payroll_id=payroll.id, employee_id=employee.id).one()
+    total_days = count_working_days(date(2025, 10, 1), date(2025, 10, 31))
+    before_raise = count_working_days(date(2025, 10, 1), date(2025, 10, 14)) / total_days
+    expected_basic = 100_000.0 * before_raise + 200_000.0 * (1 - before_raise)
+    assert 100_000.0 < item.basic_salary < 200_000.0
+    assert item.basic_salary == pytest.approx(expected_basic, abs=0.01)
+
+def test_starting_salary_is_kept_when_the_first_change_is_recorded(payroll_db, make_employee):
+    from compensation import ensure_compensation_history
+    from models import CompensationHistory
+
+    employee = make_employee(basic_salary=150_000.0)
+    CompensationHistory.query.filter_by(employee_id=employee.id).delete()
+    payroll_db.session.commit()
+
+    ensure_compensation_history(employee, 1, date(2025, 10, 15))
+    ensure_compensation_history(employee, 1, date(2025, 10, 15))
+    rows = CompensationHistory.query.filter_by(employee_id=employee.id).all()
+    assert [(row.effective_date, row.basic_salary) for row in rows] == [(date(2024, 1, 1), 150_000.0)]
@@ -0,0 +1,93 @@
+from datetime import date, datetime, timedelta
+
+import pytest
+
+@pytest.fixture
+def queue_jobs(payroll_app, monkeypatch):
+    """Queue jobs for a worker instead of running them in the request."""
+    monkeypatch.setitem(payroll_app.config, 'BACKGROUND_JOBS', True)
+
+def test_queued_job_is_claimed_run_and_finished(payroll_db, make_employee, make_payroll, queue_jobs):
+    from jobs import claim_next_job, get_active_job, run_job, submit_job
+    from models import Job, PayrollItem
+
+    make_employee(basic_salary=150_000.0)
+    make_employee(basic_salary=250_000.0)
+    payroll = make_payroll('October 2025', date(2025, 10, 1), date(2025, 10, 31))
+
+    job = submit_job('process_payroll', 1, payroll.id)
+    assert job.status == 'Queued'
+    assert get_active_job(payroll.id).id == job.id
+    assert PayrollItem.query.count() == 0
+
+    claimed = claim_next_job()
+    assert (claimed.id, claimed.status) == (job.id, 'Running')
+    assert claimed.date_started is not None and claimed.date_heartbeat is not None
+    assert claim_next_job() is None
+
+    success, message = run_job(claimed)
+    assert success, message
+    job = payroll_db.session.get(Job, job.id, populate_existing=True)
+    assert (job.status, job.message) == ('Completed', message)
+    assert job.date_finished is not None
+    assert job.progress_percent == 100
+    assert PayrollItem.query.filter_by(payroll_id=payroll.id).count() == 2
+    assert get_active_job(payroll.id) is None
+
+def test_failing_job_is_recorded_as_failed(payroll_db, make_payroll, queue_jobs, monkeypatch):
+    from jobs import JOB_HANDLERS, claim_next_job, get_active_job, run_job, submit_job
+    from models import Job
+
+    def broken_handler(job, progress):
+        raise RuntimeError('disk full')
+    monkeypatch.setitem(JOB_HANDLERS, 'broken', broken_handler)
+
+    payroll = make_payroll('October 2025', date(2025, 10, 1), date(2025, 10, 31))
+    job = submit_job('broken', 1, payroll.id)
+    assert run_job(claim_next_job()) == (False, 'disk full')
+    assert payroll_db.session.get(Job, job.id, populate_existing=True).status == 'Failed'
+    assert get_active_job(payroll.id) is None
+
+def test_jobs_without_a_recent_heartbeat_are_failed(payroll_db, make_payroll):
+    from jobs import get_active_job
+    from models import Job
+
+    stopped = make_payroll('September 2025', date(2025, 9, 1), date(2025, 9, 30))
+    busy = make_payroll('October 2025', date(2025, 10, 1), date(2025, 10, 31))
+    long_ago = datetime.utcnow() - timedelta(hours=2)
+    payroll_db.session.add_all([
+        Job(job_type='process_payroll', status='Running', payroll_id=stopped.id, created_by_id=1,
+            date_started=long_ago, date_heartbeat=long_ago),
+        # Started long ago, but still reporting progress
+        Job(job_type='generate_payslips', status='Running', payroll_id=busy.id, created_by_id=1,
+            date_started=long_ago, date_heartbeat=datetime.utcnow()),
+    ])
+    payroll_db.session.commit()
+
+    assert get_active_job(stopped.id) is None
+    assert get_active_job(busy.id).status == 'Running'
+    failed = Job.query.filter_by(payroll_id=stopped.id).one()
+    assert failed.status == 'Failed'
+    assert failed.date_finished is not None
+
+def test_status_endpoint_reports_job_progress(payroll_app, payroll_db, make_payroll):
+    from models import Job
+
+    payroll = make_payroll('October 2025', date(2025, 10, 1), date(2025, 10, 31))
+    job = Job(job_type='generate_payslips', status='Running', payroll_id=payroll.id, created_by_id=1,
+              progress_current=30, progress_total=120, date_started=datetime.utcnow())
+    payroll_db.session.add(job)
+    payroll_db.session.commit()
+
+    client = payroll_app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = '1'
+
+    response = client.get(f'/jobs/{job.id}/status')
+    assert response.status_code == 200
+    assert response.get_json() | {'date_created': None, 'date_started': None} == {
+        'id': job.id, 'job_type': 'generate_payslips', 'status': 'Running', 'payroll_id': payroll.id,
+        'progress_current': 30, 'progress_total': 120, 'progress_percent': 25, 'message': None,
+        'is_finished': False, 'date_created': None, 'date_started': None, 'date_finished': None,
+    }
+    assert client.get(f'/jobs/{job.id + 1}/status').status_code == 404
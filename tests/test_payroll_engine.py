@@ -0,0 +1,225 @@
+import copy
+
+import pytest
+
+import utils
+from payroll_engine import (
+    compute_payroll_batch, fingerprint_context, input_fingerprints,
+    payroll_total_amounts, accumulate, prorate_batch, combine_batch_segments, segment_fingerprints,
+    apply_cumulative_paye, PayPointCache, DEFAULT_SALARY_PERCENTAGES
+)
+
+SALARIES = [0, 12_000, 17_999.99, 18_000, 50_000, 123_456.78, 500_000, 2_500_000]
+
+def scalar_payroll(basic_salary, is_contract, percentages):
+    """Reference calculation using the scalar helpers in utils."""
+    total = basic_salary * (100.0 / percentages['basic'])
+    basic = total * (percentages['basic'] / 100.0)
+    transport = total * (percentages['transport'] / 100.0)
+    housing = total * (percentages['housing'] / 100.0)
+    gross = basic + transport + housing + sum(
+        total * (percentages[name] / 100.0) for name in ('utility', 'meal', 'clothing')
+    )
+    result = utils.calculate_statutory_deductions(basic, transport, housing, gross - basic - transport - housing, is_contract)
+    return result
+
+@pytest.mark.parametrize('is_contract', [False, True])
+def test_batch_matches_scalar_to_the_kobo(is_contract):
+    percentages = dict(DEFAULT_SALARY_PERCENTAGES)
+    batch = compute_payroll_batch(SALARIES, [is_contract] * len(SALARIES), percentages, utils.get_tax_table())
+
+    for index, salary in enumerate(SALARIES):
+        expected = scalar_payroll(salary, is_contract, percentages)
+        assert round(batch['monthly_gross'][index], 2) == round(expected['monthly_gross'], 2)
+        assert round(batch['monthly_pension'][index], 2) == round(expected['monthly_pension'], 2)
+        assert round(batch['monthly_nhf'][index], 2) == round(expected['monthly_nhf'], 2)
+        assert round(batch['consolidated_relief'][index], 2) == round(expected['consolidated_relief'], 2)
+        assert round(batch['monthly_tax'][index], 2) == round(expected['monthly_tax'], 2)
+        assert round(batch['monthly_net_pay'][index], 2) == round(expected['monthly_net_pay'], 2)
+
+def test_batch_tax_bracket_breakdown():
+    batch = compute_payroll_batch([400_000], [False], dict(DEFAULT_SALARY_PERCENTAGES), utils.get_tax_table())
+    _, details = utils.calculate_paye_tax(batch['annual_taxable_income'][0])
+
+    assert batch['bracket_applied'][0].sum() == len(details)
+    assert pytest.approx(batch['tax_by_bracket'][0].sum()) == batch['annual_tax'][0]
+
+def test_fingerprints_change_only_with_inputs():
+    table = utils.get_tax_table()
+    context = fingerprint_context(None, dict(DEFAULT_SALARY_PERCENTAGES), table)
+    first = input_fingerprints([50_000, 50_000, 60_000], [False, True, False], context)
+
+    assert first == input_fingerprints([50_000.0, 50_000, 60_000], [0, 1, 0], context)
+    assert len(set(first)) == 3
+
+    changed_split = dict(DEFAULT_SALARY_PERCENTAGES, housing=20.0)
+    assert input_fingerprints([50_000], [False], fingerprint_context(None, changed_split, table))[0] != first[0]
+
+def test_fingerprints_include_only_partial_proration():
+    context = fingerprint_context(None, dict(DEFAULT_SALARY_PERCENTAGES), utils.get_tax_table())
+    full = input_fingerprints([50_000, 60_000], [False, False], context)
+
+    assert input_fingerprints([50_000, 60_000], [False, False], context, [1.0, 1.0]) == full
+    prorated = input_fingerprints([50_000, 60_000], [False, False], context, [0.5, 1.0])
+    assert prorated[0] != full[0] and prorated[1] == full[1]
+
+def test_segment_fingerprints_match_single_salary_fingerprints():
+    context = fingerprint_context(None, dict(DEFAULT_SALARY_PERCENTAGES), utils.get_tax_table())
+    fingerprints = segment_fingerprints([[(50_000, 0.5)], [(50_000, 0.5), (60_000, 0.5)]], [False, False], context)
+
+    assert fingerprints[0] == input_fingerprints([50_000], [False], context, [0.5])[0]
+    assert fingerprints[1] not in input_fingerprints([50_000, 60_000], [False, False], context, [0.5, 0.5])
+    assert segment_fingerprints([[(50_000, 0.5), (60_000, 0.5)]], [False], context)[0] == fingerprints[1]
+
+def test_accumulate_matches_sequential_python_sum():
+    values = [0.1 * index + 1e9 / (index + 1) for index in range(1000)]
+    expected = 12.5
+    for value in values:
+        expected += value
+
+    assert accumulate(12.5, values) == expected
+    assert accumulate(12.5, []) == 12.5
+
+def test_total_amounts_match_row_totals():
+    table = utils.get_tax_table()
+    batch = compute_payroll_batch(SALARIES, [False, True] * 4, dict(DEFAULT_SALARY_PERCENTAGES), table)
+    rows = utils.build_payroll_item_rows(1, list(range(len(SALARIES))), batch, table)
+    totals = dict.fromkeys(utils.PAYROLL_TOTALS, 0)
+    utils.add_payroll_row_totals(totals, rows)
+
+    amounts = payroll_total_amounts(batch)
+    for name in utils.PAYROLL_TOTALS:
+        assert accumulate(0, amounts[name]) == totals[name]
+
+def test_prorated_rows_match_prorated_batch_totals():
+    table = utils.get_tax_table()
+    factors = [1.0, 0.5, 0.25, 0.0, 13 / 23, 1.0, 0.9, 1 / 3]
+    batch = compute_payroll_batch(SALARIES, [False, True] * 4, dict(DEFAULT_SALARY_PERCENTAGES), table)
+    rows = [
+        utils.prorate_payroll_amounts(row, factor)
+        for row, factor in zip(utils.build_payroll_item_rows(1, list(range(len(SALARIES))), batch, table), factors)
+    ]
+    totals = dict.fromkeys(utils.PAYROLL_TOTALS, 0)
+    utils.add_payroll_row_totals(totals, rows)
+
+    amounts = payroll_total_amounts(prorate_batch(batch, factors))
+    for name in utils.PAYROLL_TOTALS:
+        assert accumulate(0, amounts[name]) == totals[name]
+    assert [row['proration_factor'] for row in rows] == factors
+    assert rows[1]['net_pay'] == batch['monthly_net_pay'][1] * 0.5
+
+def test_split_period_rows_match_combined_batch_totals():
+    table = utils.get_tax_table()
+    segments = [[(50_000, 1.0)], [(80_000, 9 / 23), (95_000, 14 / 23)], [(150_000, 0.5)], [(20_000, 0.25), (400_000, 0.5)]]
+    employment_factors = [1.0, 1.0, 0.5, 0.75]
+    salaries = [salary for pieces in segments for salary, _ in pieces]
+    factors = [factor for pieces in segments for _, factor in pieces]
+    batch = compute_payroll_batch(salaries, [False] * len(salaries), dict(DEFAULT_SALARY_PERCENTAGES), table)
+
+    rows = utils.combine_segment_amounts(utils.build_payroll_amounts(batch, table), segments, employment_factors)
+    totals = dict.fromkeys(utils.PAYROLL_TOTALS, 0)
+    utils.add_payroll_row_totals(totals, rows)
+
+    amounts = payroll_total_amounts(combine_batch_segments(prorate_batch(batch, factors), [0, 1, 3, 4]))
+    for name in utils.PAYROLL_TOTALS:
+        assert accumulate(0, amounts[name]) == totals[name]
+    assert [row['proration_factor'] for row in rows] == employment_factors
+    assert rows[1]['basic_salary'] == batch['monthly_basic'][1] * (9 / 23) + batch['monthly_basic'][2] * (14 / 23)
+
+def test_prorating_leaves_cached_amounts_unchanged():
+    table = utils.get_tax_table()
+    percentages = dict(DEFAULT_SALARY_PERCENTAGES)
+    amounts = utils.calculate_pay_point_amounts([90_000], [False], percentages, table, fingerprint_context(None, percentages, table))[0]
+    before = copy.deepcopy(amounts)
+
+    prorated = utils.prorate_payroll_amounts(amounts, 0.5)
+    assert prorated['allowances'] is not amounts['allowances']
+    assert prorated['gross_pay'] == amounts['gross_pay'] * 0.5
+    assert prorated['tax_details'] == amounts['tax_details']
+    assert amounts == before and 'proration_factor' not in amounts
+
+def test_pay_point_amounts_match_batch_rows():
+    table = utils.get_tax_table()
+    percentages = dict(DEFAULT_SALARY_PERCENTAGES)
+    context = fingerprint_context(None, percentages, table)
+    salaries = SALARIES * 3
+    contracts = [False, True] * (len(salaries) // 2)
+
+    rows = utils.build_payroll_item_rows(1, list(range(len(salaries))), compute_payroll_batch(salaries, contracts, percentages, table), table)
+    for _ in range(2):
+        amounts = utils.calculate_pay_point_amounts(salaries, contracts, percentages, table, context)
+        assert [{'payroll_id': 1, 'employee_id': index, **row} for index, row in enumerate(amounts)] == rows
+
+def run_cumulative_year(monthly_salaries, table):
+    """Run cumulative PAYE month by month for one employee, returning each month's rows."""
+    prior = (0.0,) * len(utils.CUMULATIVE_PAYE_COMPONENTS)
+    rows = []
+    for month, salary in enumerate(monthly_salaries, 1):
+        amounts = utils.build_payroll_amounts(compute_payroll_batch([salary], [False], dict(DEFAULT_SALARY_PERCENTAGES), table), table)
+        row = utils.apply_cumulative_paye_amounts(amounts, [prior], month, table)[0]
+        prior = tuple(total + row[name] for total, (name, _) in zip(prior, utils.CUMULATIVE_PAYE_COMPONENTS))
+        rows.append(row)
+    return rows
+
+def test_cumulative_paye_matches_annualised_for_steady_pay():
+    table = utils.get_tax_table()
+    annualised = compute_payroll_batch([150_000], [False], dict(DEFAULT_SALARY_PERCENTAGES), table)['monthly_tax'][0]
+
+    rows = run_cumulative_year([150_000] * 12, table)
+    assert [row['tax_amount'] for row in rows] == pytest.approx([annualised] * 12)
+    assert rows[5]['deductions']['PAYE Tax'] == rows[5]['tax_amount']
+    assert rows[5]['tax_details']['months'] == 6
+
+def test_cumulative_paye_withholds_the_annual_tax_after_a_raise():
+    table = utils.get_tax_table()
+    rows = run_cumulative_year([100_000] * 6 + [250_000] * 6, table)
+
+    gross = sum(row['gross_pay'] for row in rows)
+    relief = max(200000, gross * 0.01) + sum(row['pension_amount'] + row['nhf_amount'] for row in rows)
+    assert sum(row['tax_amount'] for row in rows) == pytest.approx(table.tax_for(gross - relief))
+    assert all(row['net_pay'] == pytest.approx(row['gross_pay'] - row['pension_amount'] - row['nhf_amount'] - row['tax_amount']) for row in rows)
+
+def test_cumulative_rows_match_cumulative_batch_totals():
+    table = utils.get_tax_table()
+    percentages = dict(DEFAULT_SALARY_PERCENTAGES)
+    prior = [(value * 3, value * 5, value * 0.4, value * 0.1, value * 0.2) for value in (0, 100_000, 100_000, 40_000, 0, 90_000, 2_000_000, 7_000)]
+    batch = compute_payroll_batch(SALARIES, [False, True] * 4, percentages, table)
+
+    rows = utils.apply_cumulative_paye_amounts(utils.build_payroll_amounts(batch, table), prior, 4, table)
+    totals = dict.fromkeys(utils.PAYROLL_TOTALS, 0)
+    utils.add_payroll_row_totals(totals, rows)
+
+    amounts = payroll_total_amounts(apply_cumulative_paye(batch, utils.year_to_date_batch(prior), 4, table))
+    for name in utils.PAYROLL_TOTALS:
+        assert accumulate(0, amounts[name]) == totals[name]
+    assert min(row['tax_amount'] for row in rows) >= 0
+
+def test_pay_point_cache_evicts_least_recently_used():
+    cache = PayPointCache(maxsize=2)
+    cache.put('a', 1)
+    cache.put('b', 2)
+    cache.get('a')
+    cache.put('c', 3)
+
+    assert cache.get('b') is None
+    assert cache.get('a') == 1
+    assert cache.get('c') == 3
+
+def test_statutory_deductions_are_memoized_copies():
+    first = utils.calculate_statutory_deductions(80_000, 10_000, 20_000, 5_000)
+    first['tax_details'].clear()
+    second = utils.calculate_statutory_deductions(80_000, 10_000, 20_000, 5_000)
+
+    assert second == utils.compute_statutory_deductions(80_000, 10_000, 20_000, 5_000)
+
+def test_compact_tax_details_format_like_calculator():
+    table = utils.get_tax_table()
+    batch = compute_payroll_batch([400_000], [False], dict(DEFAULT_SALARY_PERCENTAGES), table)
+    row = utils.build_payroll_item_rows(1, [1], batch, table)[0]
+    annual_tax, details = utils.calculate_paye_tax(batch['annual_taxable_income'][0])
+
+    assert all(isinstance(value, (int, float)) for bracket in row['tax_details']['brackets'] for value in bracket)
+    formatted = utils.format_tax_details(row['tax_details'], row['tax_amount'])
+    assert formatted['Tax Brackets'] == details
+    assert formatted['Annual Tax'] == pytest.approx(annual_tax)
+    assert utils.format_tax_details(formatted) == formatted
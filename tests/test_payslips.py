@@ -0,0 +1,248 @@
+import base64
+import hashlib
+import os
+import re
+import zlib
+from datetime import date
+
+import pytest
+
+PDF_STREAM = re.compile(rb'stream\r?\n(.*?)endstream', re.S)
+PDF_TOKEN = re.compile(r'\((?:\\.|[^\\)])*\)|[^\s()\[\]<>]+')
+
+def processed_payroll(make_employee, make_payroll, employees=3):
+    from utils import process_payroll
+
+    for index in range(employees):
+        make_employee(basic_salary=150_000.0 + 10_000.0 * index)
+    payroll = make_payroll('October 2025', date(2025, 10, 1), date(2025, 10, 31))
+    success, message = process_payroll(payroll.id)
+    assert success, message
+    return payroll
+
+def test_parallel_generation_stores_each_pdf_under_its_hash(payroll_db, make_employee, make_payroll):
+    from models import Payslip, PayrollItem
+    from payslip_storage import open_payslip_pdf
+    from payslip_utils import generate_all_payslips
+
+    payroll = processed_payroll(make_employee, make_payroll)
+    success, message, count = generate_all_payslips(payroll.id, 1, workers=2)
+    assert success, message
+    assert count == 3
+
+    payslips = Payslip.query.join(PayrollItem).filter(PayrollItem.payroll_id == payroll.id).all()
+    assert len(payslips) == 3
+    for payslip in payslips:
+        assert payslip.pdf_data is None
+        with open_payslip_pdf(payslip) as pdf_file:
+            pdf = pdf_file.read()
+        assert pdf.startswith(b'%PDF')
+        assert hashlib.sha256(pdf).hexdigest() == payslip.storage_key
+        assert len(pdf) == payslip.file_size
+
+    # Generating again only renders payslips that are missing
+    assert generate_all_payslips(payroll.id, 1, workers=2)[2] == 3
+    assert Payslip.query.count() == 3
+
+def test_payslips_are_loaded_and_rendered_a_batch_at_a_time(payroll_db, make_employee, make_payroll):
+    from models import CompanySettings, PayrollItem
+    from payslip_utils import generate_all_payslips, payroll_payslip_snapshots, payslip_company, render_payslips
+
+    payroll = processed_payroll(make_employee, make_payroll, employees=5)
+    item_ids = [item.id for item in PayrollItem.query.filter_by(payroll_id=payroll.id).order_by(PayrollItem.id)]
+
+    # Snapshots are only taken from the database as rendering needs them
+    taken = []
+    def snapshots():
+        for snapshot in payroll_payslip_snapshots(payroll, batch_size=2):
+            taken.append(snapshot['payroll_item_id'])
+            yield snapshot
+    rendered = []
+    company = payslip_company(CompanySettings.get_settings())
+    for payroll_item_id, _, pdf in render_payslips(snapshots(), company, workers=2, batch_size=2):
+        assert len(taken) - len(rendered) <= 2
+        assert pdf.startswith(b'%PDF')
+        rendered.append(payroll_item_id)
+    assert rendered == taken == item_ids
+
+    reports = []
+    success, message, count = generate_all_payslips(
+        payroll.id, 1, progress=lambda completed, total: reports.append(completed), workers=2, batch_size=2
+    )
+    assert (success, count) == (True, 5), message
+    assert reports == [2, 4, 5]
+    assert list(payroll_payslip_snapshots(payroll, batch_size=2)) == []
+
+def test_shared_pdf_is_kept_until_its_last_payslip_is_deleted(payroll_db, make_employee, make_payroll):
+    from models import Payslip, PayrollItem
+    from payslip_storage import get_payslip_store, remove_payslip_pdf
+
+    payroll = processed_payroll(make_employee, make_payroll, employees=2)
+    store = get_payslip_store()
+    key = store.put(b'%PDF-1.4 identical payslip')
+    assert store.put(b'%PDF-1.4 identical payslip') == key
+    payslips = [
+        Payslip(payroll_item_id=item.id, storage_key=key, filename=f'payslip_{item.id}.pdf', file_size=26, created_by_id=1)
+        for item in PayrollItem.query.filter_by(payroll_id=payroll.id)
+    ]
+    payroll_db.session.add_all(payslips)
+    payroll_db.session.commit()
+
+    payroll_db.session.delete(payslips[0])
+    payroll_db.session.commit()
+    remove_payslip_pdf(key)
+    assert os.path.exists(store.path(key))
+
+    payroll_db.session.delete(payslips[1])
+    payroll_db.session.commit()
+    remove_payslip_pdf(key)
+    assert not os.path.exists(store.path(key))
+
+def test_logo_is_read_again_only_when_the_file_changes(payroll_app, tmp_path):
+    import payslip_utils
+
+    logo_path = str(tmp_path / 'logo.png')
+    with open(logo_path, 'wb') as logo_file:
+        logo_file.write(b'first logo')
+    os.utime(logo_path, (1_700_000_000, 1_700_000_000))
+    assert payslip_utils.load_company_logo(logo_path) == b'first logo'
+
+    # Same modification time: served from the cache without reading the file
+    with open(logo_path, 'wb') as logo_file:
+        logo_file.write(b'second logo')
+    os.utime(logo_path, (1_700_000_000, 1_700_000_000))
+    assert payslip_utils.load_company_logo(logo_path) == b'first logo'
+
+    os.utime(logo_path, (1_700_000_100, 1_700_000_100))
+    assert payslip_utils.load_company_logo(logo_path) == b'second logo'
+
+    payslip_utils.clear_logo_cache()
+    assert payslip_utils.load_company_logo(str(tmp_path / 'missing.png')) is None
+
+def page_texts(pdf):
+    """The text drawn on each page of a PDF, as sorted (x, y, text), with positions rounded to 0.01pt."""
+    pages = []
+    for match in PDF_STREAM.finditer(pdf):
+        raw = match.group(1)
+        try:
+            stream = zlib.decompress(raw)
+        except zlib.error:
+            stream = zlib.decompress(base64.a85decode(raw.strip(), adobe=True))
+        if b'BT' not in stream:
+            continue
+
+        texts = []
+        origins = []
+        origin_x = origin_y = line_x = line_y = 0.0
+        operands = []
+        for token in PDF_TOKEN.findall(stream.decode('latin-1')):
+            if token == 'q':
+                origins.append((origin_x, origin_y))
+            elif token == 'Q':
+                origin_x, origin_y = origins.pop()
+            elif token == 'cm':
+                origin_x += float(operands[-2])
+                origin_y += float(operands[-1])
+            elif token == 'Tm':
+                line_x, line_y = float(operands[-2]), float(operands[-1])
+            elif token == 'Td':
+                line_x += float(operands[-2])
+                line_y += float(operands[-1])
+            elif token == 'Tj':
+                texts.append((round(origin_x + line_x, 2), round(origin_y + line_y, 2), operands[-1]))
+            else:
+                operands.append(token)
+                continue
+            operands = []
+        pages.append(sorted(texts))
+    return pages
+
+def payslip_data(allowances=None, adjustment_totals=None, **employee):
+    """A payslip snapshot, as payslip_snapshot makes, without the database."""
+    return {
+        'payroll_item_id': 1,
+        'payroll_item': dict(
+            basic_salary=1_142_715.71, gross_pay=1_904_526.18, tax_amount=397_243.93, pension_amount=129_507.78,
+            nhf_amount=28_567.89, other_deductions=0.0, net_pay=1_349_206.58
+        ),
+        'employee': dict(dict(
+            first_name='Ada', last_name='Obi', employee_id='EMP0002', department='Engineering',
+            position='Engineer', bank_name='GTBank', account_number='0123456789'
+        ), full_name='Ada Obi', **employee),
+        'payroll': dict(
+            name='January 2025', period_start=date(2025, 1, 1), period_end=date(2025, 1, 31),
+            payment_date=date(2025, 1, 28)
+        ),
+        'allowances': allowances if allowances is not None else {
+            'Housing Allowance': 285_678.93, 'Transport Allowance': 190_452.62, 'Utility Allowance': 95_226.31,
+        },
+        'deductions': {'PAYE Tax': 397_243.93, 'Pension': 129_507.78, 'NHF': 28_567.89},
+        'has_adjustments': adjustment_totals is not None,
+        'adjustment_totals': adjustment_totals or dict(
+            bonuses=0, reimbursements=0, additional_deductions=0, positive_adjustments=0, net_adjustments=0
+        ),
+        'ytd': dict(
+            basic_salary=1_142_715.71, gross_pay=1_904_526.18, tax_amount=397_243.93, pension_amount=129_507.78,
+            nhf_amount=28_567.89, net_pay=1_349_206.58
+        ),
+        'generated_on': '18 October, 2026',
+        'payment_method': 'Bank Transfer',
+        'filename': 'payslip.pdf',
+    }
+
+def payslip_company(tmp_path, **fields):
+    """Company details, as payslip_company returns them, with a PNG logo."""
+    from PIL import Image
+
+    logo_path = str(tmp_path / 'logo.png')
+    Image.new('RGB', (40, 40), (0, 90, 160)).save(logo_path)
+    return dict(dict(
+        company_name='Nigerian Payroll System', company_address='123 Lagos Business District', company_city='Lagos',
+        company_country='Nigeria', company_email='payroll@example.com', company_phone='+234 800 000 0000',
+        logo_path=logo_path
+    ), **fields)
+
+def assert_stamped_matches_flowable(data, company):
+    from payslip_utils import payslip_content, render_flowable_payslip, render_stamped_payslip
+
+    content = payslip_content(data, company)
+    stamped = render_stamped_payslip(content, 'Payslip')
+    assert stamped is not None
+    flowable = page_texts(render_flowable_payslip(content, 'Payslip'))
+    assert page_texts(stamped) == flowable
+    return flowable
+
+ADJUSTMENT_TOTALS = dict(
+    bonuses=50_000.0, reimbursements=12_500.0, additional_deductions=7_250.0, positive_adjustments=62_500.0,
+    net_adjustments=55_250.0
+)
+
+def test_stamped_payslip_matches_flowable_layout(payroll_app, tmp_path):
+    company = payslip_company(tmp_path)
+    pages = assert_stamped_matches_flowable(payslip_data(), company)
+    assert '(Ada Obi)' in [text for _, _, text in pages[0]]
+
+    # Another employee on the same layout is stamped from the cache
+    other = payslip_data(first_name='Chukwuemeka', last_name='Okonkwo-Adeyemi', department=None)
+    other['payroll_item'] = {name: amount * 7.3 for name, amount in other['payroll_item'].items()}
+    assert_stamped_matches_flowable(other, company)
+
+def test_stamped_payslip_matches_flowable_layout_across_pages(payroll_app, tmp_path):
+    allowances = {f'Allowance {number}': 1_000.0 * number for number in range(40)}
+    pages = assert_stamped_matches_flowable(
+        payslip_data(allowances=allowances, adjustment_totals=ADJUSTMENT_TOTALS), payslip_company(tmp_path)
+    )
+    assert len(pages) > 2
+
+@pytest.mark.parametrize('fields', [
+    {'company_name': 'Smith & Sons'},
+    {'company_address': 'Plot 14, Admiralty Way, Lekki Phase 1, opposite the big roundabout ' * 3},
+])
+def test_payslips_the_stamped_layout_cannot_reproduce_fall_back_to_platypus(payroll_app, tmp_path, fields):
+    from payslip_utils import payslip_content, render_payslip_pdf, render_flowable_payslip, render_stamped_payslip
+
+    data = payslip_data(adjustment_totals=ADJUSTMENT_TOTALS)
+    company = payslip_company(tmp_path, **fields)
+    content = payslip_content(data, company)
+    assert render_stamped_payslip(content, 'Payslip') is None
+    assert page_texts(render_payslip_pdf(data, company)) == page_texts(render_flowable_payslip(content, 'Payslip'))
@@ -0,0 +1,145 @@
+from datetime import date
+
+import pytest
+
+SEPTEMBER = (date(2025, 9, 1), date(2025, 9, 30))
+
+# PayrollItem columns a calculation writes
+ITEM_COLUMNS = (
+    'employee_id', 'basic_salary', 'gross_pay', 'taxable_income', 'tax_amount', 'pension_amount', 'nhf_amount',
+    'other_deductions', 'net_pay', 'input_fingerprint', 'proration_factor', 'allowances', 'deductions', 'tax_details',
+)
+
+def make_staff(make_employee):
+    """Employees in three departments, with a joiner, a leaver and a contractor."""
+    departments = ['Finance', 'Sales', 'Sales', 'Operations', 'Finance', 'Sales', 'Operations', 'Sales']
+    for index, department in enumerate(departments):
+        make_employee(basic_salary=120_000.0 + 35_000.0 * index, department=department)
+    make_employee(basic_salary=300_000.0, department='Finance', date_hired=date(2025, 9, 15))
+    make_employee(
+        basic_salary=220_000.0, department='Operations', employment_status='Terminated',
+        date_terminated=date(2025, 9, 10)
+    )
+    make_employee(basic_salary=90_000.0, department='Sales', is_contract=True)
+
+def process(make_payroll, name, **options):
+    from utils import process_payroll
+
+    payroll = make_payroll(name, *SEPTEMBER)
+    success, message = process_payroll(payroll.id, **options)
+    assert success, message
+    return payroll
+
+def payroll_items(payroll):
+    """The payroll's items, as tuples of ITEM_COLUMNS in employee order."""
+    from models import PayrollItem
+
+    return [
+        tuple(getattr(item, column) for column in ITEM_COLUMNS)
+        for item in PayrollItem.query.filter_by(payroll_id=payroll.id).order_by(PayrollItem.employee_id)
+    ]
+
+def payroll_totals(payroll):
+    return (
+        payroll.total_basic_salary, payroll.total_allowances, payroll.total_deductions, payroll.total_tax,
+        payroll.total_net_pay,
+    )
+
+def item_totals(payroll):
+    """The payroll totals worked out afresh from its items (net pay before adjustments)."""
+    from models import PayrollItem
+    from utils import payroll_item_base_net_pay
+
+    items = PayrollItem.query.filter_by(payroll_id=payroll.id).all()
+    return pytest.approx((
+        sum(item.basic_salary for item in items),
+        sum(item.gross_pay - item.basic_salary for item in items),
+        sum(item.pension_amount + item.nhf_amount for item in items),
+        sum(item.tax_amount for item in items),
+        sum(payroll_item_base_net_pay(vars(item)) for item in items),
+    ))
+
+def test_sharded_processing_matches_a_single_process(payroll_db, make_employee, make_payroll):
+    from utils import plan_payroll_shards
+
+    make_staff(make_employee)
+
+    id_shards = plan_payroll_shards(3, 'id', SEPTEMBER)
+    assert [shard[0] for shard in id_shards] == ['id'] * 3
+    department_shards = plan_payroll_shards(3, 'department', SEPTEMBER)
+    assert sorted(department for _, departments in department_shards for department in departments) == [
+        'Finance', 'Operations', 'Sales'
+    ]
+
+    single = process(make_payroll, 'September 2025')
+    by_id = process(make_payroll, 'September 2025 (by id)', shards=3, shard_by='id')
+    by_department = process(make_payroll, 'September 2025 (by department)', shards=3, shard_by='department')
+
+    items = payroll_items(single)
+    assert len(items) == 11
+    # The joiner and the leaver are paid for the days they were employed
+    assert [item[ITEM_COLUMNS.index('proration_factor')] < 1 for item in items[8:10]] == [True, True]
+    assert payroll_items(by_id) == items
+    assert payroll_items(by_department) == items
+    assert payroll_totals(by_id) == payroll_totals(single)
+    assert payroll_totals(by_department) == payroll_totals(single)
+    assert payroll_totals(single) == item_totals(single)
+
+def test_reprocessing_after_changes_matches_a_fresh_run(payroll_db, make_employee, make_payroll):
+    from models import CompensationHistory, Employee, PayrollAdjustment, PayrollItem
+    from utils import payroll_item_base_net_pay, process_payroll
+
+    make_staff(make_employee)
+    payroll = process(make_payroll, 'September 2025')
+    assert payroll.status == 'Active'
+
+    # EMP002 left before the period, EMP003 gets a bonus and a raise from mid-September
+    leaver = Employee.query.filter_by(employee_id='EMP002').one()
+    leaver.employment_status = 'Terminated'
+    leaver.date_terminated = date(2025, 8, 29)
+    raised = Employee.query.filter_by(employee_id='EMP003').one()
+    item = PayrollItem.query.filter_by(payroll_id=payroll.id, employee_id=raised.id).one()
+    bonus = PayrollAdjustment(
+        payroll_id=payroll.id, payroll_item_id=item.id, adjustment_type='bonus', description='Commission',
+        amount=15_000.0, created_by_id=1
+    )
+    payroll_db.session.add(bonus)
+    item.add_adjustment(bonus)
+    payroll_db.session.add(CompensationHistory(
+        employee_id=raised.id, effective_date=date(2025, 9, 16), basic_salary=260_000.0, changed_by_id=1
+    ))
+    payroll_db.session.commit()
+
+    success, message = process_payroll(payroll.id)
+    assert (success, message) == (True, 'Successfully processed payroll for 10 employees (1 recalculated)')
+    assert payroll.status == 'Processing'
+    assert payroll_totals(payroll) == item_totals(payroll)
+
+    # The same items and totals as processing the period afresh, with the bonus kept
+    fresh = process(make_payroll, 'September 2025 (fresh)')
+    net_pay = ITEM_COLUMNS.index('net_pay')
+    assert [row[:net_pay] + row[net_pay + 1:] for row in payroll_items(payroll)] == [
+        row[:net_pay] + row[net_pay + 1:] for row in payroll_items(fresh)
+    ]
+    payroll_db.session.refresh(item)
+    assert (item.bonus_total, item.is_adjusted) == (15_000.0, True)
+    fresh_item = PayrollItem.query.filter_by(payroll_id=fresh.id, employee_id=raised.id).one()
+    assert payroll_item_base_net_pay(vars(item)) == pytest.approx(fresh_item.net_pay)
+    assert item.net_pay == pytest.approx(fresh_item.net_pay + 15_000.0)
+    assert payroll_totals(payroll) == pytest.approx(payroll_totals(fresh))
+
+def test_processing_in_small_chunks_matches_one_chunk(payroll_db, make_employee, make_payroll):
+    from models import PayrollItem
+
+    make_staff(make_employee)
+    reports = []
+    chunked = process(make_payroll, 'September 2025 (chunked)', chunk_size=2,
+                      progress=lambda completed, total: reports.append((completed, total)))
+    whole = process(make_payroll, 'September 2025')
+
+    assert reports == [(0, 11), (2, 11), (4, 11), (6, 11), (8, 11), (10, 11), (11, 11)]
+    assert payroll_items(chunked) == payroll_items(whole)
+    assert payroll_totals(chunked) == payroll_totals(whole)
+
+    # Items are written without being kept in the session
+    assert not [item for item in payroll_db.session.identity_map.values() if isinstance(item, PayrollItem)]
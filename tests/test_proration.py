@@ -0,0 +1,54 @@
+import datetime as dt
+
+import numpy as np
+import pytest
+
+from proration import (
+    count_working_days, calculate_proration_factor, month_working_days, proration_factors, prorate_amounts,
+    to_datetime64
+)
+
+def walk_working_days(start_date, end_date):
+    """Reference count stepping through every day."""
+    days = 0
+    current = start_date
+    while current <= end_date:
+        if current.weekday() < 5:
+            days += 1
+        current += dt.timedelta(days=1)
+    return days
+
+def test_count_matches_day_walk():
+    base = dt.date(2024, 12, 23)
+    for offset in range(14):
+        start = base + dt.timedelta(days=offset)
+        for length in range(-2, 45):
+            end = start + dt.timedelta(days=length)
+            assert count_working_days(start, end) == walk_working_days(start, end)
+
+def test_month_working_days():
+    assert month_working_days(2025, 2) == (dt.date(2025, 2, 1), dt.date(2025, 2, 28), 20)
+    assert month_working_days(2024, 12)[2] == walk_working_days(dt.date(2024, 12, 1), dt.date(2024, 12, 31))
+
+def test_vectorized_factors_match_scalar():
+    starts = [None, dt.date(2025, 3, 10), dt.date(2025, 2, 1), None, dt.date(2025, 3, 20), dt.date(2025, 4, 2)]
+    ends = [None, None, dt.date(2025, 3, 14), dt.date(2025, 3, 31), dt.date(2025, 3, 5), None]
+    factors = proration_factors(starts, ends, dt.date(2025, 3, 1), dt.date(2025, 3, 31))
+
+    for factor, start, end in zip(factors, starts, ends):
+        assert factor == calculate_proration_factor(start, end, 3, 2025)
+
+def test_to_datetime64_matches_numpy_conversion():
+    dates = [dt.date(1969, 12, 31), None, dt.date(2025, 3, 17), dt.datetime(2025, 3, 18, 23, 59)]
+    converted = to_datetime64(dates)
+
+    assert converted.dtype == np.dtype('datetime64[D]')
+    assert np.array_equal(converted, np.array(dates, dtype='datetime64[D]'), equal_nan=True)
+    assert np.isnat(converted[1])
+    assert to_datetime64(['2025-03-17'])[0] == np.datetime64('2025-03-17')
+
+def test_prorate_amounts_leaves_undated_amounts_whole():
+    amounts = prorate_amounts([100_000, 100_000], [None, dt.date(2025, 3, 17)], [None, None], 3, 2025)
+
+    assert amounts[0] == 100_000
+    assert amounts[1] == pytest.approx(100_000 * 11 / 21)
@@ -0,0 +1,91 @@
+import pytest
+
+import tax_tables
+from tax_tables import TaxTable, compile_tax_table, get_cached_tax_table
+
+def walk_brackets(income, brackets):
+    """Reference PAYE using the original linear bracket walk."""
+    total, remaining = 0.0, income
+    for lower, upper, rate in brackets:
+        if remaining <= 0:
+            break
+        taxable = remaining if upper is None else min(remaining, upper - lower)
+        total += taxable * (rate / 100)
+        remaining -= taxable
+    return total
+
+@pytest.mark.parametrize('income', [-5, 0, 1, 299_999.99, 300_000, 300_000.01, 1_234_567.89, 3_200_000, 10_000_000])
+def test_lookup_matches_linear_walk(income):
+    table = compile_tax_table()
+    assert round(table.tax_for(income), 2) == round(walk_brackets(income, table.brackets), 2)
+    assert round(float(table.tax_for_array([income])[0]), 2) == round(walk_brackets(income, table.brackets), 2)
+
+def test_capped_final_bracket_leaves_excess_untaxed():
+    brackets = [(0, 100_000, 10), (100_000, 200_000, 20)]
+    table = TaxTable(brackets)
+    assert table.tax_for(500_000) == pytest.approx(walk_brackets(500_000, brackets)) == pytest.approx(30_000)
+
+def test_breakdown_lists_reached_brackets():
+    table = compile_tax_table()
+    breakdown = table.breakdown(700_000)
+    assert [index for index, _, _ in breakdown] == [0, 1, 2]
+    assert sum(tax for _, _, tax in breakdown) == pytest.approx(table.tax_for(700_000))
+
+def test_cache_reads_brackets_only_when_their_stamp_changes(monkeypatch):
+    monkeypatch.setattr(tax_tables, '_cached_table', {'stamp': None, 'table': None, 'checked': None})
+    stored = {'stamp': 1, 'brackets': [(0, None, 10)]}
+    reads = []
+
+    def read_stamp():
+        reads.append('stamp')
+        return stored['stamp']
+
+    def read_brackets():
+        reads.append('brackets')
+        return stored['brackets']
+
+    first = get_cached_tax_table(read_stamp, read_brackets)
+    assert first.tax_for(1000) == pytest.approx(100)
+    assert reads == ['stamp', 'brackets']
+
+    # Lookups within max_age do not read anything
+    stored.update(stamp=2, brackets=[(0, None, 11)])
+    assert get_cached_tax_table(read_stamp, read_brackets) is first
+    assert reads == ['stamp', 'brackets']
+
+    # e.g. a rate edited by another process, seen at the next check
+    changed = get_cached_tax_table(read_stamp, read_brackets, refresh=True)
+    assert changed.tax_for(1000) == pytest.approx(110)
+    assert get_cached_tax_table(read_stamp, read_brackets, max_age=0) is changed
+    assert reads == ['stamp', 'brackets', 'stamp', 'brackets', 'stamp']
+
+    stored.update(stamp=3, brackets=[])
+    assert get_cached_tax_table(read_stamp, read_brackets, max_age=0).brackets == compile_tax_table().brackets
+
+def test_version_tracks_bracket_content():
+    assert compile_tax_table().version == compile_tax_table().version
+    assert TaxTable([(0, None, 10)]).version != TaxTable([(0, None, 11)]).version
+
+def test_lookups_do_not_query_the_database_until_the_brackets_are_checked(payroll_db):
+    from sqlalchemy import event, text
+    from utils import calculate_paye_tax, calculate_statutory_deductions, get_tax_table
+
+    statements = []
+    def count_statement(*args):
+        statements.append(args[2])
+
+    default_tax = get_tax_table(refresh=True).tax_for(1_000_000)
+    event.listen(payroll_db.engine, 'before_cursor_execute', count_statement)
+    try:
+        calculate_paye_tax(1_000_000)
+        calculate_statutory_deductions(200_000, 20_000, 50_000)
+        assert statements == []
+    finally:
+        event.remove(payroll_db.engine, 'before_cursor_execute', count_statement)
+
+    # Brackets edited outside the app are used once they are checked
+    payroll_db.session.execute(text('INSERT INTO tax_bracket (lower_limit, upper_limit, rate) VALUES (0, NULL, 10)'))
+    payroll_db.session.commit()
+    assert calculate_paye_tax(1_000_000)[0] == pytest.approx(default_tax)
+    assert get_tax_table(refresh=True).tax_for(1_000_000) == pytest.approx(100_000)
+    assert calculate_paye_tax(1_000_000)[0] == pytest.approx(100_000)
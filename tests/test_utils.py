@@ -1,6 +1,7 @@
 import os
 import sys
 import types
+import numpy as np
 import pytest
 
 # Ensure project root is on sys.path so utils can be imported
@@ -9,11 +10,15 @@ sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
 class DummyQuery:
     def order_by(self, *args, **kwargs):
         return self
+    def with_entities(self, *args, **kwargs):
+        return self
     def all(self):
         return []
+    def one(self):
+        return (0, None, None, None, None, None)
 
 class DummyTaxBracket:
-    lower_limit = 0
+    id = lower_limit = upper_limit = rate = 0
     query = DummyQuery()
 
 # Provide a dummy 'models' module so utils imports without database dependencies
@@ -47,3 +52,9 @@ def test_calculate_pension_contract():
     amount = utils.calculate_pension(50_000, 10_000, 15_000, True)
     assert amount == 0
 
+
+def test_difference_distribution_counts_changes_beyond_half_a_kobo():
+    summary = utils.difference_distribution(np.array([-100.0, -0.004, 0.0, 0.004, 50.0, 250.0]))
+    assert (summary['increased'], summary['decreased'], summary['unchanged']) == (2, 1, 3)
+    assert (summary['min'], summary['max']) == (-100.0, 250.0)
+    assert summary['percentiles']['p50'] == pytest.approx(0.002)
@@ -0,0 +1,172 @@
+from datetime import date
+
+import pytest
+
+def process(db, make_payroll, name, period_start, period_end, approve=False):
+    """Process a payroll; approving it processes it again, which moves it from Active to Processing."""
+    from models import PayrollItem
+    from utils import process_payroll
+
+    payroll = make_payroll(name, period_start, period_end)
+    for _ in range(2 if approve else 1):
+        success, message = process_payroll(payroll.id)
+        assert success, message
+    return PayrollItem.query.filter_by(payroll_id=payroll.id).one()
+
+def test_cumulative_paye_counts_tax_withheld_in_an_earlier_open_month(payroll_db, make_employee, make_payroll):
+    from models import SalaryConfiguration
+
+    SalaryConfiguration.query.one().paye_method = 'cumulative'
+    payroll_db.session.commit()
+    make_employee(basic_salary=400_000.0)
+
+    # January is approved but not completed, so it is not in the year-to-date totals yet
+    january = process(payroll_db, make_payroll, 'January 2025', date(2025, 1, 1), date(2025, 1, 31), approve=True)
+    february = process(payroll_db, make_payroll, 'February 2025', date(2025, 2, 1), date(2025, 2, 28))
+
+    # Steady pay: each month withholds a twelfth of the annual tax
+    assert january.tax_amount > 0
+    assert february.tax_amount == pytest.approx(january.tax_amount, abs=0.01)
+
+def test_cancelled_earlier_month_is_not_counted(payroll_db, make_employee, make_payroll):
+    from models import Payroll, SalaryConfiguration
+
+    SalaryConfiguration.query.one().paye_method = 'cumulative'
+    payroll_db.session.commit()
+    make_employee(basic_salary=400_000.0)
+
+    january = process(payroll_db, make_payroll, 'January 2025', date(2025, 1, 1), date(2025, 1, 31))
+    payroll_db.session.get(Payroll, january.payroll_id).status = 'Cancelled'
+    payroll_db.session.commit()
+    february = process(payroll_db, make_payroll, 'February 2025', date(2025, 2, 1), date(2025, 2, 28))
+
+    # Only February's pay is taxed to date, with two months of relief and bands
+    assert 0 < february.tax_amount < january.tax_amount
+
+def test_duplicate_earlier_month_left_active_is_not_counted(payroll_db, make_employee, make_payroll):
+    from models import SalaryConfiguration
+
+    SalaryConfiguration.query.one().paye_method = 'cumulative'
+    payroll_db.session.commit()
+    make_employee(basic_salary=400_000.0)
+
+    january = process(payroll_db, make_payroll, 'January 2025', date(2025, 1, 1), date(2025, 1, 31), approve=True)
+    # A second January run, processed by mistake and never approved
+    process(payroll_db, make_payroll, 'January 2025 (copy)', date(2025, 1, 1), date(2025, 1, 31))
+    february = process(payroll_db, make_payroll, 'February 2025', date(2025, 2, 1), date(2025, 2, 28))
+
+    assert february.tax_amount == pytest.approx(january.tax_amount, abs=0.01)
+
+def test_cumulative_paye_refuses_periods_that_are_not_monthly(payroll_db, make_employee, make_payroll):
+    from models import SalaryConfiguration
+    from utils import process_payroll, simulate_payroll
+
+    SalaryConfiguration.query.one().paye_method = 'cumulative'
+    payroll_db.session.commit()
+    make_employee(basic_salary=400_000.0)
+
+    fortnight = make_payroll('First half of March 2025', date(2025, 3, 1), date(2025, 3, 14))
+    success, message = process_payroll(fortnight.id)
+    assert not success
+    assert 'monthly pay periods' in message
+    with pytest.raises(ValueError):
+        simulate_payroll(fortnight.id)
+
+@pytest.fixture
+def change_status(payroll_app, monkeypatch):
+    """Change payrolls' status through the status form, as an admin."""
+    monkeypatch.setitem(payroll_app.config, 'WTF_CSRF_ENABLED', False)
+    client = payroll_app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = '1'
+
+    def change_status(payroll, *statuses):
+        for status in statuses:
+            client.post('/payroll/update-status', data={'payroll_id': payroll.id, 'status': status, 'confirm': 'y'})
+    return change_status
+
+def year_to_date(employee, tax_year=2025):
+    from ytd import get_year_to_date
+
+    return get_year_to_date(employee.id, tax_year)
+
+def test_completed_payroll_is_posted_once_and_taken_off_if_cancelled(payroll_db, make_employee, make_payroll, change_status):
+    from models import Payroll
+
+    employee = make_employee(basic_salary=400_000.0)
+    march = process(payroll_db, make_payroll, 'March 2025', date(2025, 3, 1), date(2025, 3, 31), approve=True)
+    march_payroll = payroll_db.session.get(Payroll, march.payroll_id)
+    assert year_to_date(employee)['gross_pay'] == 0.0
+
+    change_status(march_payroll, 'Completed')
+    posted = year_to_date(employee)
+    assert march_payroll.ytd_posted
+    assert posted['gross_pay'] == pytest.approx(march.gross_pay)
+    assert posted['tax_amount'] == pytest.approx(march.tax_amount)
+    assert posted['net_pay'] == pytest.approx(march.net_pay)
+
+    # Closing the completed payroll does not post it again
+    change_status(march_payroll, 'Closed')
+    assert march_payroll.status == 'Closed'
+    assert year_to_date(employee) == posted
+
+    april = process(payroll_db, make_payroll, 'April 2025', date(2025, 4, 1), date(2025, 4, 30), approve=True)
+    april_payroll = payroll_db.session.get(Payroll, april.payroll_id)
+    change_status(april_payroll, 'Completed')
+    assert year_to_date(employee)['gross_pay'] == pytest.approx(march.gross_pay + april.gross_pay)
+
+    change_status(april_payroll, 'Cancelled')
+    assert april_payroll.status == 'Cancelled'
+    assert not april_payroll.ytd_posted
+    assert year_to_date(employee) == pytest.approx(posted)
+
+def test_active_payroll_closed_directly_is_posted(payroll_db, make_employee, make_payroll, change_status):
+    from models import Payroll
+
+    employee = make_employee(basic_salary=400_000.0)
+    item = process(payroll_db, make_payroll, 'March 2025', date(2025, 3, 1), date(2025, 3, 31))
+    payroll = payroll_db.session.get(Payroll, item.payroll_id)
+    assert payroll.status == 'Active'
+
+    change_status(payroll, 'Closed', 'Completed')
+    assert year_to_date(employee)['gross_pay'] == pytest.approx(item.gross_pay)
+
+def test_rebuild_recalculates_totals_from_posted_payrolls(payroll_db, make_employee, make_payroll):
+    from models import Payroll, YearToDate
+    from ytd import post_payroll_ytd, rebuild_year_to_date
+
+    employee = make_employee(basic_salary=400_000.0)
+    items = []
+    for month, status in ((1, 'Completed'), (2, 'Closed'), (3, 'Processing')):
+        item = process(payroll_db, make_payroll, f'2025-{month:02d}', date(2025, month, 1), date(2025, month, 28))
+        payroll = payroll_db.session.get(Payroll, item.payroll_id)
+        payroll.status = status
+        items.append(item)
+    post_payroll_ytd(payroll_db.session.get(Payroll, items[0].payroll_id))
+    YearToDate.query.one().gross_pay = 1.0  # e.g. edited by hand
+    payroll_db.session.commit()
+
+    assert rebuild_year_to_date(2025) == 1
+    payroll_db.session.commit()
+    assert year_to_date(employee)['gross_pay'] == pytest.approx(items[0].gross_pay + items[1].gross_pay)
+    assert [payroll.ytd_posted for payroll in Payroll.query.order_by(Payroll.period_start)] == [True, True, False]
+
+def test_totals_before_a_late_earlier_period_leave_out_later_payrolls(payroll_db, make_employee, make_payroll):
+    from models import Payroll
+    from ytd import load_year_to_date, post_payroll_ytd
+
+    employee = make_employee(basic_salary=400_000.0)
+    posted = []
+    for month in (1, 3):
+        item = process(payroll_db, make_payroll, f'2025-{month:02d}', date(2025, month, 1), date(2025, month, 28))
+        payroll = payroll_db.session.get(Payroll, item.payroll_id)
+        payroll.status = 'Completed'
+        post_payroll_ytd(payroll)
+        posted.append(item)
+    payroll_db.session.commit()
+
+    # February, processed after March was completed, only follows January
+    february = load_year_to_date(employee.id, employee.id, (date(2025, 2, 1), date(2025, 2, 28)))
+    assert february[employee.id]['gross_pay'] == pytest.approx(posted[0].gross_pay)
+    april = load_year_to_date(employee.id, employee.id, (date(2025, 4, 1), date(2025, 4, 30)))
+    assert april[employee.id]['gross_pay'] == pytest.approx(posted[0].gross_pay + posted[1].gross_pay)
@@ -1,6 +1,16 @@
+import copy
 import datetime as dt
 from datetime import datetime, date, timedelta
+import numpy as np
+from sqlalchemy import and_, func, or_
 from models import TaxBracket, Employee, Payroll, PayrollItem, SalaryConfiguration
+from payroll_engine import (
+    compute_payroll_batch, salary_percentages, fingerprint_context, segment_fingerprints,
+    payroll_total_amounts, accumulate, pay_point_cache, prorate_batch, combine_batch_segments,
+    apply_cumulative_paye, cumulative_fingerprints, ALLOWANCE_COMPONENTS
+)
+from tax_tables import get_cached_tax_table
+from proration import calculate_proration_factor, month_working_days
 
 def calculate_age(birth_date):
     """Calculate age based on date of birth."""
@@ -26,49 +36,106 @@ def calculate_paye_tax(annual_taxable_income):
     - Next ₦1,600,000: 21%
     - Above ₦3,200,000: 24%
     """
+    tax_table = get_tax_table()
+    
+    total_tax = tax_table.tax_for(annual_taxable_income)
+    tax_details = [
+        format_tax_bracket_detail(*tax_table.brackets[index], taxable_in_bracket, tax_in_bracket)
+        for index, taxable_in_bracket, tax_in_bracket in tax_table.breakdown(annual_taxable_income)
+    ]
+    
+    return total_tax, tax_details
+
+def get_tax_table(refresh=False):
+    """
+    Get the compiled PAYE tax table.
+    
+    The table is cached for the process (see tax_tables.get_cached_tax_table):
+    lookups do not query the database, and every TAX_TABLE_CHECK_SECONDS a
+    single aggregate row (tax_bracket_stamp) shows whether the brackets have
+    changed and have to be read again. The default Nigerian brackets are
+    used when none are defined.
+    
+    Args:
+        refresh: Check for changed brackets now; for payroll runs, which
+            should not use brackets changed just before they started
+    """
+    return get_cached_tax_table(tax_bracket_stamp, read_tax_brackets, refresh=refresh)
+
+def tax_bracket_stamp():
+    """Get a version stamp of the stored tax brackets, which changes when any is added, removed or edited."""
+    return tuple(TaxBracket.query.with_entities(
+        func.count(TaxBracket.id), func.max(TaxBracket.id), func.sum(TaxBracket.lower_limit),
+        func.sum(TaxBracket.upper_limit), func.sum(TaxBracket.rate), func.sum(TaxBracket.rate * TaxBracket.lower_limit)
+    ).one())
+
+def read_tax_brackets():
+    """Read the stored tax brackets as ordered (lower_limit, upper_limit, rate) tuples."""
     tax_brackets = TaxBracket.query.order_by(TaxBracket.lower_limit).all()
+    return [(bracket.lower_limit, bracket.upper_limit, bracket.rate) for bracket in tax_brackets]
+
+def format_tax_bracket_detail(lower, upper, rate, taxable_amount, tax):
+    """Format one bracket of a PAYE calculation for display."""
+    return {
+        'bracket': f"{format_currency(lower)} - {format_currency(upper) if upper else 'above'}",
+        'rate': f"{rate}%",
+        'taxable_amount': format_currency(taxable_amount),
+        'tax': format_currency(tax)
+    }
+
+def format_tax_details(tax_details, monthly_tax=None):
+    """
+    Expand a payroll item's stored tax details for display.
     
-    # If no tax brackets are defined in the database, use default Nigerian tax brackets
-    if not tax_brackets:
-        tax_brackets = [
-            {'lower_limit': 0, 'upper_limit': 300000, 'rate': 7},
-            {'lower_limit': 300000, 'upper_limit': 600000, 'rate': 11},
-            {'lower_limit': 600000, 'upper_limit': 1100000, 'rate': 15},
-            {'lower_limit': 1100000, 'upper_limit': 1600000, 'rate': 19},
-            {'lower_limit': 1600000, 'upper_limit': 3200000, 'rate': 21},
-            {'lower_limit': 3200000, 'upper_limit': None, 'rate': 24}
-        ]
+    Payroll items store a compact numeric breakdown (see build_payroll_amounts);
+    this formats it into the labelled values and bracket rows the payslip
+    templates show. Items saved before the compact format already hold
+    display values and are returned unchanged.
     
-    total_tax = 0
-    remaining_income = annual_taxable_income
-    tax_details = []
+    Args:
+        tax_details: PayrollItem.tax_details
+        monthly_tax: The item's monthly tax (defaults to a twelfth of the annual tax)
+    """
+    if not tax_details or 'brackets' not in tax_details:
+        return tax_details or {}
     
-    for bracket in tax_brackets:
-        lower = bracket.lower_limit if hasattr(bracket, 'lower_limit') else bracket['lower_limit']
-        upper = bracket.upper_limit if hasattr(bracket, 'upper_limit') else bracket['upper_limit']
-        rate = bracket.rate if hasattr(bracket, 'rate') else bracket['rate']
-        
-        if remaining_income <= 0:
-            break
-            
-        if upper is None:  # Highest bracket
-            taxable_in_bracket = remaining_income
+    # Bracket indexes refer to the tax table the item was calculated with
+    tax_table = get_tax_table()
+    brackets = tax_table.brackets if tax_details.get('tax_table') == tax_table.version else None
+    
+    tax_brackets = []
+    for index, taxable_amount, tax in tax_details['brackets']:
+        if brackets:
+            tax_brackets.append(format_tax_bracket_detail(*brackets[index], taxable_amount, tax))
         else:
-            taxable_in_bracket = min(remaining_income, upper - lower)
-            
-        tax_in_bracket = taxable_in_bracket * (rate / 100)
-        total_tax += tax_in_bracket
-        
-        tax_details.append({
-            'bracket': f"{format_currency(lower)} - {format_currency(upper) if upper else 'above'}",
-            'rate': f"{rate}%",
-            'taxable_amount': format_currency(taxable_in_bracket),
-            'tax': format_currency(tax_in_bracket)
-        })
-        
-        remaining_income -= taxable_in_bracket
+            # The brackets have changed since; describe the band by position and effective rate
+            tax_brackets.append({
+                'bracket': f"Band {index + 1}",
+                'rate': f"{round(tax / taxable_amount * 100, 2):g}%" if taxable_amount else '',
+                'taxable_amount': format_currency(taxable_amount),
+                'tax': format_currency(tax)
+            })
+    
+    annual_tax = tax_details.get('annual_tax', 0)
+    formatted = {
+        'Annual Basic Salary': tax_details.get('annual_basic', 0),
+        'Annual Gross Income': tax_details.get('annual_gross', 0),
+        'Consolidated Relief': tax_details.get('consolidated_relief', 0),
+        'Annual Taxable Income': tax_details.get('annual_taxable_income', 0),
+        'Annual Tax': annual_tax,
+        'Monthly Tax': monthly_tax if monthly_tax is not None else annual_tax / 12,
+        'Tax Brackets': tax_brackets
+    }
     
-    return total_tax, tax_details
+    # Cumulative PAYE: the annual figures are the annualised year to date
+    if tax_details.get('method') == 'cumulative':
+        formatted.update({
+            'Months to Date': tax_details['months'],
+            'Taxable Income to Date': tax_details['cumulative_taxable_income'],
+            'Tax Due to Date': tax_details['cumulative_tax'],
+            'Tax Already Withheld': tax_details['tax_withheld']
+        })
+    return formatted
 
 def calculate_pension(basic_salary, transport_allowance=0, housing_allowance=0, is_contract=False, pension_rate=8.0):
     """
@@ -122,16 +189,47 @@ def calculate_nhf(basic_salary, nhf_rate=2.5):
     """Calculate National Housing Fund contribution (default 2.5% of basic salary)."""
     return basic_salary * (nhf_rate / 100)
 
-def process_payroll(payroll_id):
+def process_payroll(payroll_id, shards=1, shard_by='id', chunk_size=2000, progress=None):
     """
     Process a payroll run by calculating pay for all employees.
     
     This will:
-    1. Get all active employees
-    2. Calculate their gross pay, deductions, and net pay
-    3. Create payroll items for each employee
-    4. Update the payroll totals
+    1. Stream the employees payable for the period in chunks, reading only the columns needed
+    2. Resolve each employee's salary for the period from their compensation history
+    3. Calculate each chunk's gross pay, deductions, and net pay in one vectorized batch,
+       prorating joiners and leavers by the working days they were employed
+    4. Bulk-write the chunk's payroll items before moving on to the next chunk
+    5. Update the payroll totals
+    
+    Employees are payable when they were hired by the end of the payroll
+    period and are Active or were terminated on or after its start. Anyone
+    employed for only part of the period is paid that share of its working
+    days, and the factor is stored on their payroll item. A salary change
+    taking effect mid-period splits the pay between the old and new salary
+    by working days.
+    
+    When the active salary configuration uses cumulative PAYE, each
+    employee's tax is worked out from their year-to-date totals (see
+    apply_cumulative_paye) instead of annualising the month on its own.
+    
+    Re-processing an Active payroll is incremental: only employees whose input
+    fingerprint changed, who became payable or who stopped being payable have
+    their items rewritten, and the totals are adjusted by the differences.
+    
+    With shards > 1 the payable employees are split by id range or department
+    and each shard is calculated in its own worker process. Results are merged
+    in employee order and written in one transaction, so the outcome is the
+    same for any number of shards; if any shard fails nothing is written.
+    
+    Args:
+        payroll_id: ID of the payroll to process
+        shards: Number of worker processes to split the calculation across
+        shard_by: 'id' to split by employee id range, 'department' by department
+        chunk_size: Number of employees calculated and written at a time
+        progress: Optional callable(completed, total) called as employees are completed
     """
+    from app import db
+    
     payroll = Payroll.query.get(payroll_id)
     
     # Check if payroll exists and is in an appropriate status
@@ -141,175 +239,1014 @@ def process_payroll(payroll_id):
     if payroll.status not in ['Draft', 'Active']:
         return False, f"Payroll is in '{payroll.status}' status and cannot be processed"
     
-    # Get all active employees
-    employees = Employee.query.filter_by(employment_status='Active').all()
-    
-    # Initialize payroll totals
-    total_basic = 0
-    total_allowances = 0
-    total_deductions = 0
-    total_tax = 0
-    total_net = 0
+    incremental = payroll.status == 'Active'
+    period = payroll_period(payroll)
     
-    # Get active salary configuration
-    salary_config = SalaryConfiguration.query.filter_by(is_active=True).first()
+    try:
+        total_employees = None
+        if progress:
+            total_employees = Employee.query.filter(payable_employee_criteria(period)).count()
+            progress(0, total_employees)
+        
+        if shards > 1:
+            chunks = [merge_payroll_chunks(run_payroll_shards(
+                payroll.id, plan_payroll_shards(shards, shard_by, period), incremental, chunk_size
+            ))]
+        else:
+            chunks = iter_payroll_chunks(payroll.id, incremental=incremental, chunk_size=chunk_size)
+        
+        # Write each chunk as it arrives, keeping only running totals
+        totals = dict.fromkeys(PAYROLL_TOTALS, 0)
+        replaced_totals = dict.fromkeys(PAYROLL_TOTALS, 0)
+        employee_count = 0
+        recalculated = 0
+        for chunk in chunks:
+            write_payroll_chunk(chunk)
+            add_payroll_row_totals(totals, chunk['rows'])
+            add_payroll_item_totals(replaced_totals, chunk['replaced'], use_net_pay=True)
+            employee_count += chunk['employee_count']
+            recalculated += len(chunk['rows'])
+            if progress:
+                progress(employee_count, total_employees)
+        
+        if incremental:
+            totals = adjust_incremental_totals(payroll, totals, replaced_totals)
+        
+        # Update payroll record
+        payroll.total_basic_salary = totals['basic']
+        payroll.total_allowances = totals['allowances']
+        payroll.total_deductions = totals['deductions']
+        payroll.total_tax = totals['tax']
+        payroll.total_net_pay = totals['net']
+        
+        # Update status based on current status
+        if payroll.status == 'Draft':
+            payroll.status = 'Active'
+        elif payroll.status == 'Active':
+            payroll.status = 'Processing'
+            
+        payroll.date_updated = datetime.utcnow()
+        
+        # Commit changes to database
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        return False, f"Payroll processing failed: {str(e)}"
+    
+    if incremental:
+        return True, f"Successfully processed payroll for {employee_count} employees ({recalculated} recalculated)"
+    return True, f"Successfully processed payroll for {employee_count} employees"
+
+# Payroll totals kept on the Payroll record
+PAYROLL_TOTALS = ('basic', 'allowances', 'deductions', 'tax', 'net')
+
+def payroll_period(payroll=None):
+    """Get the (first day, last day) a payroll pays for; the current month without a payroll."""
+    if payroll:
+        return payroll.period_start, payroll.period_end
+    today = date.today()
+    first_day, last_day, _ = month_working_days(today.year, today.month)
+    return first_day, last_day
+
+def payable_employee_criteria(period):
+    """
+    SQL criteria for the employees to be paid for a period.
     
-    # If no active configuration, use default percentages
-    if not salary_config:
-        basic_percentage = 60.0
-        transport_percentage = 10.0
-        housing_percentage = 15.0
-        utility_percentage = 5.0
-        meal_percentage = 5.0
-        clothing_percentage = 5.0
-    else:
-        basic_percentage = salary_config.basic_salary_percentage
-        transport_percentage = salary_config.transport_allowance_percentage
-        housing_percentage = salary_config.housing_allowance_percentage
-        utility_percentage = salary_config.utility_allowance_percentage
-        meal_percentage = salary_config.meal_allowance_percentage
-        clothing_percentage = salary_config.clothing_allowance_percentage
-    
-    # Clear existing payroll items if re-processing
-    if payroll.status == 'Active':
-        PayrollItem.query.filter_by(payroll_id=payroll.id).delete()
-    
-    # Process each employee
-    for employee in employees:
-        # Calculate total monthly compensation
-        total_compensation = employee.basic_salary * (100.0 / basic_percentage)
-        
-        # Calculate salary components based on configuration percentages
-        monthly_basic_salary = total_compensation * (basic_percentage / 100.0)
-        transport_allowance = total_compensation * (transport_percentage / 100.0)
-        housing_allowance = total_compensation * (housing_percentage / 100.0)
-        utility_allowance = total_compensation * (utility_percentage / 100.0)
-        meal_allowance = total_compensation * (meal_percentage / 100.0)
-        clothing_allowance = total_compensation * (clothing_percentage / 100.0)
-        
-        # Calculate gross pay (sum of all components)
-        monthly_gross_pay = (
-            monthly_basic_salary + 
-            transport_allowance + 
-            housing_allowance + 
-            utility_allowance +
-            meal_allowance +
-            clothing_allowance
+    An employee is payable when hired by the end of the period and either
+    Active with no termination date, or terminated on or after its start
+    (whatever their status now, so leavers get their final partial pay).
+    """
+    period_start, period_end = period
+    return and_(
+        Employee.date_hired <= period_end,
+        or_(
+            and_(Employee.date_terminated.is_(None), Employee.employment_status == 'Active'),
+            Employee.date_terminated >= period_start
         )
+    )
+
+def iter_payroll_chunks(payroll_id, shard=None, incremental=False, chunk_size=2000):
+    """
+    Calculate payroll item rows for payable employees, one chunk at a time.
+    
+    Employees are streamed in id order with only the columns the calculation
+    needs, so memory use does not grow with headcount.
+    
+    Args:
+        payroll_id: ID of the payroll being processed
+        shard: ('id', first_id, last_id) or ('department', [names]); None for everyone
+        incremental: Only recalculate employees without an up-to-date item
+        chunk_size: Number of employees per chunk
         
-        # Calculate deductions using employee's contract status
-        monthly_pension = calculate_pension(
-            monthly_basic_salary, 
-            transport_allowance, 
-            housing_allowance, 
-            employee.is_contract
+    Yields:
+        Dictionaries with the chunk's employee count, the payroll item rows to
+        write (rows rewriting an existing item carry its 'id') and the previous
+        amounts of the items being rewritten
+    """
+    from app import db
+    
+    # Get active salary configuration (falls back to default percentages)
+    salary_config = SalaryConfiguration.query.filter_by(is_active=True).first()
+    percentages = salary_percentages(salary_config)
+    
+    # Compiled tax table, checked against the stored brackets at the start of the run
+    tax_table = get_tax_table(refresh=True)
+    context = fingerprint_context(salary_config, percentages, tax_table)
+    paye_method = salary_config.paye_method if salary_config else 'annualised'
+    period = payroll_period(db.session.get(Payroll, payroll_id))
+    
+    statement = db.select(
+        Employee.id, Employee.basic_salary, Employee.is_contract, Employee.date_hired, Employee.date_terminated
+    ).where(payable_employee_criteria(period))
+    if shard and shard[0] == 'id':
+        statement = statement.where(Employee.id.between(shard[1], shard[2]))
+    elif shard and shard[0] == 'department':
+        statement = statement.where(Employee.department.in_(shard[1]))
+    statement = statement.order_by(Employee.id).execution_options(yield_per=chunk_size)
+    
+    for employees in db.session.execute(statement).partitions():
+        yield calculate_payroll_chunk(
+            payroll_id, employees, percentages, tax_table, context, period, incremental, paye_method
         )
-        monthly_nhf = calculate_nhf(monthly_basic_salary)
-        
-        # Calculate employer contributions (for reporting purposes)
-        monthly_employer_pension = calculate_employer_pension(
-            monthly_basic_salary, 
-            transport_allowance, 
-            housing_allowance, 
-            employee.is_contract
+
+def calculate_payroll_chunk(payroll_id, employees, percentages, tax_table, context, period, incremental=False,
+                            paye_method='annualised'):
+    """Calculate payroll item rows for one id-ordered chunk of payable employees."""
+    from compensation import resolve_pay_segments
+    
+    employee_ids = [employee.id for employee in employees]
+    segments, factors = resolve_pay_segments(employees, period)
+    fingerprints = segment_fingerprints(segments, [employee.is_contract for employee in employees], context)
+    
+    # Cumulative PAYE also depends on what was paid earlier in the tax year
+    cumulative = paye_method == 'cumulative' and bool(employee_ids)
+    if cumulative:
+        months = cumulative_paye_months(period)
+        prior = prior_year_to_date(employee_ids, period)
+        fingerprints = cumulative_fingerprints(fingerprints, months, prior)
+    
+    # Existing items for the chunk's employees
+    existing = {}
+    if incremental and employee_ids:
+        existing_items = PayrollItem.query.join(
+            Employee, Employee.id == PayrollItem.employee_id
+        ).with_entities(
+            PayrollItem.id, PayrollItem.employee_id, PayrollItem.input_fingerprint,
+            PayrollItem.basic_salary, PayrollItem.gross_pay, PayrollItem.tax_amount,
+            PayrollItem.pension_amount, PayrollItem.nhf_amount, PayrollItem.other_deductions,
+            PayrollItem.net_pay, PayrollItem.is_adjusted
+        ).filter(
+            PayrollItem.payroll_id == payroll_id,
+            PayrollItem.employee_id.between(employee_ids[0], employee_ids[-1]),
+            payable_employee_criteria(period)
+        ).all()
+        existing = {item.employee_id: item._asdict() for item in existing_items}
+    
+    # Only recalculate employees whose inputs changed or who have no item yet
+    pending = [
+        index for index, employee_id in enumerate(employee_ids)
+        if employee_id not in existing or existing[employee_id]['input_fingerprint'] != fingerprints[index]
+    ]
+    
+    # Employees on the same pay point share one cached calculation, which is
+    # then scaled to the share of the period paid at that salary
+    amounts = combine_segment_amounts(
+        calculate_pay_point_amounts(
+            [salary for index in pending for salary, _ in segments[index]],
+            [employees[index].is_contract for index in pending for _ in segments[index]],
+            percentages,
+            tax_table,
+            context
+        ),
+        [segments[index] for index in pending],
+        [factors[index] for index in pending]
+    )
+    if cumulative and pending:
+        amounts = apply_cumulative_paye_amounts(amounts, [prior[index] for index in pending], months, tax_table)
+    rows = [
+        {'payroll_id': payroll_id, 'employee_id': employee_ids[index], **payroll_amounts}
+        for index, payroll_amounts in zip(pending, amounts)
+    ]
+    
+    replaced = []
+    for index, row in zip(pending, rows):
+        row['input_fingerprint'] = fingerprints[index]
+        previous = existing.get(row['employee_id'])
+        if previous is None:
+            continue
+        
+        # Rewrite the existing item in place, keeping its adjustments
+        row['id'] = previous['id']
+        del row['is_adjusted']
+        if previous['is_adjusted']:
+            row['net_pay'] += previous['net_pay'] - payroll_item_base_net_pay(previous)
+        replaced.append(previous)
+    
+    return {
+        'employee_count': len(employee_ids),
+        'rows': rows,
+        'replaced': replaced
+    }
+
+def merge_payroll_chunks(chunks):
+    """Merge calculated chunks (e.g. from several shards) into one, in employee order."""
+    chunks = list(chunks)
+    return {
+        'employee_count': sum(chunk['employee_count'] for chunk in chunks),
+        'rows': sorted((row for chunk in chunks for row in chunk['rows']), key=lambda row: row['employee_id']),
+        'replaced': sorted((item for chunk in chunks for item in chunk['replaced']), key=lambda item: item['employee_id'])
+    }
+
+def write_payroll_chunk(chunk):
+    """Insert a chunk's new payroll items and rewrite its changed ones in place."""
+    from bulk_utils import bulk_insert, bulk_update
+    
+    bulk_insert(PayrollItem, [row for row in chunk['rows'] if 'id' not in row])
+    bulk_update(PayrollItem, [row for row in chunk['rows'] if 'id' in row])
+
+def adjust_incremental_totals(payroll, totals, replaced_totals):
+    """
+    Apply re-processing differences to a payroll's current totals.
+    
+    Removes the items of employees who are no longer payable, then returns the
+    current totals minus the rewritten and removed items plus the new rows.
+    """
+    from app import db
+    from bulk_utils import bulk_delete
+    
+    payable_employees = db.select(Employee.id).where(payable_employee_criteria(payroll_period(payroll)))
+    leaver_criteria = (
+        PayrollItem.payroll_id == payroll.id,
+        PayrollItem.employee_id.not_in(payable_employees)
+    )
+    leavers = PayrollItem.query.with_entities(
+        PayrollItem.employee_id, PayrollItem.basic_salary, PayrollItem.gross_pay,
+        PayrollItem.tax_amount, PayrollItem.pension_amount, PayrollItem.nhf_amount,
+        PayrollItem.other_deductions, PayrollItem.net_pay
+    ).filter(*leaver_criteria).order_by(PayrollItem.employee_id).all()
+    
+    removed_totals = dict(replaced_totals)
+    add_payroll_item_totals(removed_totals, [item._asdict() for item in leavers])
+    bulk_delete(PayrollItem, *leaver_criteria)
+    
+    previous = {
+        'basic': payroll.total_basic_salary or 0,
+        'allowances': payroll.total_allowances or 0,
+        'deductions': payroll.total_deductions or 0,
+        'tax': payroll.total_tax or 0,
+        'net': payroll.total_net_pay or 0,
+    }
+    return {name: previous[name] - removed_totals[name] + totals[name] for name in PAYROLL_TOTALS}
+
+def payroll_item_base_net_pay(item):
+    """Get an item's net pay before adjustments from a dictionary of its amounts."""
+    return item['gross_pay'] - (item['tax_amount'] + item['pension_amount'] + item['nhf_amount'] + item['other_deductions'])
+
+def add_payroll_row_totals(totals, rows):
+    """
+    Add new payroll item rows to running payroll totals.
+    
+    Rows are added one at a time in order, so streaming chunks gives exactly
+    the same totals as summing all rows at once.
+    """
+    for row in rows:
+        totals['basic'] += row['basic_salary']
+        totals['allowances'] += sum(row['allowances'].values())
+        totals['deductions'] += row['pension_amount'] + row['nhf_amount']
+        totals['tax'] += row['tax_amount']
+        totals['net'] += row['net_pay']
+
+def add_payroll_item_totals(totals, items, use_net_pay=False):
+    """
+    Add existing payroll items (dictionaries of their amounts) to running totals.
+    
+    Items being rewritten in place keep their adjustments, so their stored net
+    pay is used (use_net_pay=True); otherwise the net pay before adjustments is.
+    """
+    for item in items:
+        totals['basic'] += item['basic_salary']
+        totals['allowances'] += item['gross_pay'] - item['basic_salary']
+        totals['deductions'] += item['pension_amount'] + item['nhf_amount']
+        totals['tax'] += item['tax_amount']
+        totals['net'] += item['net_pay'] if use_net_pay else payroll_item_base_net_pay(item)
+
+# Totals reported by a simulation
+SIMULATION_TOTALS = PAYROLL_TOTALS + ('gross', 'employer_pension')
+
+def simulate_payroll(payroll_id=None, sample_size=20, outlier_threshold=3.0, max_outliers=20, chunk_size=2000):
+    """
+    Calculate a payroll run for all payable employees without saving anything.
+    
+    Uses the same vectorized calculation and proration as process_payroll, so
+    the totals match what processing would produce, but never writes payroll
+    items or changes the payroll's status.
+    
+    Args:
+        payroll_id: Optional payroll to simulate (its period is used and its
+            current totals are included); without one, the current month
+        sample_size: Number of calculated payroll items to include
+        outlier_threshold: Standard deviations from the department mean net pay
+            at which an employee is reported as an outlier
+        max_outliers: Maximum number of outliers to report
+        chunk_size: Number of employees calculated at a time
+        
+    Returns:
+        Dictionary with the employee count, overall and per-department totals,
+        outliers, a sample of payroll items and, for a payroll, its current totals
+        
+    Raises:
+        ValueError: If cumulative PAYE is used for a period that is not a month long
+    """
+    from app import db
+    from compensation import resolve_pay_segments
+    
+    payroll = Payroll.query.get(payroll_id) if payroll_id else None
+    period = payroll_period(payroll)
+    salary_config = SalaryConfiguration.query.filter_by(is_active=True).first()
+    percentages = salary_percentages(salary_config)
+    tax_table = get_tax_table(refresh=True)
+    cumulative = salary_config is not None and salary_config.paye_method == 'cumulative'
+    months = cumulative_paye_months(period) if cumulative else None
+    
+    totals = dict.fromkeys(SIMULATION_TOTALS, 0.0)
+    departments = {}
+    net_pay_by_department = {}
+    sample = []
+    employee_count = 0
+    
+    statement = db.select(
+        Employee.id, Employee.basic_salary, Employee.is_contract, Employee.department,
+        Employee.date_hired, Employee.date_terminated
+    ).where(
+        payable_employee_criteria(period)
+    ).order_by(Employee.id).execution_options(yield_per=chunk_size)
+    
+    for employees in db.session.execute(statement).partitions():
+        employee_ids = np.array([employee.id for employee in employees])
+        department_names = np.array([employee.department or 'Unassigned' for employee in employees], dtype=object)
+        segments, factors = resolve_pay_segments(employees, period)
+        offsets = np.cumsum([0] + [len(pieces) for pieces in segments[:-1]])
+        batch = compute_payroll_batch(
+            [salary for pieces in segments for salary, _ in pieces],
+            [employee.is_contract for employee, pieces in zip(employees, segments) for _ in pieces],
+            percentages,
+            tax_table
         )
+        segment_factors = [factor for pieces in segments for _, factor in pieces]
+        combined = combine_batch_segments(prorate_batch(batch, segment_factors), offsets)
+        if cumulative:
+            prior = prior_year_to_date(employee_ids.tolist(), period)
+            combined = apply_cumulative_paye(combined, year_to_date_batch(prior), months, tax_table)
+        amounts = payroll_total_amounts(combined)
+        employee_count += len(employees)
+        
+        for name in SIMULATION_TOTALS:
+            totals[name] = accumulate(totals[name], amounts[name])
         
-        # Calculate taxable income (annual)
-        annual_basic = monthly_basic_salary * 12
-        annual_gross = monthly_gross_pay * 12
-        annual_pension = monthly_pension * 12
-        annual_nhf = monthly_nhf * 12
+        for department in np.unique(department_names):
+            in_department = department_names == department
+            department_totals = departments.setdefault(
+                department, dict(dict.fromkeys(SIMULATION_TOTALS, 0.0), employee_count=0)
+            )
+            department_totals['employee_count'] += int(in_department.sum())
+            for name in SIMULATION_TOTALS:
+                department_totals[name] = accumulate(department_totals[name], amounts[name][in_department])
+            net_pay_by_department.setdefault(department, []).append(
+                (employee_ids[in_department], amounts['net'][in_department])
+            )
+        
+        if len(sample) < sample_size:
+            count = sample_size - len(sample)
+            end = offsets[count] if count < len(segments) else len(segment_factors)
+            sample_amounts = combine_segment_amounts(
+                build_payroll_amounts({name: values[:end] for name, values in batch.items()}, tax_table),
+                segments[:count],
+                factors[:count]
+            )
+            if cumulative:
+                sample_amounts = apply_cumulative_paye_amounts(sample_amounts, prior[:count], months, tax_table)
+            sample.extend(
+                {'payroll_id': payroll_id, 'employee_id': employee_id, **payroll_amounts}
+                for employee_id, payroll_amounts in zip(employee_ids[:count].tolist(), sample_amounts)
+            )
+    
+    result = {
+        'employee_count': employee_count,
+        'totals': totals,
+        'departments': departments,
+        'outliers': find_net_pay_outliers(net_pay_by_department, outlier_threshold, max_outliers),
+        'sample': sample
+    }
+    
+    if payroll:
+        result['payroll'] = {
+            'id': payroll.id,
+            'name': payroll.name,
+            'status': payroll.status,
+            'totals': {
+                'basic': payroll.total_basic_salary or 0,
+                'allowances': payroll.total_allowances or 0,
+                'deductions': payroll.total_deductions or 0,
+                'tax': payroll.total_tax or 0,
+                'net': payroll.total_net_pay or 0
+            }
+        }
+    
+    return result
+
+def find_net_pay_outliers(net_pay_by_department, threshold=3.0, limit=20):
+    """
+    Find employees whose net pay stands out within their department.
+    
+    An employee is an outlier when their net pay is at least `threshold`
+    standard deviations from their department's mean, or is not positive.
+    
+    Args:
+        net_pay_by_department: Department -> list of (employee ids, net pays) array pairs
+        threshold: Number of standard deviations that makes an outlier
+        limit: Maximum number of outliers to return, most extreme first
+    """
+    candidates = []
+    for department, parts in net_pay_by_department.items():
+        employee_ids = np.concatenate([ids for ids, _ in parts])
+        net_pay = np.concatenate([values for _, values in parts])
+        mean = float(net_pay.mean())
+        std = float(net_pay.std())
         
-        # Calculate consolidated relief allowance
-        consolidated_relief = calculate_consolidated_relief(annual_gross, annual_pension, annual_nhf)
+        z_scores = (net_pay - mean) / std if std > 0 else np.zeros_like(net_pay)
+        flagged = (np.abs(z_scores) >= threshold) | (net_pay <= 0)
+        for index in np.flatnonzero(flagged):
+            candidates.append({
+                'employee_id': int(employee_ids[index]),
+                'department': department,
+                'net_pay': float(net_pay[index]),
+                'department_mean': mean,
+                'z_score': float(z_scores[index])
+            })
+    
+    candidates.sort(key=lambda outlier: (outlier['net_pay'] > 0, -abs(outlier['z_score']), outlier['employee_id']))
+    outliers = candidates[:limit]
+    
+    # Add names for display
+    if outliers:
+        names = dict(Employee.query.with_entities(
+            Employee.id, Employee.first_name + ' ' + Employee.last_name
+        ).filter(Employee.id.in_([outlier['employee_id'] for outlier in outliers])).all())
+        for outlier in outliers:
+            outlier['name'] = names.get(outlier['employee_id'])
+    
+    return outliers
+
+# Per-employee differences reported by simulate_salary_configuration
+SCENARIO_DIFFERENCES = ('gross', 'deductions', 'employer_pension', 'tax', 'net')
+
+# Percentiles of each difference's distribution
+SCENARIO_PERCENTILES = (5, 25, 50, 75, 95)
+
+# Differences below half a kobo count as unchanged
+SCENARIO_MINIMUM_DIFFERENCE = 0.005
+
+def simulate_salary_configuration(percentages, paye_method=None, payroll_id=None, max_changes=20, chunk_size=2000):
+    """
+    Compare a candidate salary split with the active configuration for all payable employees.
+    
+    Each chunk of employees has its pay segments resolved once and is then
+    calculated twice, with the active configuration and with the candidate
+    percentages, using the same vectorized calculation as process_payroll.
+    Nothing is saved, so a configuration can be tried before it is activated.
+    
+    Args:
+        percentages: Candidate component percentages, keyed as salary_percentages() returns them
+        paye_method: Candidate PAYE method ('annualised' or 'cumulative'); the
+            active configuration's by default
+        payroll_id: Optional payroll whose period is used; without one, the current month
+        max_changes: Number of employees with the largest net pay changes to list
+        chunk_size: Number of employees calculated at a time
         
-        annual_taxable_income = max(0, annual_gross - consolidated_relief)
+    Returns:
+        Dictionary with the employee count, current and candidate totals, the
+        difference in each total, the distribution of each employee's
+        difference (SCENARIO_DIFFERENCES) and the largest net pay changes
         
-        # Calculate PAYE tax
-        annual_tax, tax_details = calculate_paye_tax(annual_taxable_income)
-        monthly_tax = annual_tax / 12
+    Raises:
+        ValueError: If cumulative PAYE is used for a period that is not a month long
+    """
+    from app import db
+    from compensation import resolve_pay_segments
+    
+    payroll = Payroll.query.get(payroll_id) if payroll_id else None
+    period = payroll_period(payroll)
+    salary_config = SalaryConfiguration.query.filter_by(is_active=True).first()
+    current_percentages = salary_percentages(salary_config)
+    current_method = salary_config.paye_method if salary_config else 'annualised'
+    paye_method = paye_method or current_method
+    tax_table = get_tax_table(refresh=True)
+    
+    scenarios = (
+        ('current', current_percentages, current_method == 'cumulative'),
+        ('candidate', percentages, paye_method == 'cumulative'),
+    )
+    months = cumulative_paye_months(period) if 'cumulative' in (current_method, paye_method) else None
+    totals = {name: dict.fromkeys(SIMULATION_TOTALS, 0.0) for name, _, _ in scenarios}
+    employee_ids = []
+    net_pay = []
+    differences = {name: [] for name in SCENARIO_DIFFERENCES}
+    employee_count = 0
+    
+    statement = db.select(
+        Employee.id, Employee.basic_salary, Employee.is_contract, Employee.date_hired, Employee.date_terminated
+    ).where(
+        payable_employee_criteria(period)
+    ).order_by(Employee.id).execution_options(yield_per=chunk_size)
+    
+    for employees in db.session.execute(statement).partitions():
+        chunk_ids = [employee.id for employee in employees]
+        segments, _ = resolve_pay_segments(employees, period)
+        offsets = np.cumsum([0] + [len(pieces) for pieces in segments[:-1]])
+        salaries = [salary for pieces in segments for salary, _ in pieces]
+        contracts = [employee.is_contract for employee, pieces in zip(employees, segments) for _ in pieces]
+        segment_factors = [factor for pieces in segments for _, factor in pieces]
+        year_to_date = None
         
-        # Calculate net pay
-        total_monthly_deductions = monthly_pension + monthly_nhf + monthly_tax
-        monthly_net_pay = monthly_gross_pay - total_monthly_deductions
+        amounts = {}
+        for name, scenario_percentages, cumulative in scenarios:
+            batch = compute_payroll_batch(salaries, contracts, scenario_percentages, tax_table)
+            combined = combine_batch_segments(prorate_batch(batch, segment_factors), offsets)
+            if cumulative:
+                if year_to_date is None:
+                    year_to_date = year_to_date_batch(prior_year_to_date(chunk_ids, period))
+                combined = apply_cumulative_paye(combined, year_to_date, months, tax_table)
+            amounts[name] = payroll_total_amounts(combined)
+            for total in SIMULATION_TOTALS:
+                totals[name][total] = accumulate(totals[name][total], amounts[name][total])
         
-        # Create payroll item for this employee
-        payroll_item = PayrollItem(
-            payroll_id=payroll.id,
-            employee_id=employee.id,
-            basic_salary=monthly_basic_salary,
-            gross_pay=monthly_gross_pay,
-            taxable_income=annual_taxable_income / 12,  # Monthly taxable income
-            tax_amount=monthly_tax,
-            pension_amount=monthly_pension,
-            nhf_amount=monthly_nhf,
-            other_deductions=0.0,
-            net_pay=monthly_net_pay,
-            is_adjusted=False,
-            allowances={
-                'Housing Allowance': housing_allowance,
-                'Transport Allowance': transport_allowance,
-                'Utility Allowance': utility_allowance,
-                'Meal Allowance': meal_allowance,
-                'Clothing Allowance': clothing_allowance
-            },
-            deductions={
+        employee_count += len(employees)
+        employee_ids.append(np.array(chunk_ids))
+        net_pay.append(np.column_stack((amounts['current']['net'], amounts['candidate']['net'])))
+        for name in SCENARIO_DIFFERENCES:
+            differences[name].append(amounts['candidate'][name] - amounts['current'][name])
+    
+    result = {
+        'employee_count': employee_count,
+        'period': {'start': period[0].isoformat(), 'end': period[1].isoformat()},
+        'current': {
+            'configuration': salary_config.name if salary_config else None,
+            'percentages': current_percentages,
+            'paye_method': current_method,
+            'totals': totals['current']
+        },
+        'candidate': {
+            'percentages': percentages,
+            'paye_method': paye_method,
+            'totals': totals['candidate']
+        },
+        'difference': {name: totals['candidate'][name] - totals['current'][name] for name in SIMULATION_TOTALS},
+        'distribution': {},
+        'largest_changes': []
+    }
+    if not employee_count:
+        return result
+    
+    differences = {name: np.concatenate(parts) for name, parts in differences.items()}
+    for name, values in differences.items():
+        result['distribution'][name] = difference_distribution(values)
+    
+    # Largest net pay changes either way, with names for display
+    employee_ids = np.concatenate(employee_ids)
+    net_pay = np.concatenate(net_pay)
+    largest = np.argsort(-np.abs(differences['net']), kind='stable')[:max_changes]
+    largest = [index for index in largest.tolist() if abs(differences['net'][index]) >= SCENARIO_MINIMUM_DIFFERENCE]
+    if largest:
+        names = dict(Employee.query.with_entities(
+            Employee.id, Employee.first_name + ' ' + Employee.last_name
+        ).filter(Employee.id.in_([int(employee_ids[index]) for index in largest])).all())
+        result['largest_changes'] = [
+            {
+                'employee_id': int(employee_ids[index]),
+                'name': names.get(int(employee_ids[index])),
+                'current_net_pay': float(net_pay[index, 0]),
+                'candidate_net_pay': float(net_pay[index, 1]),
+                **{name: float(differences[name][index]) for name in SCENARIO_DIFFERENCES}
+            }
+            for index in largest
+        ]
+    
+    return result
+
+def difference_distribution(values):
+    """Summarise per-employee differences: how many went up or down, their spread and percentiles."""
+    percentiles = np.percentile(values, SCENARIO_PERCENTILES)
+    return {
+        'increased': int(np.count_nonzero(values >= SCENARIO_MINIMUM_DIFFERENCE)),
+        'decreased': int(np.count_nonzero(values <= -SCENARIO_MINIMUM_DIFFERENCE)),
+        'unchanged': int(np.count_nonzero(np.abs(values) < SCENARIO_MINIMUM_DIFFERENCE)),
+        'min': float(values.min()),
+        'max': float(values.max()),
+        'mean': float(values.mean()),
+        'std': float(values.std()),
+        'percentiles': {f'p{percentile}': float(value) for percentile, value in zip(SCENARIO_PERCENTILES, percentiles)}
+    }
+
+def plan_payroll_shards(shards, shard_by='id', period=None):
+    """
+    Split the employees payable for a period (default the current month) into at most `shards` shards.
+    
+    Id shards are contiguous id ranges of roughly equal size; department
+    shards group whole departments, largest first, onto the lightest shard.
+    """
+    from app import db
+    
+    payable = payable_employee_criteria(period or payroll_period())
+    
+    if shard_by == 'department':
+        counts = db.session.query(Employee.department, db.func.count(Employee.id)).filter(
+            payable
+        ).group_by(Employee.department).all()
+        
+        buckets = [[0, []] for _ in range(min(shards, len(counts)))]
+        for department, count in sorted(counts, key=lambda item: (-item[1], item[0])):
+            bucket = min(buckets, key=lambda item: item[0])
+            bucket[0] += count
+            bucket[1].append(department)
+        return [('department', departments) for _, departments in buckets]
+    
+    if shard_by != 'id':
+        raise ValueError(f"Unknown shard key '{shard_by}'")
+    
+    employee_ids = [row.id for row in Employee.query.with_entities(Employee.id).filter(
+        payable
+    ).order_by(Employee.id)]
+    
+    size = -(-len(employee_ids) // shards) if employee_ids else 0
+    return [
+        ('id', employee_ids[start], employee_ids[min(start + size, len(employee_ids)) - 1])
+        for start in range(0, len(employee_ids), size or 1)
+    ]
+
+def run_payroll_shards(payroll_id, shard_plan, incremental=False, chunk_size=2000):
+    """
+    Calculate every shard of a payroll in a pool of worker processes.
+    
+    Raises the first worker error, so a failed shard fails the whole run.
+    """
+    from concurrent.futures import ProcessPoolExecutor
+    
+    if not shard_plan:
+        return []
+    
+    count = len(shard_plan)
+    with ProcessPoolExecutor(max_workers=count, initializer=init_payroll_worker) as executor:
+        return list(executor.map(
+            run_payroll_shard, [payroll_id] * count, shard_plan, [incremental] * count, [chunk_size] * count
+        ))
+
+def init_payroll_worker():
+    """Drop database connections inherited from the parent process."""
+    from app import db, app
+    with app.app_context():
+        db.engine.dispose(close=False)
+
+def run_payroll_shard(payroll_id, shard, incremental=False, chunk_size=2000):
+    """Worker entry point: calculate one shard with its own database session."""
+    from app import db, app
+    with app.app_context():
+        try:
+            return merge_payroll_chunks(iter_payroll_chunks(payroll_id, shard, incremental, chunk_size))
+        finally:
+            db.session.remove()
+
+def calculate_pay_point_amounts(basic_salaries, is_contract, percentages, tax_table, context):
+    """
+    Get each employee's payroll item amounts, calculating every pay point once.
+    
+    Employees with the same basic salary and contract flag under the same
+    configuration and tax table get identical amounts, so each distinct pay
+    point is calculated (and its breakdown built) once and kept in the shared
+    LRU pay point cache for later chunks and runs.
+    
+    Args:
+        basic_salaries: Employee basic salaries
+        is_contract: Contract flags, aligned with basic_salaries
+        percentages: Component percentages as returned by salary_percentages()
+        tax_table: Compiled TaxTable
+        context: fingerprint_context() of the configuration and tax table
+        
+    Returns:
+        List of amount dictionaries, one per employee. Employees on the same
+        pay point share a dictionary, so copy it before changing anything.
+    """
+    keys = [('payroll', float(salary), bool(contract), context) for salary, contract in zip(basic_salaries, is_contract)]
+    
+    amounts = {}
+    missing = []
+    for key in dict.fromkeys(keys):
+        cached = pay_point_cache.get(key)
+        if cached is None:
+            missing.append(key)
+        else:
+            amounts[key] = cached
+    
+    if missing:
+        batch = compute_payroll_batch(
+            [key[1] for key in missing],
+            [key[2] for key in missing],
+            percentages,
+            tax_table
+        )
+        for key, payroll_amounts in zip(missing, build_payroll_amounts(batch, tax_table)):
+            pay_point_cache.put(key, payroll_amounts)
+            amounts[key] = payroll_amounts
+    
+    return [amounts[key] for key in keys]
+
+def build_payroll_item_rows(payroll_id, employee_ids, batch, tax_table):
+    """
+    Build PayrollItem rows (plain dictionaries) from a computed payroll batch.
+    
+    Args:
+        payroll_id: ID of the payroll the items belong to
+        employee_ids: Employee IDs, aligned with the batch arrays
+        batch: Result of compute_payroll_batch
+        tax_table: TaxTable the batch was computed with
+        
+    Returns:
+        List of dictionaries ready for bulk insertion
+    """
+    return [
+        {'payroll_id': payroll_id, 'employee_id': employee_id, **payroll_amounts}
+        for employee_id, payroll_amounts in zip(employee_ids, build_payroll_amounts(batch, tax_table))
+    ]
+
+# PayrollItem amounts scaled by the proration factor
+PRORATED_AMOUNTS = ('basic_salary', 'gross_pay', 'taxable_income', 'tax_amount', 'pension_amount', 'nhf_amount', 'net_pay')
+
+def prorate_payroll_amounts(amounts, factor):
+    """
+    Scale a dictionary of PayrollItem amounts by a proration factor.
+    
+    The monthly amounts and the allowance and deduction breakdowns are
+    scaled; the tax details keep the annual figures the tax was worked out
+    from. Returns a new dictionary, so cached amounts are never changed.
+    """
+    prorated = dict(amounts, proration_factor=factor)
+    if factor == 1.0:
+        return prorated
+    
+    for name in PRORATED_AMOUNTS:
+        prorated[name] = amounts[name] * factor
+    prorated['allowances'] = {name: value * factor for name, value in amounts['allowances'].items()}
+    prorated['deductions'] = {name: value * factor for name, value in amounts['deductions'].items()}
+    return prorated
+
+def combine_segment_amounts(segment_amounts, segments, employment_factors):
+    """
+    Build each employee's PayrollItem amounts from the amounts of their salary segments.
+    
+    Each segment is prorated by its factor; the segments of a period split
+    between salaries are then added up in order, keeping the tax details of
+    the latest salary.
+    
+    Args:
+        segment_amounts: Unprorated amounts of every segment, employee by employee
+        segments: Each employee's list of (basic salary, factor) segments
+        employment_factors: Each employee's proration factor
+        
+    Returns:
+        List of dictionaries of PayrollItem column values, one per employee
+    """
+    segment_amounts = iter(segment_amounts)
+    combined = []
+    for pieces, employment_factor in zip(segments, employment_factors):
+        parts = [prorate_payroll_amounts(next(segment_amounts), factor) for _, factor in pieces]
+        amounts = parts[-1]
+        if len(parts) > 1:
+            amounts = dict(amounts)
+            for name in PRORATED_AMOUNTS:
+                amounts[name] = sum(part[name] for part in parts)
+            for breakdown in ('allowances', 'deductions'):
+                amounts[breakdown] = {
+                    name: sum(part[breakdown][name] for part in parts)
+                    for name in parts[-1][breakdown]
+                }
+        amounts['proration_factor'] = employment_factor
+        combined.append(amounts)
+    return combined
+
+def build_payroll_amounts(batch, tax_table):
+    """
+    Build the PayrollItem amounts (everything but the payroll and employee) for each entry of a batch.
+    
+    Args:
+        batch: Result of compute_payroll_batch
+        tax_table: TaxTable the batch was computed with
+        
+    Returns:
+        List of dictionaries of PayrollItem column values
+    """
+    columns = {name: values.tolist() for name, values in batch.items()
+               if name not in ('taxable_by_bracket', 'tax_by_bracket', 'bracket_applied')}
+    
+    amounts = []
+    for index, tax_details in enumerate(build_tax_details(batch, tax_table)):
+        monthly_tax = columns['monthly_tax'][index]
+        monthly_pension = columns['monthly_pension'][index]
+        monthly_nhf = columns['monthly_nhf'][index]
+        annual_taxable_income = columns['annual_taxable_income'][index]
+        
+        amounts.append({
+            'basic_salary': columns['monthly_basic'][index],
+            'gross_pay': columns['monthly_gross'][index],
+            'taxable_income': annual_taxable_income / 12,  # Monthly taxable income
+            'tax_amount': monthly_tax,
+            'pension_amount': monthly_pension,
+            'nhf_amount': monthly_nhf,
+            'other_deductions': 0.0,
+            'net_pay': columns['monthly_net_pay'][index],
+            'is_adjusted': False,
+            'allowances': {name: columns[component][index] for name, component in ALLOWANCE_COMPONENTS},
+            'deductions': {
                 'Pension': monthly_pension,
                 'NHF': monthly_nhf,
                 'PAYE Tax': monthly_tax
             },
-            tax_details={
-                'Annual Basic Salary': annual_basic,
-                'Annual Gross Income': annual_gross,
-                'Consolidated Relief': consolidated_relief,
-                'Annual Taxable Income': annual_taxable_income,
-                'Annual Tax': annual_tax,
-                'Monthly Tax': monthly_tax,
-                'Tax Brackets': tax_details
-            }
-        )
-        
-        # Add to database
-        from app import db
-        db.session.add(payroll_item)
-        
-        # Update payroll totals
-        total_basic += monthly_basic_salary
-        total_allowances += (
-            housing_allowance + 
-            transport_allowance + 
-            utility_allowance + 
-            meal_allowance + 
-            clothing_allowance
+            'tax_details': tax_details
+        })
+    
+    return amounts
+
+def build_tax_details(batch, tax_table):
+    """
+    Build the compact tax details stored on PayrollItem for each entry of a batch.
+    
+    The annual figures the tax was worked out from, and the brackets reached
+    as [bracket index, taxable amount, tax]; format_tax_details expands them
+    for display.
+    """
+    columns = {name: batch[name].tolist() for name in (
+        'annual_basic', 'annual_gross', 'consolidated_relief', 'annual_taxable_income', 'annual_tax'
+    )}
+    taxable_by_bracket = batch['taxable_by_bracket'].tolist()
+    tax_by_bracket = batch['tax_by_bracket'].tolist()
+    
+    # Brackets are reached from the lowest up, so an income reaches the first `count` of them
+    bracket_counts = batch['bracket_applied'].sum(axis=1).tolist()
+    
+    return [
+        {
+            'annual_basic': columns['annual_basic'][index],
+            'annual_gross': columns['annual_gross'][index],
+            'consolidated_relief': columns['consolidated_relief'][index],
+            'annual_taxable_income': columns['annual_taxable_income'][index],
+            'annual_tax': columns['annual_tax'][index],
+            'tax_table': tax_table.version,
+            'brackets': list(map(list, zip(range(count), taxable_by_bracket[index], tax_by_bracket[index])))
+        }
+        for index, count in enumerate(bracket_counts)
+    ]
+
+# Year-to-date amounts cumulative PAYE depends on, with the batch component each adds to
+CUMULATIVE_PAYE_COMPONENTS = (
+    ('basic_salary', 'monthly_basic'),
+    ('gross_pay', 'monthly_gross'),
+    ('pension_amount', 'monthly_pension'),
+    ('nhf_amount', 'monthly_nhf'),
+    ('tax_amount', 'monthly_tax'),
+)
+
+def prior_year_to_date(employee_ids, period):
+    """
+    Get what each of an id-ordered list of employees was paid earlier in a period's tax year.
+    
+    The stored totals (see ytd.load_year_to_date) plus earlier payrolls of
+    the year that are approved but not completed yet (see
+    ytd.unposted_payrolls), so a month still open is not taxed again as if
+    nothing had been withheld in it.
+    
+    Returns:
+        List of tuples of the CUMULATIVE_PAYE_COMPONENTS amounts, aligned with
+        employee_ids (zeros for employees without year-to-date totals)
+    """
+    from app import db
+    from ytd import load_year_to_date, payroll_ytd_amounts, unposted_payrolls, YTD_AMOUNTS
+    
+    first_id, last_id = employee_ids[0], employee_ids[-1]
+    year_to_date = load_year_to_date(first_id, last_id, period)
+    
+    open_payrolls = db.session.execute(unposted_payrolls(period)).scalars().all()
+    if open_payrolls:
+        for employee_id, amounts in payroll_ytd_amounts(open_payrolls, first_id, last_id).items():
+            employee_totals = year_to_date.setdefault(employee_id, dict.fromkeys(YTD_AMOUNTS, 0.0))
+            for name in YTD_AMOUNTS:
+                employee_totals[name] += amounts[name]
+    
+    zeros = (0.0,) * len(CUMULATIVE_PAYE_COMPONENTS)
+    return [
+        tuple(year_to_date[employee_id][name] for name, _ in CUMULATIVE_PAYE_COMPONENTS)
+        if employee_id in year_to_date else zeros
+        for employee_id in employee_ids
+    ]
+
+# Length in days of the pay periods cumulative PAYE takes as one month
+MONTHLY_PERIOD_DAYS = (28, 31)
+
+def cumulative_paye_months(period):
+    """
+    Get how many months of the tax year have been paid by the end of a pay period, for cumulative PAYE.
+    
+    The tax year is the calendar year and each payroll pays one month, so
+    a period ending in March is the third. Other pay periods would be
+    counted wrongly (two fortnights ending in March would both be the
+    third month), so they are refused.
+    
+    Raises:
+        ValueError: If the period is not a month long
+    """
+    period_start, period_end = period
+    days = (period_end - period_start).days + 1
+    if not MONTHLY_PERIOD_DAYS[0] <= days <= MONTHLY_PERIOD_DAYS[1]:
+        raise ValueError(
+            f"Cumulative PAYE needs monthly pay periods, but {period_start:%d %B %Y} to {period_end:%d %B %Y} "
+            f"is {days} days"
         )
-        total_deductions += (monthly_pension + monthly_nhf)
-        total_tax += monthly_tax
-        total_net += monthly_net_pay
-    
-    # Update payroll record
-    payroll.total_basic_salary = total_basic
-    payroll.total_allowances = total_allowances
-    payroll.total_deductions = total_deductions
-    payroll.total_tax = total_tax
-    payroll.total_net_pay = total_net
-    
-    # Update status based on current status
-    if payroll.status == 'Draft':
-        payroll.status = 'Active'
-    elif payroll.status == 'Active':
-        payroll.status = 'Processing'
-        
-    payroll.date_updated = datetime.utcnow()
-    
-    # Commit changes to database
-    db.session.commit()
+    return period_end.month
+
+def year_to_date_batch(prior):
+    """Turn prior_year_to_date() tuples into arrays keyed by batch component, for apply_cumulative_paye."""
+    values = np.array(prior, dtype=float).reshape(len(prior), len(CUMULATIVE_PAYE_COMPONENTS))
+    return {component: values[:, position] for position, (_, component) in enumerate(CUMULATIVE_PAYE_COMPONENTS)}
+
+def apply_cumulative_paye_amounts(amounts, prior, months, tax_table):
+    """
+    Recalculate the PAYE of PayrollItem amounts on a cumulative basis.
     
-    return True, f"Successfully processed payroll for {len(employees)} employees"
+    The row counterpart of apply_cumulative_paye: the amounts' monthly
+    figures go through the same array calculation, so rows and simulated
+    batches agree exactly. Employees with the same pay and year to date
+    (e.g. everyone on a grade paid the same all year) are calculated once
+    and share their tax details, as employees on a pay point share amounts.
+    
+    Args:
+        amounts: PayrollItem amounts (e.g. from combine_segment_amounts)
+        prior: prior_year_to_date() tuples, aligned with amounts
+        months: Months of the tax year up to and including the period
+        tax_table: Compiled TaxTable
+        
+    Returns:
+        List of new dictionaries with the tax, net pay, taxable income,
+        PAYE deduction and tax details replaced
+    """
+    names = [name for name, _ in CUMULATIVE_PAYE_COMPONENTS[:-1]]
+    keys = [
+        (*[payroll_amounts[name] for name in names], year_to_date)
+        for payroll_amounts, year_to_date in zip(amounts, prior)
+    ]
+    positions = {}
+    for key in keys:
+        positions.setdefault(key, len(positions))
+    unique = list(positions)
+    
+    batch = {
+        component: np.fromiter((key[position] for key in unique), dtype=float, count=len(unique))
+        for position, (_, component) in enumerate(CUMULATIVE_PAYE_COMPONENTS[:-1])
+    }
+    cumulative = apply_cumulative_paye(batch, year_to_date_batch([key[-1] for key in unique]), months, tax_table)
+    columns = {name: cumulative[name].tolist() for name in (
+        'monthly_tax', 'monthly_net_pay', 'annual_taxable_income', 'cumulative_taxable_income', 'cumulative_tax'
+    )}
+    
+    calculated = []
+    for index, (key, tax_details) in enumerate(zip(unique, build_tax_details(cumulative, tax_table))):
+        tax_details.update({
+            'method': 'cumulative',
+            'months': months,
+            'cumulative_taxable_income': columns['cumulative_taxable_income'][index],
+            'cumulative_tax': columns['cumulative_tax'][index],
+            'tax_withheld': key[-1][-1]
+        })
+        calculated.append((
+            columns['monthly_tax'][index],
+            columns['monthly_net_pay'][index],
+            columns['annual_taxable_income'][index] / 12,
+            tax_details
+        ))
+    
+    recalculated = []
+    for payroll_amounts, key in zip(amounts, keys):
+        monthly_tax, net_pay, taxable_income, tax_details = calculated[positions[key]]
+        recalculated.append(dict(
+            payroll_amounts,
+            tax_amount=monthly_tax,
+            net_pay=net_pay,
+            taxable_income=taxable_income,
+            deductions=dict(payroll_amounts['deductions'], **{'PAYE Tax': monthly_tax}),
+            tax_details=tax_details
+        ))
+    return recalculated
 
 def generate_payslip_data(payroll_item_id):
     """Generate data for a payslip based on a payroll item."""
-    from app import db
     from models import PayrollAdjustment
+    from ytd import payroll_item_ytd
     
     # Get the payroll item
     payroll_item = PayrollItem.query.get(payroll_item_id)
@@ -320,18 +1257,31 @@ def generate_payslip_data(payroll_item_id):
     employee = Employee.query.get(payroll_item.employee_id)
     payroll = Payroll.query.get(payroll_item.payroll_id)
     
-    # Get any adjustments for this payroll item
-    adjustments = PayrollAdjustment.query.filter_by(payroll_item_id=payroll_item_id).all()
+    # Adjustments are only loaded for listing; items without any skip the query
+    adjustments = []
+    if payroll_item.adjustment_count:
+        adjustments = PayrollAdjustment.query.filter_by(payroll_item_id=payroll_item_id).all()
     
+    payslip = build_payslip_data(payroll_item, employee, payroll, payroll_item_ytd(payroll_item, payroll), adjustments)
+    payslip['tax_details'] = format_tax_details(payroll_item.tax_details, payroll_item.tax_amount)
+    return payslip
+
+def build_payslip_data(payroll_item, employee, payroll, ytd, adjustments=()):
+    """
+    Assemble payslip data from an item, its employee and payroll, and its year-to-date totals.
+    
+    Needs no queries of its own, so many payslips can be built from items
+    loaded together. Adjustment totals come from the item's running totals;
+    the adjustments themselves are only needed to list them.
+    """
     # Fields are stored as JSON in the database and returned as dictionaries
     allowances = payroll_item.allowances or {}
     deductions = payroll_item.deductions or {}
-    tax_details = payroll_item.tax_details or {}
     
-    # Calculate adjustment totals by type
-    bonuses = sum(adj.amount for adj in adjustments if adj.adjustment_type == 'bonus')
-    reimbursements = sum(adj.amount for adj in adjustments if adj.adjustment_type == 'reimbursement')
-    additional_deductions = sum(-adj.amount for adj in adjustments if adj.adjustment_type == 'deduction')  # Deductions are stored as negative values
+    # Adjustment totals by type, kept up to date on the item
+    bonuses = payroll_item.bonus_total
+    reimbursements = payroll_item.reimbursement_total
+    additional_deductions = payroll_item.deduction_adjustment_total
     
     # Calculate total positive adjustments (bonuses and reimbursements)
     positive_adjustments = bonuses + reimbursements
@@ -343,9 +1293,8 @@ def generate_payslip_data(payroll_item_id):
         'payroll': payroll,
         'allowances': allowances,
         'deductions': deductions,
-        'tax_details': tax_details,
         'adjustments': adjustments,
-        'has_adjustments': len(adjustments) > 0,
+        'has_adjustments': payroll_item.adjustment_count > 0,
         'adjustment_totals': {
             'bonuses': bonuses,
             'reimbursements': reimbursements,
@@ -353,6 +1302,7 @@ def generate_payslip_data(payroll_item_id):
             'positive_adjustments': positive_adjustments,
             'net_adjustments': positive_adjustments - additional_deductions
         },
+        'ytd': ytd,
         'generated_on': datetime.utcnow().strftime('%d %B, %Y'),
         'payment_method': 'Bank Transfer',
     }
@@ -441,86 +1391,6 @@ def generate_payment_schedule(payroll_id, user_id=None):
     return True, payment_schedule
 
 
-def count_working_days(start_date, end_date):
-    """
-    Count working days (Monday-Friday) between two dates, inclusive.
-    
-    Args:
-        start_date: datetime.date object representing the start date
-        end_date: datetime.date object representing the end date
-        
-    Returns:
-        Number of working days between start_date and end_date, inclusive
-    """
-    # Ensure start_date is before or equal to end_date
-    if start_date > end_date:
-        return 0
-    
-    # Initialize counter
-    working_days = 0
-    
-    # Iterate through each day
-    current_date = start_date
-    while current_date <= end_date:
-        # Weekday returns 0 (Monday) through 6 (Sunday)
-        if current_date.weekday() < 5:  # 0-4 are Monday to Friday
-            working_days += 1
-        
-        # Move to next day
-        current_date += dt.timedelta(days=1)
-    
-    return working_days
-
-def calculate_proration_factor(start_date, end_date, month=None, year=None):
-    """
-    Calculate proration factor based on working days.
-    
-    Args:
-        start_date: datetime.date object of the employee's start date
-        end_date: datetime.date object of the employee's end date or None
-        month: Month for which to calculate the proration (1-12)
-        year: Year for which to calculate the proration
-        
-    Returns:
-        Float between 0 and 1 representing the proration factor
-    """
-    # Use current month and year if not specified
-    today = dt.date.today()
-    if month is None:
-        month = today.month
-    if year is None:
-        year = today.year
-    
-    # Get the first and last day of the specified month
-    first_day = dt.date(year, month, 1)
-    if month == 12:
-        last_day = dt.date(year, 12, 31)
-    else:
-        last_day = dt.date(year, month + 1, 1) - dt.timedelta(days=1)
-    
-    # Count total working days in the month
-    total_working_days = count_working_days(first_day, last_day)
-    
-    # Adjust start and end dates to be within the month
-    if start_date and start_date > first_day:
-        period_start = start_date
-    else:
-        period_start = first_day
-    
-    if end_date and end_date < last_day:
-        period_end = end_date
-    else:
-        period_end = last_day
-    
-    # Count working days in the period
-    period_working_days = count_working_days(period_start, period_end)
-    
-    # Calculate proration factor
-    if total_working_days == 0:  # Avoid division by zero
-        return 0.0
-    
-    return period_working_days / total_working_days
-
 def prorate_amount(amount, start_date=None, end_date=None, month=None, year=None):
     """
     Prorate an amount based on working days.
@@ -549,6 +1419,10 @@ def calculate_statutory_deductions(basic_salary, transport_allowance=0, housing_
     """
     Calculator function for statutory deductions.
     
+    Results are memoized per set of inputs and tax table version in the
+    shared pay point cache, so repeated calculations for the same pay point
+    are computed once.
+    
     Args:
         basic_salary: Monthly basic salary
         transport_allowance: Monthly transport allowance
@@ -559,6 +1433,19 @@ def calculate_statutory_deductions(basic_salary, transport_allowance=0, housing_
     Returns:
         Dictionary with all calculated values
     """
+    key = (
+        'statutory', float(basic_salary), float(transport_allowance), float(housing_allowance),
+        float(other_allowances), bool(is_contract), get_tax_table().version
+    )
+    results = pay_point_cache.get_or_compute(key, lambda: compute_statutory_deductions(
+        basic_salary, transport_allowance, housing_allowance, other_allowances, is_contract
+    ))
+    
+    # Callers get their own copy of the cached result
+    return copy.deepcopy(results)
+
+def compute_statutory_deductions(basic_salary, transport_allowance=0, housing_allowance=0, other_allowances=0, is_contract=False):
+    """Calculate statutory deductions (see calculate_statutory_deductions) without the cache."""
     # Calculate monthly values
     monthly_gross = basic_salary + transport_allowance + housing_allowance + other_allowances
     
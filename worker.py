@@ -0,0 +1,44 @@
+"""
+Background job worker.
+
+Runs the jobs queued by the web application (see jobs.py). Start one or
+more alongside the web server:
+
+    python worker.py            # poll for jobs until stopped
+    python worker.py --once     # run the queued jobs, then exit
+"""
+import argparse
+import logging
+import time
+
+from app import app, db
+from jobs import claim_next_job, run_job
+
+logger = logging.getLogger(__name__)
+
+
+def work(once=False, interval=2.0):
+    """Claim and run queued jobs, polling every `interval` seconds when idle."""
+    with app.app_context():
+        while True:
+            job = claim_next_job()
+            if job:
+                logger.info("Running job %s (%s)", job.id, job.job_type)
+                success, message = run_job(job)
+                logger.info("Job %s %s: %s", job.id, 'completed' if success else 'failed', message)
+                db.session.remove()
+                continue
+
+            if once:
+                break
+            db.session.remove()
+            time.sleep(interval)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run queued payroll jobs.")
+    parser.add_argument('--once', action='store_true', help="exit when the queue is empty")
+    parser.add_argument('--interval', type=float, default=2.0, help="seconds between polls when idle")
+    args = parser.parse_args()
+
+    work(once=args.once, interval=args.interval)
@@ -0,0 +1,295 @@
+"""
+Year-to-date totals.
+
+YearToDate holds each employee's running totals for a tax year, so
+payslips and tax calculations read one row instead of summing every
+payroll item the employee has had. A payroll is added to the totals when
+it is completed (post_payroll_ytd) and taken off again if it is cancelled
+(reverse_payroll_ytd); Payroll.ytd_posted records which payrolls are in
+the totals, so neither is ever applied twice. Back pay counts towards the
+totals of the payroll it was paid in.
+
+rebuild_year_to_date recalculates the totals from the completed payrolls,
+for a first backfill or after data has been corrected by hand.
+"""
+from datetime import date
+
+from sqlalchemy import delete, func, select, update
+
+from app import db
+from bulk_utils import bulk_insert, bulk_update
+from models import BackPay, Payroll, PayrollItem, YearToDate
+
+# Amounts accumulated, named as on PayrollItem and BackPay
+YTD_AMOUNTS = ('basic_salary', 'gross_pay', 'tax_amount', 'pension_amount', 'nhf_amount', 'net_pay')
+
+# Payroll statuses counted in the totals
+POSTED_STATUSES = ('Completed', 'Closed')
+
+
+def payroll_tax_year(payroll):
+    """Get the tax year a payroll counts towards: the year its period ends in."""
+    return payroll.period_end.year
+
+
+def tax_year_payrolls(tax_year):
+    """Select the ids of the payrolls posted to the totals of a tax year."""
+    return select(Payroll.id).where(
+        Payroll.ytd_posted.is_(True),
+        Payroll.period_end.between(date(tax_year, 1, 1), date(tax_year, 12, 31))
+    )
+
+
+def unposted_payrolls(period):
+    """
+    Select the ids of a period's tax year payrolls before it that are approved but not yet in the totals.
+
+    These are earlier months moved to Processing but not yet Completed;
+    their items will be paid, so cumulative PAYE counts the tax they
+    withhold. Draft and Active payrolls may still be replaced or abandoned,
+    so they are left out until they are approved.
+    """
+    period_start, period_end = period
+    return select(Payroll.id).where(
+        Payroll.ytd_posted.is_(False),
+        Payroll.status == 'Processing',
+        Payroll.period_end >= date(period_end.year, 1, 1),
+        Payroll.period_end < period_start
+    )
+
+
+def payroll_ytd_amounts(payroll_ids, first_id=None, last_id=None):
+    """
+    Add up what one or more payrolls paid each employee.
+
+    Args:
+        payroll_ids: Payroll ids, or a select of them
+        first_id: Only add up the amounts of employees from this id...
+        last_id: ...to this one
+
+    Returns:
+        Dictionary of employee id -> dictionary of YTD_AMOUNTS
+    """
+    # Net pay already includes back pay, as it is posted as adjustments on the item
+    sources = (
+        (PayrollItem, PayrollItem.payroll_id, YTD_AMOUNTS),
+        (BackPay, BackPay.posted_payroll_id, YTD_AMOUNTS[:-1]),
+    )
+
+    totals = {}
+    for model, payroll_column, names in sources:
+        statement = select(
+            model.employee_id, *[func.sum(getattr(model, name)).label(name) for name in names]
+        ).where(payroll_column.in_(payroll_ids)).group_by(model.employee_id)
+        if first_id is not None:
+            statement = statement.where(model.employee_id.between(first_id, last_id))
+
+        for row in db.session.execute(statement):
+            amounts = totals.setdefault(row.employee_id, dict.fromkeys(YTD_AMOUNTS, 0.0))
+            for name in names:
+                amounts[name] += getattr(row, name) or 0.0
+    return totals
+
+
+def add_to_year_to_date(tax_year, totals, sign=1):
+    """
+    Add amounts to (or with sign -1, take them off) employees' totals for a tax year.
+
+    Employees without totals for the year yet get a new row. The year's
+    rows are read in one query and written in bulk within the current
+    transaction.
+
+    Returns:
+        Number of employees whose totals changed
+    """
+    if not totals:
+        return 0
+
+    existing = {
+        row.employee_id: row for row in db.session.execute(
+            select(YearToDate.id, YearToDate.employee_id, *[getattr(YearToDate, name) for name in YTD_AMOUNTS]).where(
+                YearToDate.tax_year == tax_year
+            )
+        )
+    }
+
+    updates = []
+    inserts = []
+    for employee_id, amounts in totals.items():
+        current = existing.get(employee_id)
+        if current is not None:
+            updates.append({
+                'id': current.id,
+                **{name: getattr(current, name) + sign * amounts[name] for name in YTD_AMOUNTS}
+            })
+        else:
+            inserts.append({
+                'employee_id': employee_id,
+                'tax_year': tax_year,
+                **{name: sign * amounts[name] for name in YTD_AMOUNTS}
+            })
+
+    bulk_update(YearToDate, updates)
+    bulk_insert(YearToDate, inserts)
+    return len(totals)
+
+
+def post_payroll_ytd(payroll):
+    """
+    Add a completed payroll to its employees' year-to-date totals.
+
+    Does nothing if the payroll is already in the totals. The caller
+    commits, together with the status change.
+
+    Returns:
+        Number of employees whose totals changed
+    """
+    if payroll.ytd_posted:
+        return 0
+
+    count = add_to_year_to_date(payroll_tax_year(payroll), payroll_ytd_amounts([payroll.id]))
+    payroll.ytd_posted = True
+    return count
+
+
+def reverse_payroll_ytd(payroll):
+    """
+    Take a cancelled payroll off its employees' year-to-date totals.
+
+    Does nothing if the payroll is not in the totals. The caller commits,
+    together with the status change.
+
+    Returns:
+        Number of employees whose totals changed
+    """
+    if not payroll.ytd_posted:
+        return 0
+
+    count = add_to_year_to_date(payroll_tax_year(payroll), payroll_ytd_amounts([payroll.id]), sign=-1)
+    payroll.ytd_posted = False
+    return count
+
+
+def get_year_to_date(employee_id, tax_year):
+    """Get an employee's totals for a tax year as a dictionary of YTD_AMOUNTS (zeros if there are none)."""
+    row = db.session.execute(
+        select(*[getattr(YearToDate, name) for name in YTD_AMOUNTS]).where(
+            YearToDate.employee_id == employee_id,
+            YearToDate.tax_year == tax_year
+        )
+    ).first()
+    if row is None:
+        return dict.fromkeys(YTD_AMOUNTS, 0.0)
+    return dict(row._mapping)
+
+
+def load_year_to_date(first_id, last_id, period):
+    """
+    Load the totals a range of employees had before a pay period.
+
+    The stored totals of the period's tax year are read in one query.
+    Payrolls of the year posted for this period or later ones (when an
+    earlier period is processed late) are taken off; normally there are
+    none.
+
+    Args:
+        first_id: First employee id of the range
+        last_id: Last employee id of the range
+        period: (first day, last day) of the pay period
+
+    Returns:
+        Dictionary of employee id -> dictionary of YTD_AMOUNTS; employees
+        without totals are left out
+    """
+    period_start, period_end = period
+    tax_year = period_end.year
+
+    totals = {
+        employee_id: dict(zip(YTD_AMOUNTS, amounts))
+        for employee_id, *amounts in db.session.execute(
+            select(YearToDate.employee_id, *[getattr(YearToDate, name) for name in YTD_AMOUNTS]).where(
+                YearToDate.tax_year == tax_year,
+                YearToDate.employee_id.between(first_id, last_id)
+            )
+        )
+    }
+
+    later_payrolls = db.session.execute(
+        tax_year_payrolls(tax_year).where(Payroll.period_end >= period_start)
+    ).scalars().all()
+    if not later_payrolls:
+        return totals
+
+    for employee_id, amounts in payroll_ytd_amounts(later_payrolls, first_id, last_id).items():
+        employee_totals = totals.setdefault(employee_id, dict.fromkeys(YTD_AMOUNTS, 0.0))
+        for name in YTD_AMOUNTS:
+            employee_totals[name] -= amounts[name]
+    return totals
+
+
+def payroll_item_ytd(payroll_item, payroll):
+    """
+    Get an employee's year-to-date totals as at a payroll, for their payslip.
+
+    The totals before the payroll's period (see load_year_to_date) plus
+    what the payroll itself pays, whether or not it has been posted yet.
+
+    Returns:
+        Dictionary of YTD_AMOUNTS
+    """
+    employee_id = payroll_item.employee_id
+    return payroll_ytd(payroll, employee_id, employee_id).get(employee_id, dict.fromkeys(YTD_AMOUNTS, 0.0))
+
+
+def payroll_ytd(payroll, first_id, last_id):
+    """
+    Get the year-to-date totals of a range of employees as at a payroll, as payroll_item_ytd does for one.
+
+    Returns:
+        Dictionary of employee id -> dictionary of YTD_AMOUNTS; employees
+        without totals are left out
+    """
+    totals = load_year_to_date(first_id, last_id, (payroll.period_start, payroll.period_end))
+    for employee_id, amounts in payroll_ytd_amounts([payroll.id], first_id, last_id).items():
+        employee_totals = totals.setdefault(employee_id, dict.fromkeys(YTD_AMOUNTS, 0.0))
+        for name in YTD_AMOUNTS:
+            employee_totals[name] += amounts[name]
+    return totals
+
+
+def rebuild_year_to_date(tax_year=None):
+    """
+    Recalculate year-to-date totals from the completed and closed payrolls.
+
+    Every such payroll is marked as posted; the totals of the tax year (or
+    of every year) are then replaced with sums over their items and back
+    pay. The caller commits.
+
+    Args:
+        tax_year: Only rebuild this tax year (default all)
+
+    Returns:
+        Number of employee totals written
+    """
+    year_filter = ()
+    if tax_year is not None:
+        year_filter = (Payroll.period_end.between(date(tax_year, 1, 1), date(tax_year, 12, 31)),)
+
+    db.session.execute(
+        update(Payroll).where(*year_filter).values(ytd_posted=Payroll.status.in_(POSTED_STATUSES))
+    )
+    if tax_year is None:
+        db.session.execute(delete(YearToDate))
+        tax_years = sorted({
+            period_end.year for period_end in db.session.execute(
+                select(Payroll.period_end).where(Payroll.ytd_posted.is_(True))
+            ).scalars()
+        })
+    else:
+        db.session.execute(delete(YearToDate).where(YearToDate.tax_year == tax_year))
+        tax_years = [tax_year]
+
+    count = 0
+    for year in tax_years:
+        count += add_to_year_to_date(year, payroll_ytd_amounts(tax_year_payrolls(year)))
+    return count